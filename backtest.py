@@ -0,0 +1,199 @@
+"""Backtest of the rating parameters on the recorded games.
+
+Replays the whole game history for every (K_FACTOR, RATING_FACTOR) pair of a grid and
+scores how well the ratings before each game predicted its winner, by log-loss and
+Brier score. The replay is vectorized over the parameter sets, chunks of the grid are
+replayed in parallel processes.
+
+    python backtest.py --k 0.2,4,40 --rf 40,400,25
+    python backtest.py --database-url sqlite:///club.db --burn-in 500 --output backtest.json
+"""
+
+import argparse
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from math import comb
+from os import cpu_count
+
+import numpy as np
+
+from rating_models import K_FACTOR, RATING_FACTOR, EloModel, Period
+
+EPSILON = 1e-12
+
+
+def parameter_grid(k_factors, rating_factors) -> tuple[np.ndarray, np.ndarray]:
+    """All combinations of the values as two flat arrays."""
+    k, rf = np.meshgrid(np.asarray(k_factors, dtype=float), np.asarray(rating_factors, dtype=float), indexing="ij")
+    return k.ravel(), rf.ravel()
+
+
+def load_history(session) -> tuple[Period, np.ndarray, int]:
+    """All games of all seasons in the order they were played, with the race length and the number of players."""
+    from sqlalchemy import select, union_all
+
+    from models import ArchivedGame, Game
+
+    seasons = union_all(
+        *(
+            select(model.playerA, model.playerB, model.scoreA, model.scoreB, model.disciplin, model.race_to, model.created_at)
+            for model in (ArchivedGame, Game)
+        )
+    ).subquery()
+    games = session.execute(select(seasons).order_by(seasons.c.created_at)).all()
+    index = {}
+    for game in games:
+        index.setdefault(game.playerA, len(index))
+        index.setdefault(game.playerB, len(index))
+    return Period.from_games(games, index), np.array([game.race_to for game in games], dtype=int), len(index)
+
+
+def replay(
+    games: Period, race_to, players: int, k_factors, rating_factors, initial_rating: float = 50.0, burn_in: int = 0
+) -> dict:
+    """Replays all games for every parameter set at once.
+
+    Before a game is rated, the win probability of playerA is taken from the current
+    ratings (exact race-to-N probability of the expected rack share) and scored against
+    the result. Games before `burn_in`, draws and 14.1 games are rated but not scored.
+    """
+    k = np.asarray(k_factors, dtype=float)
+    rf = np.asarray(rating_factors, dtype=float)
+    # One row per player, so the ratings of a player under all parameter sets are contiguous
+    ratings = np.full((players, len(k)), initial_rating)
+
+    factors = [EloModel.score_factors(a, b, d) for a, b, d in zip(games.scoreA, games.scoreB, games.disciplin)]
+    scored = [
+        i >= burn_in and games.disciplin[i].lower() == "normal" and games.scoreA[i] != games.scoreB[i]
+        for i in range(len(factors))
+    ]
+    coefficients = {}
+
+    log_loss = np.zeros(len(k))
+    brier = np.zeros(len(k))
+    count = 0
+    for i, (factorA, factorB) in enumerate(factors):
+        a, b = games.playerA[i], games.playerB[i]
+        expected = 1 / (1 + np.power(10.0, (ratings[b] - ratings[a]) / rf))
+
+        if scored[i]:
+            n = int(race_to[i])
+            if n not in coefficients:
+                racks = 2 * n - 1
+                wins = np.arange(n, racks + 1)
+                coefficients[n] = (np.array([comb(racks, int(w)) for w in wins], dtype=float), wins, racks - wins)
+            binomial, wins, losses = coefficients[n]
+            p = np.sum(binomial * expected[:, None] ** wins * (1 - expected[:, None]) ** losses, axis=1)
+            p = np.clip(p, EPSILON, 1 - EPSILON)
+
+            outcome = 1.0 if games.scoreA[i] > games.scoreB[i] else 0.0
+            log_loss -= np.log(p) if outcome else np.log(1 - p)
+            brier += (p - outcome) ** 2
+            count += 1
+
+        change = k * (factorA - expected * (factorA + factorB))
+        ratings[a] += change
+        ratings[b] -= change
+
+    count = max(count, 1)
+    return {"log_loss": log_loss / count, "brier": brier / count, "scored": count, "ratings": ratings}
+
+
+def _replay_chunk(args):
+    return replay(*args)
+
+
+def backtest(
+    games: Period,
+    race_to,
+    players: int,
+    k_factors,
+    rating_factors,
+    initial_rating: float = 50.0,
+    burn_in: int = 0,
+    workers: int = None,
+) -> dict:
+    """Replays the chunks of the parameter grid in a process pool and joins the scores."""
+    workers = workers or cpu_count() or 1
+    k_chunks = np.array_split(np.asarray(k_factors, dtype=float), workers)
+    rf_chunks = np.array_split(np.asarray(rating_factors, dtype=float), workers)
+    tasks = [(games, race_to, players, k, rf, initial_rating, burn_in) for k, rf in zip(k_chunks, rf_chunks) if len(k)]
+
+    if workers < 2 or len(tasks) < 2:
+        results = [_replay_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=len(tasks)) as executor:
+            results = list(executor.map(_replay_chunk, tasks))
+
+    return {
+        "k_factor": np.asarray(k_factors, dtype=float),
+        "rating_factor": np.asarray(rating_factors, dtype=float),
+        "log_loss": np.concatenate([result["log_loss"] for result in results]),
+        "brier": np.concatenate([result["brier"] for result in results]),
+        "scored": results[0]["scored"] if results else 0,
+    }
+
+
+def linspace(spec: str) -> np.ndarray:
+    """'start,stop,num' or a single value."""
+    values = [float(value) for value in spec.split(",")]
+    if len(values) == 1:
+        return np.array(values)
+    start, stop, num = values
+    return np.linspace(start, stop, int(num))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="database with the games, the configured Supabase database by default")
+    parser.add_argument("--k", default="0.2,4,40", help="K_FACTOR values as start,stop,num")
+    parser.add_argument("--rf", default="40,400,25", help="RATING_FACTOR values as start,stop,num")
+    parser.add_argument("--initial-rating", type=float, default=50.0)
+    parser.add_argument("--burn-in", type=int, default=0, help="games that are rated but not scored")
+    parser.add_argument("--workers", type=int, default=cpu_count())
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="write all scores as JSON")
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+    else:
+        from rating_system import RatingSystem
+
+        engine = RatingSystem().engine
+    session = sessionmaker(bind=engine)()
+    try:
+        games, race_to, players = load_history(session)
+    finally:
+        session.close()
+
+    # The current parameters are always part of the grid, as reference
+    k, rf = parameter_grid(linspace(args.k), linspace(args.rf))
+    k, rf = np.append(k, K_FACTOR), np.append(rf, RATING_FACTOR)
+
+    start = time.perf_counter()
+    result = backtest(games, race_to, players, k, rf, args.initial_rating, args.burn_in, args.workers)
+    duration = time.perf_counter() - start
+    logging.info("%s Parametersätze über %s Spiele in %.1fs getestet.", len(k), len(race_to), duration)
+
+    order = np.argsort(result["log_loss"])
+    print(f"{len(k)} parameter sets, {len(race_to)} games ({result['scored']} scored), {duration:.1f}s")
+    print(f"{'rank':>4} {'K_FACTOR':>9} {'RATING_FACTOR':>13} {'log-loss':>9} {'brier':>7}")
+    current = len(k) - 1
+    for rank, i in enumerate(order, start=1):
+        if rank <= args.top or i == current:
+            marker = "  <- current" if i == current else ""
+            print(f"{rank:>4} {k[i]:>9.3f} {rf[i]:>13.1f} {result['log_loss'][i]:>9.4f} {result['brier'][i]:>7.4f}{marker}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in result.items()}, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Per-message latency of outbound WhatsApp messages against a local TLS stub server.
+
+Compares a bare `requests.post` per message (the previous behaviour) with the pooled
+`MessageProvider` session.
+
+    python -m benchmarks.bench_message_provider --messages 500
+"""
+
+import argparse
+import json
+import os
+import time
+
+import requests
+
+from benchmarks.stub_server import StubServer
+from benchmarks.timing import summarize
+
+
+def run(messages: int) -> dict:
+    with StubServer() as stub:
+        os.environ["WHATSAPP_API_URL"] = stub.url
+        os.environ.setdefault("WHATSAPP_TOKEN", "benchmark")
+        os.environ["WHATSAPP_RATE_LIMIT"] = "1000000"
+        # A session takes the CA bundle of the environment over Session.verify, so the pooled session trusts the stub this way
+        os.environ["REQUESTS_CA_BUNDLE"] = stub.cert
+
+        from utils.message_provider import MessageProvider
+
+        payload = {"messaging_product": "whatsapp", "to": "490000000000", "type": "text", "text": {"body": "Benchmark"}}
+
+        bare = []
+        for _ in range(messages):
+            start = time.perf_counter()
+            response = requests.post(
+                MessageProvider.url_for("benchmark"), json=payload, headers=MessageProvider.headers, timeout=10, verify=stub.cert
+            )
+            response.raise_for_status()
+            bare.append(time.perf_counter() - start)
+
+        pooled = []
+        for _ in range(messages):
+            start = time.perf_counter()
+            MessageProvider.send_message("benchmark", "490000000000", "Benchmark")
+            pooled.append(time.perf_counter() - start)
+
+    return {"benchmark": "message_provider", "bare_requests_post": summarize(bare), "pooled_session": summarize(pooled)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(run(args.messages), indent=2))
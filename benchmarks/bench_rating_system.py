@@ -0,0 +1,137 @@
+"""Benchmarks of the RatingSystem operations on a synthetic club.
+
+Runs against a fresh SQLite file by default, or any database given with --database-url.
+Supabase storage is replaced by a local directory. The results are written as JSON, a
+previous result can be passed with --baseline to fail on regressions.
+
+    python -m benchmarks.bench_rating_system --players 1000 --games 20000 --output bench.json
+    python -m benchmarks.bench_rating_system --baseline bench.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import create_engine
+
+from benchmarks.data_generator import populate
+from benchmarks.local_storage import LocalSupabase
+from benchmarks.timing import compare, measure, summarize
+
+ADMIN_PHONE_NUMBER = "490000000000"
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    """Drops one character, like a hasty WhatsApp message."""
+    index = rng.randrange(len(name))
+    return name[:index] + name[index + 1 :]
+
+
+def run(players: int, games: int, seed: int, runs: int, database_url: str, workdir: str) -> dict:
+    os.environ.setdefault("ADMIN_PHONE_NUMBER", ADMIN_PHONE_NUMBER)
+    from rating_system import RatingSystem
+    from utils.exceptions import PlayerNotFoundException
+
+    engine = create_engine(database_url)
+    player_rows = populate(engine, players, games, seed)
+    rating_system = RatingSystem(engine=engine, supabase=LocalSupabase(os.path.join(workdir, "storage")))
+    logging.getLogger().setLevel(logging.WARNING)
+    rng = random.Random(seed)
+    admin = os.environ["ADMIN_PHONE_NUMBER"]
+
+    def pairing():
+        playerA, playerB = rng.sample(player_rows, 2)
+        return playerA["name"], playerB["name"]
+
+    def find_closest_name():
+        try:
+            rating_system.find_closest_name(misspell(rng.choice(player_rows)["name"], rng))
+        except PlayerNotFoundException:
+            # A miss scans all names as well
+            pass
+
+    added = []
+
+    def add_game():
+        nameA, nameB = pairing()
+        game_id, _ = rating_system.add_game(nameA, nameB, 7, rng.randint(0, 6), "Normal", admin)
+        added.append(game_id)
+
+    def add_games():
+        nameA, nameB = pairing()
+        changes = rating_system.add_games(nameA, nameB, [(7, 3), (5, 7), (7, 6)], "Normal", admin)
+        added.extend(game_id for game_id, _ in changes)
+
+    results = {}
+
+    def benchmark(name, func, runs):
+        try:
+            results[name] = summarize(measure(func, runs))
+        except Exception as e:
+            # The other operations are still measured, the run fails at the end
+            logging.exception("Benchmark %s fehlgeschlagen.", name)
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+
+    benchmark("find_closest_name", find_closest_name, runs)
+    benchmark("add_game", add_game, runs)
+    benchmark("add_games", add_games, runs)
+    benchmark("delete_game", lambda: rating_system.delete_game(added.pop(), admin), runs)
+    benchmark("rating_image", rating_system.rating_image, max(1, runs // 10))
+    benchmark("export_database", rating_system.export_database, max(1, runs // 10))
+    benchmark("apply_rating_decay", rating_system.apply_rating_decay, max(1, runs // 10))
+
+    return {
+        "meta": {
+            "players": players,
+            "games": games,
+            "seed": seed,
+            "database": engine.dialect.name,
+            "python": sys.version.split()[0],
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=1000, help="1k to 100k players")
+    parser.add_argument("--games", type=int, default=20000, help="up to 1M games")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown of the median")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # rating_image and export_database write their files to the working directory
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'club.db')}"
+            report = run(args.players, args.games, args.seed, args.runs, database_url, workdir)
+        finally:
+            os.chdir(cwd)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report["results"], json.load(f)["results"], args.threshold)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+    failed = [name for name, result in report["results"].items() if "error" in result]
+    if failed:
+        sys.exit(f"Fehlgeschlagene Benchmarks: {', '.join(failed)}")
+    if report.get("regressions"):
+        sys.exit(1)
@@ -0,0 +1,173 @@
+"""Time and memory of the read paths: ORM entities against the Core read models.
+
+Every path is run once under tracemalloc for the peak memory and then timed without it.
+The ORM variants are the former implementations, the read model variants are what the
+RatingSystem uses now. Writes of the decay are rolled back, so every run sees the same data.
+
+    python -m benchmarks.bench_read_models --players 10000 --games 500000 --output read_models.json
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+import tempfile
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+import read_models
+from benchmarks.data_generator import populate
+from benchmarks.timing import measure, summarize
+from models import Game, Player, Rating
+
+
+def orm_names(session):
+    return [row[0] for row in session.query(Player.name).all()]
+
+
+def orm_rating(session, name):
+    player = session.query(Player).filter_by(name=name).first()
+    return session.query(Rating).filter_by(player=player.id).first().rating
+
+
+def orm_leaderboard(session):
+    return (
+        session.query(Player.name, Rating.rating, Rating.winning_quote, Rating.games_won, Rating.games_lost, Rating.last_change)
+        .join(Player, Player.id == Rating.player)
+        .order_by(Rating.rating.desc())
+        .all()
+    )
+
+
+def orm_export(session):
+    ratings = [
+        {"player": r.player, "rating": r.rating, "games_won": r.games_won, "games_lost": r.games_lost}
+        for r in session.query(Rating).all()
+    ]
+    games = [
+        {
+            "playerA": g.playerA,
+            "playerB": g.playerB,
+            "scoreA": g.scoreA,
+            "scoreB": g.scoreB,
+            "race_to": g.race_to,
+            "disciplin": g.disciplin,
+            "rating_change": g.rating_change,
+        }
+        for g in session.query(Game).all()
+    ]
+    for rows in (ratings, games):
+        writer = csv.DictWriter(io.StringIO(), fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def core_export(session):
+    for row_type, rows in (
+        (read_models.RatingRow, read_models.ratings(session)),
+        (read_models.GameRow, read_models.games(session)),
+    ):
+        writer = csv.writer(io.StringIO())
+        writer.writerow(row_type._fields)
+        writer.writerows(rows)
+
+
+def orm_decay(session):
+    for rating in session.query(Rating).all():
+        if (datetime.now().date() - rating.last_change).days > 30:
+            rating.rating = rating.rating * 0.97
+            rating.last_change = datetime.now()
+    session.flush()
+    session.rollback()
+
+
+def core_decay(session):
+    today = date.today()
+    cutoff = today - timedelta(days=30)
+    read_models.stale_ratings(session, cutoff)
+    session.execute(
+        update(Rating).where(Rating.last_change < cutoff).values(rating=Rating.rating * 0.97, last_change=today),
+        execution_options={"synchronize_session": False},
+    )
+    session.rollback()
+
+
+def peak_memory(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(players: int, games: int, seed: int, runs: int, database_url: str) -> dict:
+    engine = create_engine(database_url)
+    player_rows = populate(engine, players, games, seed)
+    Session = sessionmaker(bind=engine)
+    name = player_rows[len(player_rows) // 2]["name"]
+
+    paths = {
+        "get_names": (orm_names, read_models.player_names),
+        "get_rating": (
+            lambda session: orm_rating(session, name),
+            lambda session: read_models.player_rating(session, name).rating,
+        ),
+        "leaderboard": (orm_leaderboard, read_models.leaderboard),
+        "export_database": (orm_export, core_export),
+        "apply_rating_decay": (orm_decay, core_decay),
+    }
+
+    results = {}
+    for path, variants in paths.items():
+        results[path] = {}
+        for variant, func in zip(("orm", "read_model"), variants):
+
+            def call():
+                with Session() as session:
+                    func(session)
+
+            call()  # warm up the statement caches
+            result = summarize(measure(call, runs))
+            result["peak_kib"] = peak_memory(call) / 1024
+            results[path][variant] = result
+        orm, core = results[path]["orm"], results[path]["read_model"]
+        results[path]["speedup"] = orm["p50_ms"] / core["p50_ms"] if core["p50_ms"] else None
+        results[path]["memory_ratio"] = orm["peak_kib"] / core["peak_kib"] if core["peak_kib"] else None
+
+    return {
+        "meta": {
+            "players": players,
+            "games": games,
+            "seed": seed,
+            "database": engine.dialect.name,
+            "python": sys.version.split()[0],
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=10000)
+    parser.add_argument("--games", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database_url = args.database_url or f"sqlite:///{workdir}/club.db"
+        report = run(args.players, args.games, args.seed, args.runs, database_url)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
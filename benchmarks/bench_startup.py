@@ -0,0 +1,90 @@
+"""Import time of the server and latency of its first request.
+
+Every run starts a fresh interpreter, so nothing is cached between measurements. The first
+request loads the leaderboard from a synthetic SQLite club, which connects the database and
+imports the modules the import of the server leaves out.
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+HEAVY_MODULES = ("pandas", "numpy", "matplotlib", "dataframe_image", "fuzzywuzzy", "supabase")
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import server
+imported = time.perf_counter()
+heavy_modules_imported = [name for name in {HEAVY_MODULES!r} if name in sys.modules]
+response = server.app.test_client().get("/api/leaderboard")
+first_request = time.perf_counter()
+assert response.status_code == 200, response.get_data(as_text=True)
+print(json.dumps({{
+    "import_seconds": imported - start,
+    "first_request_seconds": first_request - imported,
+    "heavy_modules_loaded": heavy_modules_imported,
+    "heavy_modules_after_first_request": [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+# The server must start without any external service, nothing is connected during the import
+ENVIRONMENT = {
+    "SENTRY_DSN": "",
+    "WHATSAPP_TOKEN": "benchmark",
+    "WHATSAPP_WEBHOOK_TOKEN": "benchmark",
+    "ADMIN_PHONE_NUMBER": "490000000000",
+    "SUPABASE_USER": "postgres",
+    "SUPABASE_PASSWORD": "postgres",
+    "SUPABASE_HOST": "127.0.0.1",
+    "SUPABASE_PORT": "54322",
+    "SUPABASE_NAME": "postgres",
+    "SUPABASE_URL": "http://127.0.0.1:54321",
+    "SUPABASE_KEY": "benchmark",
+}
+
+
+def run(runs: int, players: int, games: int) -> dict:
+    from sqlalchemy import create_engine
+
+    from benchmarks.data_generator import populate
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database_url = f"sqlite:///{os.path.join(workdir, 'club.db')}"
+        engine = create_engine(database_url)
+        populate(engine, players, games)
+        engine.dispose()
+
+        environment = {**os.environ, **ENVIRONMENT, "DATABASE_URL": database_url}
+        results = []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, "-c", PROBE], cwd=ROOT, env=environment, capture_output=True, text=True, check=True
+            )
+            results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    return {
+        "benchmark": "startup",
+        "runs": runs,
+        "import_seconds_median": statistics.median(result["import_seconds"] for result in results),
+        "first_request_seconds_median": statistics.median(result["first_request_seconds"] for result in results),
+        "heavy_modules_loaded": results[-1]["heavy_modules_loaded"],
+        "heavy_modules_after_first_request": results[-1]["heavy_modules_after_first_request"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--games", type=int, default=20000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.runs, args.players, args.games), indent=2))
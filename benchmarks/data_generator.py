@@ -0,0 +1,133 @@
+"""Seeded generator for a synthetic club: players, ratings and game histories.
+
+    python -m benchmarks.data_generator --players 1000 --games 20000 --database-url sqlite:///club.db
+"""
+
+import argparse
+import random
+from datetime import date, timedelta
+from math import pow
+from uuid import UUID
+
+from sqlalchemy import create_engine, insert
+
+from models import RATING_FACTOR, Base, Game, Player, Rating
+
+FIRST_NAMES = (
+    "Alexander Andreas Anna Benjamin Christian Claudia Daniel David Dennis Dominik Elena Fabian Felix "
+    "Florian Frank Hannah Heike Horst Jan Jana Jens Jonas Julia Jürgen Kai Katharina Klaus Lara Lea Lukas "
+    "Marcel Maria Markus Martin Maximilian Michael Monika Niklas Nina Oliver Patrick Paul Peter Philipp "
+    "Ralf Sabine Sandra Sarah Sebastian Simon Sophie Stefan Sven Thomas Tim Tobias Ursula Uwe Wolfgang "
+    "Yvonne"
+).split()
+LAST_NAMES = (
+    "Bauer Becker Braun Busch Dietrich Engel Fischer Frank Friedrich Fuchs Graf Günther Haas Hahn "
+    "Hartmann Heinrich Hermann Hoffmann Hofmann Huber Jung Kaiser Keller Klein Koch König Krämer Krause "
+    "Krüger Kuhn Lang Lange Lehmann Lorenz Ludwig Maier Meier Meyer Möller Müller Neumann Peters Pohl "
+    "Richter Roth Schäfer Scherer Schmid Schmidt Schmitt Schneider Scholz Schröder Schubert Schulz "
+    "Schwarz Simon Sommer Stein Streit Vogel Vogt Wagner Walter Weber Weiß Werner Wolf Zimmermann"
+).split()
+RACES = [5, 7, 9]
+CHUNK_SIZE = 10000
+
+
+def generate_players(count: int, rng: random.Random) -> list[dict]:
+    names = set()
+    players = []
+    while len(players) < count:
+        name = f"{rng.choice(LAST_NAMES)}, {rng.choice(FIRST_NAMES)}"
+        # Large clubs run out of combinations, add a second first name
+        if name in names:
+            name = f"{name} {rng.choice(FIRST_NAMES)}"
+        if name in names:
+            continue
+        names.add(name)
+        players.append(
+            {
+                "id": UUID(int=rng.getrandbits(128), version=4),
+                "name": name,
+                "phone_number": f"4915{len(players):09d}",
+            }
+        )
+    return players
+
+
+def generate_ratings(players: list[dict], rng: random.Random, today: date) -> list[dict]:
+    ratings = []
+    for player in players:
+        games_won = rng.randint(0, 200)
+        games_lost = rng.randint(0, 200)
+        ratings.append(
+            {
+                "player": player["id"],
+                "rating": max(0.0, rng.gauss(50, 15)),
+                "games_won": games_won,
+                "games_lost": games_lost,
+                "winning_quote": games_won / (games_won + games_lost) if games_won + games_lost else None,
+                # About a third of the players have not played for more than 30 days
+                "last_change": today - timedelta(days=rng.randint(0, 90)),
+            }
+        )
+    return ratings
+
+
+def generate_games(count: int, players: list[dict], ratings: list[dict], rng: random.Random, today: date):
+    """Yields games between random players, the stronger player wins more racks."""
+    strength = {rating["player"]: rating["rating"] for rating in ratings}
+    for index in range(count):
+        playerA, playerB = rng.sample(players, 2)
+        expected = 1 / (1 + pow(10, (strength[playerB["id"]] - strength[playerA["id"]]) / RATING_FACTOR))
+        race_to = rng.choice(RACES)
+        scoreA = scoreB = 0
+        while scoreA < race_to and scoreB < race_to:
+            if rng.random() < expected:
+                scoreA += 1
+            else:
+                scoreB += 1
+        yield {
+            # Synthetic ids never collide with the ids of Game.generate_unique_id
+            "id": f"#S{index:07d}",
+            "playerA": playerA["id"],
+            "playerB": playerB["id"],
+            "scoreA": scoreA,
+            "scoreB": scoreB,
+            "race_to": race_to,
+            "disciplin": "Normal",
+            "rating_change": rng.uniform(-5, 5),
+            "created_at": today - timedelta(days=rng.randint(0, 730)),
+        }
+
+
+def populate(engine, players: int, games: int, seed: int = 42) -> list[dict]:
+    """Creates the tables and fills them with a synthetic club, returns the players."""
+    rng = random.Random(seed)
+    today = date.today()
+    Base.metadata.create_all(engine)
+
+    player_rows = generate_players(players, rng)
+    rating_rows = generate_ratings(player_rows, rng, today)
+    with engine.begin() as connection:
+        for start in range(0, len(player_rows), CHUNK_SIZE):
+            connection.execute(insert(Player), player_rows[start : start + CHUNK_SIZE])
+            connection.execute(insert(Rating), rating_rows[start : start + CHUNK_SIZE])
+
+        chunk = []
+        for game in generate_games(games, player_rows, rating_rows, rng, today):
+            chunk.append(game)
+            if len(chunk) == CHUNK_SIZE:
+                connection.execute(insert(Game), chunk)
+                chunk = []
+        if chunk:
+            connection.execute(insert(Game), chunk)
+
+    return player_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--games", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default="sqlite:///club.db")
+    args = parser.parse_args()
+    populate(create_engine(args.database_url), args.players, args.games, args.seed)
@@ -0,0 +1,276 @@
+"""Load generator and replay harness for the WhatsApp webhook.
+
+Generates Graph API webhook payloads (commands, list replies, single and multi-game
+messages) or replays recorded ones from a JSON lines file and posts them at a target
+rate. Reports throughput, latency percentiles and errors per command type.
+
+By default the Flask app is loaded in-process on a synthetic SQLite club, with outbound
+messages going to a local sink, so both the webhook acknowledgement and the background
+processing of every message are measured. With --url the payloads are posted to a
+running server instead, then only the acknowledgement is measured.
+
+    python -m benchmarks.load_webhook --rate 50 --duration 30
+    python -m benchmarks.load_webhook --replay webhooks.jsonl --url http://127.0.0.1:8080/whatsapp
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+import requests
+
+from benchmarks.stub_server import StubServer
+from benchmarks.timing import summarize
+
+PHONE_NUMBER_ID = "100000000000000"
+ADMIN_PHONE_NUMBER = "490000000000"
+
+message_ids = count()
+
+
+def webhook(phone_number: str, message: dict) -> dict:
+    message = {"from": phone_number, "id": f"wamid.load.{next(message_ids)}", "timestamp": str(int(time.time())), **message}
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [
+            {
+                "changes": [
+                    {
+                        "value": {
+                            "messaging_product": "whatsapp",
+                            "metadata": {"phone_number_id": PHONE_NUMBER_ID},
+                            "contacts": [{"profile": {"name": "Load Test"}, "wa_id": phone_number}],
+                            "messages": [message],
+                        },
+                        "field": "messages",
+                    }
+                ]
+            }
+        ],
+    }
+
+
+def text(phone_number: str, body: str) -> dict:
+    return webhook(phone_number, {"type": "text", "text": {"body": body}})
+
+
+def list_reply(phone_number: str, title: str) -> dict:
+    return webhook(
+        phone_number, {"type": "interactive", "interactive": {"type": "list_reply", "list_reply": {"id": title, "title": title}}}
+    )
+
+
+def command_type(payload: dict) -> str:
+    """Classifies a webhook payload, also used for replayed payloads."""
+    try:
+        message = payload["entry"][0]["changes"][0]["value"]["messages"][0]
+    except (KeyError, IndexError):
+        return "other"
+    if message.get("type") == "interactive":
+        return "list_reply:" + message["interactive"].get("list_reply", {}).get("title", "?")
+    if message.get("type") != "text":
+        return message.get("type", "other")
+
+    lines = message["text"]["body"].strip().splitlines()
+    if len(lines) > 1:
+        scores = sum(1 for line in lines if line.replace(" ", "").replace(":", "").isdigit())
+        return "game" if scores <= 1 else "multi_game"
+    return "text:" + lines[0].lower() if lines else "other"
+
+
+def generate(players: list[dict], total: int, seed: int) -> list[dict]:
+    """Generates conversations of random players, the steps of a conversation stay in order."""
+    rng = random.Random(seed)
+    payloads = []
+    while len(payloads) < total:
+        player = rng.choice(players)
+        phone_number = player["phone_number"]
+        opponent = rng.choice(players)["name"]
+        roll = rng.random()
+        if roll < 0.25:
+            payloads.append(text(phone_number, "Start"))
+        elif roll < 0.35:
+            payloads.append(text(phone_number, "Hilfe"))
+        elif roll < 0.40:
+            payloads.append(list_reply(phone_number, "Rating anschauen"))
+        elif roll < 0.70:
+            payloads.append(list_reply(phone_number, "Spiel hinzufügen"))
+            payloads.append(text(phone_number, f"Normal\n{player['name']}: {opponent}\n{rng.randint(0, 7)}:7"))
+        elif roll < 0.90:
+            scores = "\n".join(f"7:{rng.randint(0, 6)}" for _ in range(rng.randint(2, 5)))
+            payloads.append(list_reply(phone_number, "Spiel hinzufügen"))
+            payloads.append(text(phone_number, f"Normal\n{player['name']}: {opponent}\n{scores}"))
+        else:
+            payloads.append(text(phone_number, "Was geht?"))
+    return payloads
+
+
+def replay(path: str) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class InlineTarget:
+    """The Flask app in this process, on a synthetic SQLite club and a local message sink."""
+
+    def __init__(self, workdir: str, players: int, games: int, seed: int, sink: StubServer):
+        os.environ.update(
+            {
+                "SENTRY_DSN": os.environ.get("SENTRY_DSN", ""),
+                "WHATSAPP_TOKEN": "load-test",
+                "WHATSAPP_WEBHOOK_TOKEN": "load-test",
+                "WHATSAPP_API_URL": sink.url,
+                # Trusts the self-signed certificate of the sink, requests prefers this over Session.verify
+                "REQUESTS_CA_BUNDLE": sink.cert,
+                "WHATSAPP_RATE_LIMIT": "1000000",
+                "ADMIN_PHONE_NUMBER": ADMIN_PHONE_NUMBER,
+            }
+        )
+        from sqlalchemy import create_engine
+
+        import server
+        from benchmarks.data_generator import populate
+        from benchmarks.local_storage import LocalSupabase
+        from rating_system import RatingSystem
+
+        engine = create_engine(f"sqlite:///{os.path.join(workdir, 'club.db')}")
+        self.players = populate(engine, players, games, seed)
+        server.ratingSystem = RatingSystem(engine=engine, supabase=LocalSupabase(os.path.join(workdir, "storage")))
+        server.start()
+
+        self.server = server
+        self.lock = threading.Lock()
+        self.processing = defaultdict(list)
+        self.processing_errors = defaultdict(int)
+
+        # Time the background processing of every message by its command type
+        handler = server.message_queue.handler
+
+        def timed_handler(phone_number_id, username, message):
+            kind = command_type(webhook(message["from"], message))
+            start = time.perf_counter()
+            try:
+                handler(phone_number_id, username, message)
+            except Exception:
+                with self.lock:
+                    self.processing_errors[kind] += 1
+                raise
+            finally:
+                with self.lock:
+                    self.processing[kind].append(time.perf_counter() - start)
+
+        server.message_queue.handler = timed_handler
+        self.local = threading.local()
+
+    def post(self, payload: dict) -> int:
+        if not hasattr(self.local, "client"):
+            self.local.client = self.server.app.test_client()
+        return self.local.client.post("/whatsapp", json=payload).status_code
+
+    def drain(self):
+        self.server.message_queue.join()
+
+
+class HttpTarget:
+    def __init__(self, url: str):
+        self.url = url
+        self.session = requests.Session()
+        self.processing = {}
+        self.processing_errors = {}
+
+    def post(self, payload: dict) -> int:
+        return self.session.post(self.url, json=payload, timeout=30).status_code
+
+    def drain(self):
+        pass
+
+
+def run(target, payloads: list[dict], rate: float, concurrency: int) -> dict:
+    lock = threading.Lock()
+    acks = defaultdict(list)
+    errors = defaultdict(int)
+
+    def send(payload):
+        kind = command_type(payload)
+        start = time.perf_counter()
+        try:
+            status = target.post(payload)
+        except Exception:
+            status = None
+        duration = time.perf_counter() - start
+        with lock:
+            acks[kind].append(duration)
+            if status != 200:
+                errors[kind] += 1
+
+    # Open loop: requests are sent on schedule, independent of how fast they are answered
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index, payload in enumerate(payloads):
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, payload)
+    sent = time.perf_counter() - start
+    target.drain()
+    processed = time.perf_counter() - start
+
+    commands = {}
+    for kind in sorted(set(acks) | set(target.processing)):
+        commands[kind] = {
+            "requests": len(acks.get(kind, [])),
+            "errors": errors.get(kind, 0),
+            "ack": summarize(acks[kind]) if acks.get(kind) else None,
+            "processing": summarize(target.processing[kind]) if target.processing.get(kind) else None,
+            "processing_errors": target.processing_errors.get(kind, 0),
+        }
+
+    return {
+        "requests": len(payloads),
+        "target_rate": rate,
+        "ack_throughput": len(payloads) / sent,
+        "processing_throughput": len(payloads) / processed,
+        "errors": sum(errors.values()),
+        "commands": commands,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=20, help="requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of generated load")
+    parser.add_argument("--concurrency", type=int, default=32, help="parallel connections")
+    parser.add_argument("--replay", help="JSON lines file of recorded webhook payloads")
+    parser.add_argument("--url", help="webhook URL of a running server instead of the in-process app")
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir, StubServer() as sink:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            if args.url:
+                target = HttpTarget(args.url)
+                players = [{"name": f"Spieler {i}", "phone_number": f"4915{i:09d}"} for i in range(args.players)]
+            else:
+                target = InlineTarget(workdir, args.players, args.games, args.seed, sink)
+                players = target.players
+
+            logging.getLogger().setLevel(logging.WARNING)
+            payloads = replay(args.replay) if args.replay else generate(players, int(args.rate * args.duration), args.seed)
+            report = run(target, payloads, args.rate, args.concurrency)
+            report["outbound_messages"] = sink.received
+        finally:
+            os.chdir(cwd)
+
+    print(json.dumps(report, indent=2))
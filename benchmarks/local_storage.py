@@ -0,0 +1,52 @@
+import os
+import shutil
+
+
+class LocalBucket:
+    def __init__(self, path: str, name: str):
+        self.path = path
+        self.name = name
+
+    def upload(self, path, file, file_options=None):
+        with open(os.path.join(self.path, os.path.basename(path)), "wb") as f:
+            f.write(file if isinstance(file, bytes) else file.read())
+
+    def list(self):
+        return [{"name": name} for name in sorted(os.listdir(self.path))]
+
+    def remove(self, paths):
+        for name in [paths] if isinstance(paths, str) else paths:
+            os.remove(os.path.join(self.path, name))
+
+    def get_public_url(self, name):
+        return f"file://{os.path.join(self.path, name)}"
+
+
+class LocalStorage:
+    """Implements the part of the Supabase storage API used by RatingSystem on a local directory."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def create_bucket(self, name, options=None):
+        path = os.path.join(self.root, name)
+        if os.path.exists(path):
+            raise FileExistsError(name)
+        os.makedirs(path)
+
+    def empty_bucket(self, name):
+        path = os.path.join(self.root, name)
+        shutil.rmtree(path)
+        os.makedirs(path)
+
+    def from_(self, name):
+        path = os.path.join(self.root, name)
+        os.makedirs(path, exist_ok=True)
+        return LocalBucket(path, name)
+
+
+class LocalSupabase:
+    """Stand-in for the Supabase client, so benchmarks run without any external service."""
+
+    def __init__(self, root: str):
+        self.storage = LocalStorage(root)
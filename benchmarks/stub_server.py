@@ -0,0 +1,82 @@
+import json
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubGraphApiHandler(BaseHTTPRequestHandler):
+    """Answers every POST like the Graph API messages endpoint and keeps the connection alive."""
+
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one segment, otherwise delayed ACKs dominate keep-alive latency
+    wbufsize = 1 << 16
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.server.received += 1
+
+        body = json.dumps({"messaging_product": "whatsapp", "messages": [{"id": f"wamid.{self.server.received}"}]})
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def self_signed_certificate(directory: str, host: str) -> tuple[str, str]:
+    """Writes a certificate and key for `host` that are valid for one day, returns their paths."""
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", f"/CN={host}"]
+        + ["-addext", f"subjectAltName=IP:{host}", "-keyout", key, "-out", cert],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+class StubServer:
+    """Local TLS sink for outbound WhatsApp messages, runs in a background thread.
+
+    The certificate is self-signed, clients pass `verify=stub.cert` to trust it.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cert, key = self_signed_certificate(self.directory.name, host)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.cert, key)
+
+        self.server = ThreadingHTTPServer((host, port), StubGraphApiHandler)
+        # The handshake runs on the first read in the handler thread instead of blocking the accept loop
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True, do_handshake_on_connect=False)
+        self.server.daemon_threads = True
+        self.server.received = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f"https://{host}:{port}"
+
+    @property
+    def received(self) -> int:
+        return self.server.received
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
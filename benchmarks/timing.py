@@ -0,0 +1,49 @@
+import statistics
+import time
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(durations) -> dict:
+    """Summary of durations in seconds, reported in milliseconds."""
+    return {
+        "runs": len(durations),
+        "mean_ms": statistics.mean(durations) * 1000,
+        "min_ms": min(durations) * 1000,
+        "p50_ms": percentile(durations, 0.50) * 1000,
+        "p95_ms": percentile(durations, 0.95) * 1000,
+        "p99_ms": percentile(durations, 0.99) * 1000,
+    }
+
+
+def measure(func, runs: int) -> list[float]:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[dict]:
+    """Returns the benchmarks whose median got slower than the baseline by more than `threshold`.
+
+    A benchmark that failed in this run is reported with its error, unless it failed in the baseline as well.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous.get("p50_ms"):
+            continue
+        if not result.get("p50_ms"):
+            regressions.append({"benchmark": name, "baseline_p50_ms": previous["p50_ms"], "error": result.get("error")})
+            continue
+        change = result["p50_ms"] / previous["p50_ms"] - 1
+        if change > threshold:
+            regressions.append(
+                {"benchmark": name, "baseline_p50_ms": previous["p50_ms"], "p50_ms": result["p50_ms"], "change": change}
+            )
+    return regressions
@@ -1,33 +1,78 @@
 import logging
-from datetime import datetime
-from math import floor
+from array import array
+from datetime import date, datetime
 from random import randint
-from uuid import uuid4
+from uuid import NAMESPACE_URL, uuid4, uuid5
 
-from sqlalchemy import UUID, Column, Date, Float, ForeignKey, Integer, String
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import (
+    UUID,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    ForeignKeyConstraint,
+    Integer,
+    LargeBinary,
+    String,
+    UniqueConstraint,
+    inspect,
+    text,
+)
+from sqlalchemy.orm import declarative_base, relationship, with_loader_criteria
 
-from utils.enums import GameType
-from utils.exceptions import GameTypeNotSupportedException
+from rating_models import K_FACTOR, RATING_FACTOR, EloModel
+from utils.tenancy import DEFAULT_CLUB, club_id
 
-RATING_FACTOR = 120
-K_FACTOR = 1.2
+ELO = EloModel(k_factor=K_FACTOR, rating_factor=RATING_FACTOR)
 
 Base = declarative_base()
 
 
+def club_column(primary_key: bool = False) -> Column:
+    """Club the row belongs to, filled from the club of the message being handled."""
+    return Column(String, primary_key=primary_key, nullable=False, default=club_id, server_default=DEFAULT_CLUB, index=True)
+
+
+class Club(Base):
+    """A club served by this deployment, reached through its own WhatsApp number."""
+
+    __tablename__ = "clubs"
+    id = Column(String, primary_key=True)
+    name = Column(String, nullable=False)
+    caption = Column(String, nullable=True)
+    phone_number_id = Column(String, nullable=True, unique=True)
+    # Comma separated phone numbers of the admins
+    admins = Column(String, nullable=False, default="")
+
+
+# Phone number of the per-club placeholder that keeps the games of deleted players
+DELETED_PLAYER_PHONE = "geloescht"
+DELETED_PLAYER_NAME = "Gelöschter Spieler"
+
+
+def deleted_player_id(club: str):
+    """Id of the placeholder of the club, fixed so no lookup is needed to leave it out of the statistics."""
+    return uuid5(NAMESPACE_URL, f"deleted-player/{club}")
+
+
 class Player(Base):
     __tablename__ = "players"
+    # A phone number can play in several clubs, once per club
+    __table_args__ = (UniqueConstraint("club", "phone_number"),)
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    club = club_column()
     name = Column(String, nullable=False)
-    phone_number = Column(String, nullable=False, unique=True)
+    phone_number = Column(String, nullable=False)
 
-    games = relationship("Game", primaryjoin="or_(Player.id==Game.playerA, Player.id==Game.playerB)")
+    # Read only, deleting a player must not load the games to process the relationship
+    games = relationship("Game", primaryjoin="or_(Player.id==Game.playerA, Player.id==Game.playerB)", viewonly=True)
 
 
 class Rating(Base):
     __tablename__ = "ratings"
     player = Column(UUID, ForeignKey("players.id", ondelete="CASCADE"), primary_key=True)
+    club = club_column()
     rating = Column(Float, nullable=False)
     winning_quote = Column(Float, nullable=True)
     games_won = Column(Integer, nullable=False, default=0)
@@ -35,9 +80,72 @@ class Rating(Base):
     last_change = Column(Date, nullable=False, onupdate=datetime.now)
 
 
+class PlayerStats(Base):
+    """Totals of a player over all games, maintained by add_game and delete_game."""
+
+    __tablename__ = "player_stats"
+    player = Column(UUID, ForeignKey("players.id", ondelete="CASCADE"), primary_key=True)
+    games = Column(Integer, nullable=False, default=0)
+    games_won = Column(Integer, nullable=False, default=0)
+    racks_won = Column(Integer, nullable=False, default=0)
+    racks_lost = Column(Integer, nullable=False, default=0)
+    rating_exchanged = Column(Float, nullable=False, default=0.0)
+    last_played = Column(Date, nullable=True)
+
+
+class PairStats(Base):
+    """Head-to-head totals of two players, playerA is always the smaller id."""
+
+    __tablename__ = "pair_stats"
+    playerA = Column(UUID, ForeignKey("players.id", ondelete="CASCADE"), primary_key=True)
+    playerB = Column(UUID, ForeignKey("players.id", ondelete="CASCADE"), primary_key=True)
+    games = Column(Integer, nullable=False, default=0)
+    games_wonA = Column(Integer, nullable=False, default=0)
+    games_wonB = Column(Integer, nullable=False, default=0)
+    racksA = Column(Integer, nullable=False, default=0)
+    racksB = Column(Integer, nullable=False, default=0)
+    # Rating points playerA won from playerB
+    rating_exchanged = Column(Float, nullable=False, default=0.0)
+    last_played = Column(Date, nullable=True)
+
+
+class RatingHistory(Base):
+    """Rating of a player at the end of every day on which it changed.
+
+    The series is stored as two packed arrays (day ordinals and ratings), so a chart
+    needs a single row instead of a replay of all games. version counts the changes
+    and is used as cache key for rendered charts.
+    """
+
+    __tablename__ = "rating_history"
+    player = Column(UUID, ForeignKey("players.id", ondelete="CASCADE"), primary_key=True)
+    days = Column(LargeBinary, nullable=False, default=b"")
+    ratings = Column(LargeBinary, nullable=False, default=b"")
+    version = Column(Integer, nullable=False, default=0)
+
+    def points(self) -> tuple[array, array]:
+        days, ratings = array("i"), array("d")
+        days.frombytes(self.days or b"")
+        ratings.frombytes(self.ratings or b"")
+        return days, ratings
+
+    def append(self, day: date, rating: float):
+        """Appends a rating, a second change on the same day replaces the last point."""
+        days, ratings = self.points()
+        if days and days[-1] == day.toordinal():
+            ratings[-1] = rating
+        else:
+            days.append(day.toordinal())
+            ratings.append(rating)
+        self.days = days.tobytes()
+        self.ratings = ratings.tobytes()
+        self.version = (self.version or 0) + 1
+
+
 class Game(Base):
     __tablename__ = "games"
     id = Column(String, primary_key=True)
+    club = club_column()
     playerA = Column(UUID, ForeignKey("players.id"))
     playerB = Column(UUID, ForeignKey("players.id"))
     scoreA = Column(Integer, nullable=False)
@@ -51,7 +159,10 @@ class Game(Base):
     def generate_unique_id(session):
         while True:
             game_id = f"#{randint(0, 999999):06}"
-            if not session.query(Game).filter_by(id=game_id).first():
+            # Ids are unique over all clubs, archived games keep their id
+            if not session.query(Game).filter_by(id=game_id).execution_options(all_clubs=True).first() and not session.get(
+                ArchivedGame, game_id, execution_options={"all_clubs": True}
+            ):
                 return game_id
 
     def __init__(self, playerA, playerB, scoreA, scoreB, race_to, disciplin, session):
@@ -72,28 +183,152 @@ class Game(Base):
         playerA = session.query(Player).filter_by(id=self.playerA).first()
         playerB = session.query(Player).filter_by(id=self.playerB).first()
 
-        calc_element = 1 / (1 + pow(10, ((playerB_rating - playerA_rating) / RATING_FACTOR)))
-
-        logging.info("GameType: " + self.disciplin)
-
-        if self.disciplin.lower() == "normal":
-            rating_change = K_FACTOR * (self.scoreA - calc_element * (self.scoreA + self.scoreB))
-            logging.info(
-                f"Normales Spiel: Rating-Änderung beträgt {rating_change}.\nSpieler {playerA.name} hat {self.scoreA} Spiele gewonnen, Spieler {playerB.name} hat {self.scoreB} Spiele gewonnen."
-            )
-        elif self.disciplin == "14.1":
-            scoreFactor1 = (
-                self.scoreB / 10.0 if self.coreA > self.scoreB else floor(self.scoreA / self.scoreB * self.scoreA / 10.0)
-            )
-            scoreFactor2 = (
-                floor(self.scoreB / self.scoreA * self.scoreB / 10.0) if self.scoreB < self.scoreA else self.scoreA / 10.0
-            )
-
-            rating_change = K_FACTOR * (scoreFactor1 - calc_element * (scoreFactor1 + scoreFactor2))
-            logging.info(
-                f"14.1 Spiel: Rating-Änderung beträgt {rating_change}.\nSpieler {playerA.name} hat {self.scoreA} Spiele gewonnen, Spieler {playerB.name} hat {self.scoreB} Spiele gewonnen.\nDie Score-Faktoren sind {scoreFactor1} und {scoreFactor2}."
-            )
-        else:
-            raise GameTypeNotSupportedException(self.disciplin)
+        logging.info("GameType: %s", self.disciplin)
+
+        rating_change = ELO.rating_change(playerA_rating, playerB_rating, self.scoreA, self.scoreB, self.disciplin)
+        logging.info(
+            "%s Spiel: Rating-Änderung beträgt %s.\nSpieler %s hat %s Spiele gewonnen, Spieler %s hat %s Spiele gewonnen.",
+            self.disciplin,
+            rating_change,
+            playerA.name,
+            self.scoreA,
+            playerB.name,
+            self.scoreB,
+        )
 
         return rating_change
+
+
+class Season(Base):
+    """A closed season, its games were moved from `games` to `archived_games`."""
+
+    __tablename__ = "seasons"
+    club = club_column(primary_key=True)
+    name = Column(String, primary_key=True)
+    # Games played before this day belong to the season
+    cutoff = Column(Date, nullable=False)
+    games = Column(Integer, nullable=False)
+    archived_at = Column(DateTime, nullable=False, default=datetime.now)
+
+
+class ArchivedGame(Base):
+    """A game of a closed season, same columns as `games`. Only read for statistics over all seasons."""
+
+    __tablename__ = "archived_games"
+    __table_args__ = (ForeignKeyConstraint(["club", "season"], ["seasons.club", "seasons.name"]),)
+    id = Column(String, primary_key=True)
+    club = club_column()
+    season = Column(String, nullable=False, index=True)
+    playerA = Column(UUID, ForeignKey("players.id"))
+    playerB = Column(UUID, ForeignKey("players.id"))
+    scoreA = Column(Integer, nullable=False)
+    scoreB = Column(Integer, nullable=False)
+    race_to = Column(Integer, nullable=False)
+    disciplin = Column(String, nullable=False)
+    rating_change = Column(Float, nullable=False)
+    created_at = Column(Date, nullable=False)
+
+
+class SeasonSummary(Base):
+    """Totals of a player in a closed season and the rating checkpoint at the end of it."""
+
+    __tablename__ = "season_summaries"
+    __table_args__ = (ForeignKeyConstraint(["club", "season"], ["seasons.club", "seasons.name"], ondelete="CASCADE"),)
+    club = club_column()
+    season = Column(String, primary_key=True)
+    player = Column(UUID, ForeignKey("players.id", ondelete="CASCADE"), primary_key=True)
+    games = Column(Integer, nullable=False, default=0)
+    games_won = Column(Integer, nullable=False, default=0)
+    racks_won = Column(Integer, nullable=False, default=0)
+    racks_lost = Column(Integer, nullable=False, default=0)
+    rating_exchanged = Column(Float, nullable=False, default=0.0)
+    # Rating when the season was closed, None if the player was not in the rating
+    rating = Column(Float, nullable=True)
+
+
+class ModelRating(Base):
+    """Rating of a player in an alternative rating model, e.g. Glicko-2, kept alongside `ratings`."""
+
+    __tablename__ = "model_ratings"
+    model = Column(String, primary_key=True)
+    player = Column(UUID, ForeignKey("players.id", ondelete="CASCADE"), primary_key=True)
+    club = club_column()
+    rating = Column(Float, nullable=False)
+    deviation = Column(Float, nullable=True)
+    volatility = Column(Float, nullable=True)
+    games = Column(Integer, nullable=False, default=0)
+
+
+class RatingPeriod(Base):
+    """A day with games that was rated as one period by an alternative rating model."""
+
+    __tablename__ = "rating_periods"
+    club = club_column(primary_key=True)
+    model = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    games = Column(Integer, nullable=False)
+    rated_at = Column(DateTime, nullable=False, default=datetime.now)
+
+
+# Tables with a club column, every ORM statement of a RatingSystem session only sees the current club
+CLUB_MODELS = (Player, Rating, Game, ArchivedGame, Season, SeasonSummary, ModelRating, RatingPeriod)
+
+
+def filter_by_club(orm_execute_state):
+    """do_orm_execute hook that restricts selects, updates and deletes to the current club.
+    Statements executed with the option all_clubs=True see every club."""
+    if orm_execute_state.is_column_load or orm_execute_state.is_relationship_load:
+        return
+    if orm_execute_state.execution_options.get("all_clubs"):
+        return
+    if orm_execute_state.is_select or orm_execute_state.is_update or orm_execute_state.is_delete:
+        club = club_id()
+        orm_execute_state.statement = orm_execute_state.statement.options(
+            *(with_loader_criteria(model, model.club == club, include_aliases=True) for model in CLUB_MODELS)
+        )
+
+
+def upgrade_schema(engine):
+    """Adds the club column to tables created before clubs existed, their rows belong to the default club."""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for model in CLUB_MODELS:
+            table = model.__tablename__
+            if "club" in {column["name"] for column in inspector.get_columns(table)}:
+                continue
+            logging.info("Spalte club wird zur Tabelle %s hinzugefügt.", table)
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN club VARCHAR NOT NULL DEFAULT '{DEFAULT_CLUB}'"))
+            connection.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_club ON {table} (club)"))
+            if model is ModelRating:
+                # Model ratings may have been written for players of other clubs before the column existed
+                connection.execute(
+                    text("UPDATE model_ratings SET club = (SELECT club FROM players WHERE players.id = model_ratings.player)")
+                )
+            if model is Player and engine.dialect.name == "postgresql":
+                # The phone number was unique over all players, now it is unique within a club
+                connection.execute(text("ALTER TABLE players DROP CONSTRAINT IF EXISTS players_phone_number_key"))
+                connection.execute(
+                    text("CREATE UNIQUE INDEX IF NOT EXISTS players_club_phone_number_key ON players (club, phone_number)")
+                )
+
+
+class ScheduledJob(Base):
+    """Lease of a scheduled job, shared by all server processes. Times are in UTC."""
+
+    __tablename__ = "scheduled_jobs"
+    name = Column(String, primary_key=True)
+    next_run_at = Column(DateTime, nullable=False)
+    locked_by = Column(String, nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+
+
+class JobRun(Base):
+    __tablename__ = "job_runs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job = Column(String, nullable=False, index=True)
+    worker = Column(String, nullable=False)
+    scheduled_for = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    duration = Column(Float, nullable=False)
+    outcome = Column(String, nullable=False)
+    error = Column(String, nullable=True)
@@ -0,0 +1,116 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from math import comb
+from multiprocessing import get_context
+from os import environ
+
+import numpy as np
+
+from rating_models import RATING_FACTOR
+
+SIMULATIONS = int(environ.get("PREDICTION_SIMULATIONS", 20000))
+# Processes for large brackets, 1 keeps every simulation in the calling process
+WORKERS = int(environ.get("PREDICTION_WORKERS", 1))
+# Simulated matches (simulations x bracket size) above which a bracket is split across processes.
+# One process simulates about 5 million matches per second (64 players x 20k simulations take 0.25s),
+# a spawned worker first imports the main module of the server, which takes longer than that.
+PARALLEL_THRESHOLD = int(environ.get("PREDICTION_PARALLEL_THRESHOLD", 50_000_000))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def rack_probability(ratingA, ratingB, rating_factor: float = RATING_FACTOR):
+    """Probability that A wins a single rack, the expected-score term of the rating formula."""
+    return 1 / (1 + np.power(10.0, (np.asarray(ratingB) - np.asarray(ratingA)) / rating_factor))
+
+
+def match_probability(p, race_to: int):
+    """Exact probability that A wins a race to `race_to` when winning a rack with probability p.
+
+    A race is decided within 2N-1 racks, A wins it iff A wins at least N of them.
+    """
+    p = np.asarray(p, dtype=float)
+    racks = 2 * race_to - 1
+    k = np.arange(race_to, racks + 1)
+    coefficients = np.array([comb(racks, int(i)) for i in k], dtype=float)
+    return np.sum(coefficients * p[..., None] ** k * (1 - p[..., None]) ** (racks - k), axis=-1)
+
+
+def score_probabilities(p: float, race_to: int) -> dict[tuple[int, int], float]:
+    """Probability of every final score of a race to `race_to`."""
+    scores = {}
+    for k in range(race_to):
+        ways = comb(race_to - 1 + k, k)
+        scores[(race_to, k)] = ways * p**race_to * (1 - p) ** k
+        scores[(k, race_to)] = ways * (1 - p) ** race_to * p**k
+    return scores
+
+
+def simulate_matches(p, race_to: int, rng: np.random.Generator):
+    """Samples the winner of races to `race_to`, True where A wins."""
+    return rng.binomial(2 * race_to - 1, p) >= race_to
+
+
+def bracket(players: int) -> np.ndarray:
+    """First round of a single elimination bracket in entry order, -1 marks a bye.
+    The byes go to the first entries, so the list should start with the favourites.
+    """
+    size = 1 << max(players - 1, 0).bit_length()
+    byes = size - players
+    slots = [slot for i in range(byes) for slot in (i, -1)]
+    slots += list(range(byes, players))
+    return np.array(slots, dtype=np.intp)
+
+
+def simulate_bracket(ratings, race_to: int, simulations: int, seed=None, rating_factor: float = RATING_FACTOR) -> np.ndarray:
+    """Plays the bracket `simulations` times at once and returns how often every player won it."""
+    rng = np.random.default_rng(seed)
+    ratings = np.append(np.asarray(ratings, dtype=float), 0.0)  # index -1 (bye) reads the dummy
+    players = len(ratings) - 1
+
+    field = np.tile(bracket(players), (simulations, 1))
+    while field.shape[1] > 1:
+        a, b = field[:, 0::2], field[:, 1::2]
+        wins = simulate_matches(rack_probability(ratings[a], ratings[b], rating_factor), race_to, rng)
+        field = np.where(b < 0, a, np.where(a < 0, b, np.where(wins, a, b)))
+
+    return np.bincount(field[:, 0], minlength=players)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, because forking a threaded server can deadlock the children
+            _executor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=get_context("spawn"))
+        return _executor
+
+
+def start_pool():
+    """Starts the worker processes ahead of the first prediction that needs them, if WORKERS allows a pool."""
+    if WORKERS > 1:
+        # The first task makes the executor start all workers, without waiting for them
+        _get_executor().submit(int)
+
+
+def tournament_probabilities(
+    ratings, race_to: int, simulations: int = SIMULATIONS, seed=None, rating_factor: float = RATING_FACTOR
+) -> np.ndarray:
+    """Probability of every player to win a single elimination tournament.
+
+    Large fields are split into chunks of simulations that run in a process pool,
+    every chunk with its own independent random stream.
+    """
+    size = len(bracket(len(ratings)))
+    if WORKERS < 2 or simulations * size < PARALLEL_THRESHOLD:
+        return simulate_bracket(ratings, race_to, simulations, seed, rating_factor) / simulations
+
+    chunks = np.array_split(np.arange(simulations), WORKERS)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    executor = _get_executor()
+    futures = [
+        executor.submit(simulate_bracket, list(ratings), race_to, len(chunk), chunk_seed, rating_factor)
+        for chunk, chunk_seed in zip(chunks, seeds)
+    ]
+    return sum(future.result() for future in futures) / simulations
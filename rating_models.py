@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from math import floor
+from typing import TYPE_CHECKING, NamedTuple
+
+from utils.exceptions import GameTypeNotSupportedException
+
+# numpy is imported where the arrays are built, models.py only needs the rating formula at startup
+if TYPE_CHECKING:
+    import numpy as np
+
+RATING_FACTOR = 120
+K_FACTOR = 1.2
+
+# Conversion between the Glicko and the Glicko-2 scale
+GLICKO2_SCALE = 173.7178
+
+
+class Period(NamedTuple):
+    """Games of one rating period, players are given as indices into the state array."""
+
+    playerA: np.ndarray
+    playerB: np.ndarray
+    scoreA: np.ndarray
+    scoreB: np.ndarray
+    disciplin: list[str]
+
+    @staticmethod
+    def from_games(games, index: dict) -> "Period":
+        """Builds a period from (playerA, playerB, scoreA, scoreB, disciplin) rows."""
+        import numpy as np
+
+        rows = list(games)
+        return Period(
+            playerA=np.array([index[row[0]] for row in rows], dtype=np.intp),
+            playerB=np.array([index[row[1]] for row in rows], dtype=np.intp),
+            scoreA=np.array([row[2] for row in rows], dtype=float),
+            scoreB=np.array([row[3] for row in rows], dtype=float),
+            disciplin=[row[4] for row in rows],
+        )
+
+    def rack_share(self) -> np.ndarray:
+        """Share of the racks won by playerA, used as game result in [0, 1]."""
+        import numpy as np
+
+        total = self.scoreA + self.scoreB
+        return np.divide(self.scoreA, total, out=np.full(len(total), 0.5), where=total > 0)
+
+
+class RatingModel(ABC):
+    """A rating model works on a float array with one row per player and one column per field."""
+
+    name: str
+    fields: tuple[str, ...]
+
+    @abstractmethod
+    def initial_state(self, players: int) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def rate_period(self, state: np.ndarray, period: Period) -> np.ndarray:
+        """Returns the new state after all games of the period."""
+
+    @abstractmethod
+    def expected_score(self, state: np.ndarray, playerA, playerB) -> np.ndarray:
+        """Expected share of racks won by playerA against playerB."""
+
+
+class EloModel(RatingModel):
+    """The club rating: an Elo-like update after every single game."""
+
+    name = "elo"
+    fields = ("rating",)
+
+    def __init__(self, initial_rating: float = 50.0, k_factor: float = K_FACTOR, rating_factor: float = RATING_FACTOR):
+        self.initial_rating = initial_rating
+        self.k_factor = k_factor
+        self.rating_factor = rating_factor
+
+    def initial_state(self, players: int) -> np.ndarray:
+        import numpy as np
+
+        return np.full((players, 1), self.initial_rating)
+
+    def expected_score(self, state, playerA, playerB):
+        import numpy as np
+
+        return 1 / (1 + np.power(10, (state[playerB, 0] - state[playerA, 0]) / self.rating_factor))
+
+    @staticmethod
+    def score_factors(scoreA: int, scoreB: int, disciplin: str) -> tuple[float, float]:
+        """The result of a game as it enters the rating formula, independent of the ratings."""
+        if disciplin.lower() == "normal":
+            return scoreA, scoreB
+        elif disciplin == "14.1":
+            scoreFactor1 = scoreB / 10.0 if scoreA > scoreB else floor(scoreA / scoreB * scoreA / 10.0)
+            scoreFactor2 = floor(scoreB / scoreA * scoreB / 10.0) if scoreB < scoreA else scoreA / 10.0
+            return scoreFactor1, scoreFactor2
+        else:
+            raise GameTypeNotSupportedException(disciplin)
+
+    def rating_change(self, ratingA: float, ratingB: float, scoreA: int, scoreB: int, disciplin: str) -> float:
+        """Rating points playerA wins from playerB in a single game."""
+        factorA, factorB = self.score_factors(scoreA, scoreB, disciplin)
+        calc_element = 1 / (1 + pow(10, ((ratingB - ratingA) / self.rating_factor)))
+        return self.k_factor * (factorA - calc_element * (factorA + factorB))
+
+    def rate_period(self, state, period):
+        # Every game depends on the result of the previous one, so this is sequential
+        state = state.copy()
+        for a, b, scoreA, scoreB, disciplin in zip(*period):
+            change = self.rating_change(state[a, 0], state[b, 0], int(scoreA), int(scoreB), disciplin)
+            state[a, 0] += change
+            state[b, 0] -= change
+        return state
+
+
+class Glicko2Model(RatingModel):
+    """Glicko-2 as described in http://www.glicko.net/glicko/glicko2.pdf.
+
+    All games of a period are rated at once against the ratings from the start of the
+    period, vectorized over all players. The share of racks won is used as game result.
+    Ratings and deviations are stored on the Glicko scale (1500 / 350).
+    """
+
+    name = "glicko2"
+    fields = ("rating", "deviation", "volatility")
+
+    def __init__(
+        self,
+        initial_rating: float = 1500.0,
+        initial_deviation: float = 350.0,
+        initial_volatility: float = 0.06,
+        tau: float = 0.5,
+        epsilon: float = 1e-6,
+    ):
+        self.initial_rating = initial_rating
+        self.initial_deviation = initial_deviation
+        self.initial_volatility = initial_volatility
+        self.tau = tau
+        self.epsilon = epsilon
+
+    def initial_state(self, players: int) -> np.ndarray:
+        import numpy as np
+
+        return np.tile([self.initial_rating, self.initial_deviation, self.initial_volatility], (players, 1)).astype(float)
+
+    @staticmethod
+    def _g(phi):
+        import numpy as np
+
+        return 1 / np.sqrt(1 + 3 * phi**2 / np.pi**2)
+
+    def expected_score(self, state, playerA, playerB):
+        import numpy as np
+
+        mu = (state[:, 0] - 1500) / GLICKO2_SCALE
+        phi = state[:, 1] / GLICKO2_SCALE
+        phi_combined = np.sqrt(phi[playerA] ** 2 + phi[playerB] ** 2)
+        return 1 / (1 + np.exp(-self._g(phi_combined) * (mu[playerA] - mu[playerB])))
+
+    def rate_period(self, state, period):
+        import numpy as np
+
+        mu = (state[:, 0] - 1500) / GLICKO2_SCALE
+        phi = state[:, 1] / GLICKO2_SCALE
+        sigma = state[:, 2]
+        players = len(state)
+
+        # Every game is one observation for each of both players
+        share = period.rack_share()
+        player = np.concatenate([period.playerA, period.playerB])
+        opponent = np.concatenate([period.playerB, period.playerA])
+        score = np.concatenate([share, 1 - share])
+
+        g = self._g(phi[opponent])
+        expected = 1 / (1 + np.exp(-g * (mu[player] - mu[opponent])))
+
+        information = np.bincount(player, weights=g**2 * expected * (1 - expected), minlength=players)
+        improvement = np.bincount(player, weights=g * (score - expected), minlength=players)
+
+        new_state = state.copy()
+
+        # Players without games only gain uncertainty
+        idle = information == 0
+        new_state[idle, 1] = np.sqrt(phi[idle] ** 2 + sigma[idle] ** 2) * GLICKO2_SCALE
+
+        active = ~idle
+        if active.any():
+            v = 1 / information[active]
+            delta = v * improvement[active]
+            new_sigma = self._volatility(sigma[active], phi[active], v, delta)
+
+            phi_star = np.sqrt(phi[active] ** 2 + new_sigma**2)
+            new_phi = 1 / np.sqrt(1 / phi_star**2 + 1 / v)
+            new_mu = mu[active] + new_phi**2 * improvement[active]
+
+            new_state[active, 0] = new_mu * GLICKO2_SCALE + 1500
+            new_state[active, 1] = new_phi * GLICKO2_SCALE
+            new_state[active, 2] = new_sigma
+
+        return new_state
+
+    def _volatility(self, sigma, phi, v, delta, max_iterations: int = 100):
+        """Step 5 of the paper (Illinois algorithm), solved for all players at once."""
+        import numpy as np
+
+        tau = self.tau
+        a = np.log(sigma**2)
+        excess = delta**2 - phi**2 - v
+
+        def f(x):
+            ex = np.exp(x)
+            return ex * (excess - ex) / (2 * (phi**2 + v + ex) ** 2) - (x - a) / tau**2
+
+        A = a.copy()
+        B = np.log(np.where(excess > 0, excess, 1.0))
+        low = excess <= 0
+        k = np.ones_like(a)
+        while low.any():
+            B = np.where(low, a - k * tau, B)
+            low &= f(B) < 0
+            k += 1
+
+        fA, fB = f(A), f(B)
+        for _ in range(max_iterations):
+            open_ = np.abs(B - A) > self.epsilon
+            if not open_.any():
+                break
+            C = A + (A - B) * fA / (fB - fA)
+            fC = f(C)
+            swap = fC * fB <= 0
+            A = np.where(open_ & swap, B, A)
+            fA = np.where(open_, np.where(swap, fB, fA / 2), fA)
+            B = np.where(open_, C, B)
+            fB = np.where(open_, fC, fB)
+
+        return np.exp(A / 2)
+
+
+MODELS = {model.name: model for model in (EloModel, Glicko2Model)}
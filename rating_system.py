@@ -1,69 +1,264 @@
+import csv
+import hashlib
 import logging
+import threading
+import time
 import zipfile
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from io import BytesIO
 from os import environ, remove
+from uuid import uuid4
 
-import dataframe_image as dfi
-import pandas as pd
 from dotenv import load_dotenv
-from fuzzywuzzy import fuzz, process
 from sentry_sdk import capture_exception
-from sqlalchemy import create_engine, func
+from sqlalchemy import and_, case, create_engine, event, func, insert, literal, or_, select, union_all, update
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import sessionmaker
 
-from models import Base, Game, Player, Rating
-from supabase import Client, create_client
+import read_models
+from models import (
+    DELETED_PLAYER_NAME,
+    DELETED_PLAYER_PHONE,
+    ArchivedGame,
+    Base,
+    Club,
+    Game,
+    ModelRating,
+    PairStats,
+    Player,
+    PlayerStats,
+    Rating,
+    RatingHistory,
+    RatingPeriod,
+    Season,
+    SeasonSummary,
+    deleted_player_id,
+    filter_by_club,
+    upgrade_schema,
+)
+from rating_models import Glicko2Model, Period, RatingModel
+from utils.duplicates import find_duplicates
 from utils.exceptions import *
+from utils.game_parser import ParsedGame
+from utils.log import configure_logging
+from utils.metrics import instrument_engine, measured, name_resolution_seconds, render_seconds, storage_upload_seconds
+from utils.player_import import ImportRow, similar_names
+from utils.read_routing import ReadYourWrites, current_user
+from utils.tenancy import DEFAULT_CLUB, Tenant, club_id, default_tenant, is_admin, tenant
 
 BASIS_POINTS = 50
+# Seconds after a write in which the reads of the same user go to the primary instead of the replica
+READ_YOUR_WRITES_SECONDS = float(environ.get("READ_YOUR_WRITES_SECONDS", 10))
+# Rows of the rating image, the styled export takes time quadratic in the rows and refuses more than 100
+RATING_IMAGE_ROWS = int(environ.get("RATING_IMAGE_ROWS", 100))
+# Seconds for which the registered clubs are cached
+CLUB_CACHE_SECONDS = float(environ.get("CLUB_CACHE_SECONDS", 60))
 
 
 class RatingSystem:
-    def __init__(self):
+    def __init__(self, engine=None, supabase=None, read_engine=None):
+        """The database engine and the Supabase client are created on first use,
+        unless they are passed in (e.g. a SQLite engine for benchmarks).
+
+        Read-only queries go to `read_engine`, or to the replica at SUPABASE_READ_HOST,
+        if there is one. For READ_YOUR_WRITES_SECONDS after a write the reads of the
+        writing user go to the primary, so a replica lag never hides their own change.
+        """
         load_dotenv()
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s %(levelname)s %(message)s",
-            force=True,
-        )
+        configure_logging()
+        self._lock = threading.Lock()
+        self._engine = engine
+        self._engine_ready = False
+        self._Session = None
+        self._read_engine = read_engine
+        self._read_engine_ready = False
+        self._ReadSession = None
+        self._writes = ReadYourWrites(READ_YOUR_WRITES_SECONDS)
+        self._supabase = supabase
+        # player id -> (history version, public url) of the last uploaded chart
+        self._charts = {}
+        # club id -> (leaderboard version, public url) of the last uploaded rating table
+        self._rating_images = {}
+        # (load time, clubs by WhatsApp phone number id, clubs by id)
+        self._clubs = (float("-inf"), {}, {})
+
+    @staticmethod
+    def _database_url(host_variable: str = "SUPABASE_HOST", port_variable: str = "SUPABASE_PORT") -> str:
         username = environ["SUPABASE_USER"]
         password = environ["SUPABASE_PASSWORD"]
-        host = environ["SUPABASE_HOST"]
-        port = environ["SUPABASE_PORT"]
+        host = environ[host_variable]
+        port = environ.get(port_variable) or environ["SUPABASE_PORT"]
         dbname = environ["SUPABASE_NAME"]
+        return f"postgresql+psycopg2://{username}:{password}@{host}:{port}/{dbname}"
+
+    @property
+    def engine(self):
+        if not self._engine_ready:
+            with self._lock:
+                if self._engine is None:
+                    # DATABASE_URL replaces the Supabase connection, e.g. a SQLite file for local runs
+                    self._engine = create_engine(environ.get("DATABASE_URL") or self._database_url())
+                if not self._engine_ready:
+                    Base.metadata.create_all(self._engine)
+                    upgrade_schema(self._engine)
+                    instrument_engine(self._engine)
+                    self._engine_ready = True
+        return self._engine
+
+    @property
+    def read_engine(self):
+        """The replica for read-only queries, the primary if no replica is configured."""
+        if not self._read_engine_ready:
+            engine = self.engine
+            with self._lock:
+                if self._read_engine is None:
+                    if environ.get("SUPABASE_READ_HOST"):
+                        self._read_engine = create_engine(self._database_url("SUPABASE_READ_HOST", "SUPABASE_READ_PORT"))
+                    else:
+                        self._read_engine = engine
+                if not self._read_engine_ready:
+                    # The schema is owned by the primary, the replica receives it through replication
+                    if self._read_engine is not engine:
+                        instrument_engine(self._read_engine)
+                    self._read_engine_ready = True
+        return self._read_engine
+
+    @property
+    def Session(self):
+        if self._Session is None:
+            engine = self.engine
+            with self._lock:
+                if self._Session is None:
+                    Session = sessionmaker(bind=engine)
+                    event.listen(Session, "do_orm_execute", filter_by_club)
+                    event.listen(Session, "after_commit", lambda session: self._writes.wrote(current_user.get()))
+                    self._Session = Session
+        return self._Session
+
+    @property
+    def ReadSession(self):
+        """Session for read-only queries: the replica, unless the current user wrote recently."""
+        Session = self.Session
+        if self._ReadSession is None:
+            engine = self.read_engine
+            with self._lock:
+                if self._ReadSession is None:
+                    if engine is self._engine:
+                        self._ReadSession = Session
+                    else:
+                        ReadSession = sessionmaker(bind=engine)
+                        event.listen(ReadSession, "do_orm_execute", filter_by_club)
+                        self._ReadSession = ReadSession
+        if self._ReadSession is not Session and self._writes.needs_primary(current_user.get()):
+            return Session
+        return self._ReadSession
+
+    @property
+    def supabase(self):
+        if self._supabase is None:
+            from supabase import create_client
+
+            with self._lock:
+                if self._supabase is None:
+                    url: str = environ["SUPABASE_URL"]
+                    key: str = environ["SUPABASE_KEY"]
+                    self._supabase = create_client(url, key)
+        return self._supabase
+
+    def _club_directory(self) -> tuple[dict, dict]:
+        """Registered clubs by WhatsApp phone number id and by id, reloaded every CLUB_CACHE_SECONDS."""
+        loaded_at, by_number, by_id = self._clubs
+        if time.monotonic() - loaded_at < CLUB_CACHE_SECONDS:
+            return by_number, by_id
+
+        session = self.ReadSession()
+        try:
+            by_number, by_id = {}, {DEFAULT_CLUB: default_tenant()}
+            for club in session.query(Club):
+                admins = frozenset(phone.strip() for phone in club.admins.split(",") if phone.strip())
+                by_id[club.id] = Tenant(club.id, club.name, club.caption or f"{club.name} Rating Tabelle", admins)
+                if club.phone_number_id:
+                    by_number[club.phone_number_id] = by_id[club.id]
+            self._clubs = (time.monotonic(), by_number, by_id)
+            return by_number, by_id
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
 
-        self.engine = create_engine(f"postgresql+psycopg2://{username}:{password}@{host}:{port}/{dbname}")
-        Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
+    def club_for(self, phone_number_id: str) -> Tenant:
+        """The club reached through the WhatsApp number, the default club if none is registered for it."""
+        by_number, by_id = self._club_directory()
+        return by_number.get(phone_number_id) or by_id[DEFAULT_CLUB]
 
-        url: str = environ["SUPABASE_URL"]
-        key: str = environ["SUPABASE_KEY"]
-        self.supabase: Client = create_client(url, key)
+    def get_club(self, club: str) -> Tenant:
+        by_number, by_id = self._club_directory()
+        if club not in by_id:
+            raise ClubNotFoundException(club)
+        return by_id[club]
 
-    def get_names(self):
+    def clubs(self) -> list[Tenant]:
+        return list(self._club_directory()[1].values())
+
+    @measured
+    def register_club(self, club: str, name: str, phone_number_id: str, admins: list[str], caption: str = None):
+        """Adds or updates a club. Messages to its WhatsApp number only see the club's players and games."""
         session = self.Session()
         try:
-            names = session.query(Player.name).all()
-            return [row[0] for row in names]
+            row = session.get(Club, club) or Club(id=club)
+            row.name = name
+            row.phone_number_id = phone_number_id
+            row.admins = ",".join(admins)
+            row.caption = caption
+            session.merge(row)
+            session.commit()
+            self._clubs = (float("-inf"), {}, {})
+            logging.info("Verein %s wurde registriert.", name)
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
+
+    @measured
+    def get_names(self):
+        session = self.ReadSession()
+        try:
+            return self._all_names(session)
         except Exception as e:
             session.rollback()
             capture_exception(e)
-            logging.error(f"Transaction failed: {e}")
+            logging.error("Transaction failed: %s", e)
         finally:
             session.close()
 
-    def find_closest_name(self, name) -> str:
-        logging.info(f"Suche nach Namen {name} in der Datenbank.")
+    @staticmethod
+    def _all_names(session) -> list[str]:
+        """Names of all players, writes resolve names with their own session on the primary."""
+        return read_models.player_names(session)
+
+    @measured
+    def find_closest_name(self, name, names: list[str] = None) -> str:
+        from fuzzywuzzy import fuzz, process
 
-        matches = process.extractOne(name, self.get_names(), score_cutoff=75, scorer=fuzz.token_sort_ratio)
+        logging.info("Suche nach Namen %s in der Datenbank.", name)
+
+        names = names if names is not None else self.get_names()
+        with name_resolution_seconds.time():
+            matches = process.extractOne(name, names, score_cutoff=75, scorer=fuzz.token_sort_ratio)
         if matches:
-            logging.info(matches)
+            logging.info("Gefundener Name: %s", matches)
             return matches[0]
         else:
-            logging.info(f"Name {name} konnte nicht in der Datenbank gefunden werden.")
+            logging.info("Name %s konnte nicht in der Datenbank gefunden werden.", name)
             raise PlayerNotFoundException(name)
 
+    @measured
     def add_player(
         self,
         name: str,
@@ -73,57 +268,143 @@ class RatingSystem:
         try:
             existing_player = session.query(Player).filter_by(phone_number=phone_number).first()
             if existing_player:
-                logging.info(f"Spieler {existing_player.name} bereits in der Datenbank vorhanden.")
+                logging.info("Spieler %s bereits in der Datenbank vorhanden.", existing_player.name)
                 raise PlayerAlreadyExistsException(existing_player.name)
 
             new_player = Player(name=name, phone_number=phone_number)
 
             session.add(new_player)
             session.commit()
-            logging.info(f"Neuer Spieler {name} wurde zur Datenbank hinzugefügt.")
+            logging.info("Neuer Spieler %s wurde zur Datenbank hinzugefügt.", name)
         except Exception as e:
             session.rollback()
             capture_exception(e)
-            logging.error(f"Transaction failed: {e}")
+            logging.error("Transaction failed: %s", e)
             raise e
         finally:
             session.close()
 
+    @measured
+    def import_players(self, rows: list[ImportRow], phone_number: str) -> dict:
+        """Adds many players with their rating in one transaction.
+
+        Rows whose phone number already exists or whose name is very similar to an existing
+        (or earlier imported) name are skipped and reported instead.
+        """
+        if not is_admin(phone_number):
+            raise AdminPermissionException()
+
+        session = self.Session()
+        try:
+            phones = [row.phone_number for row in rows]
+            existing_phones = dict(
+                session.query(Player.phone_number, Player.name).filter(Player.phone_number.in_(phones)).all() if phones else []
+            )
+            existing = [(row.line, existing_phones[row.phone_number]) for row in rows if row.phone_number in existing_phones]
+            rows = [row for row in rows if row.phone_number not in existing_phones]
+
+            existing_names = self._all_names(session)
+            similar = similar_names([row.name for row in rows], existing_names)
+
+            new_rows = [row for i, row in enumerate(rows) if i not in similar]
+            now = datetime.now()
+            players = [{"id": uuid4(), "name": row.name, "phone_number": row.phone_number} for row in new_rows]
+            if players:
+                session.execute(insert(Player), players)
+                session.execute(
+                    insert(Rating),
+                    [
+                        {"player": player["id"], "rating": BASIS_POINTS, "games_won": 0, "games_lost": 0, "last_change": now}
+                        for player in players
+                    ],
+                )
+            session.commit()
+            logging.info("%s Spieler importiert, %s übersprungen.", len(players), len(phones) - len(players))
+
+            return {
+                "added": [row.name for row in new_rows],
+                "existing": existing,
+                "similar": [(rows[i].line, rows[i].name, name, score) for i, (name, score) in sorted(similar.items())],
+            }
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
+
+    @measured
     def delete_player(self, phone_number: str, name: str = None):
         session = self.Session()
         try:
-            if phone_number == environ["ADMIN_PHONE_NUMBER"] and name:
-                logging.info(f"Admin löscht Spieler {name}.")
-                player = session.query(Player).filter_by(name=name).first()
+            if is_admin(phone_number) and name:
+                logging.info("Admin löscht Spieler %s.", name)
+                player = (
+                    session.query(Player.id, Player.name)
+                    .filter(Player.name == name, Player.phone_number != DELETED_PLAYER_PHONE)
+                    .first()
+                )
 
                 if not player:
                     raise PlayerNotFoundException(name)
 
-                session.delete(player)
-                session.commit()
-                logging.info(f"Spielereintrag für {player.name} aus der Datenbank gelöscht.")
-
             else:
-                logging.info(f"Suche {phone_number} in der Datenbank.")
-                player = session.query(Player).filter_by(phone_number=phone_number).first()
+                logging.info("Suche %s in der Datenbank.", phone_number)
+                player = session.query(Player.id, Player.name).filter_by(phone_number=phone_number).first()
                 if not player:
                     raise PlayerNotFoundException(f"mit Handynummer: {phone_number}")
-                logging.info(f"Spieler {player.name} in der Datenbank gefunden.")
+                logging.info("Spieler %s in der Datenbank gefunden.", player.name)
 
-                name = player.name
-
-                session.delete(player)
-                session.commit()
-                logging.info(f"Spielereintrag für {player.name} aus der Datenbank gelöscht.")
-                return name
+            anonymized = self._remove_player(session, player.id)
+            session.commit()
+            logging.info("Spielereintrag für %s aus der Datenbank gelöscht, %s Spiele anonymisiert.", player.name, anonymized)
+            return player.name
         except Exception as e:
             session.rollback()
             capture_exception(e)
-            logging.error(f"Transaction failed: {e}")
+            logging.error("Transaction failed: %s", e)
             raise e
         finally:
             session.close()
 
+    @staticmethod
+    def _deleted_player(session):
+        """Id of the placeholder of the club that takes over the games of deleted players, created on first use."""
+        placeholder = deleted_player_id(club_id())
+        if session.get(Player, placeholder):
+            return placeholder
+        session.execute(
+            insert(Player).values(id=placeholder, club=club_id(), name=DELETED_PLAYER_NAME, phone_number=DELETED_PLAYER_PHONE)
+        )
+        return placeholder
+
+    def _remove_player(self, session, player) -> int:
+        """Deletes the player with a fixed number of statements, however many games were played.
+
+        The games, archived ones included, are kept and moved to the placeholder, so the
+        opponents keep their results and ratings. The rating, the statistics, the rating
+        history and the season summaries of the player are deleted. Returns the number of
+        anonymized games.
+        """
+        placeholder = self._deleted_player(session)
+        anonymized = 0
+        for model in (Game, ArchivedGame):
+            for column in (model.playerA, model.playerB):
+                anonymized += session.execute(
+                    update(model).where(column == player).values({column: placeholder}),
+                    execution_options={"synchronize_session": False},
+                ).rowcount
+
+        for model in (Rating, PlayerStats, RatingHistory, ModelRating, SeasonSummary):
+            session.query(model).filter(model.player == player).delete(synchronize_session=False)
+        session.query(PairStats).filter(or_(PairStats.playerA == player, PairStats.playerB == player)).delete(
+            synchronize_session=False
+        )
+        session.query(Player).filter(Player.id == player).delete(synchronize_session=False)
+        return anonymized
+
+    @measured
     def add_player_to_rating(self, phone_number: str):
         session = self.Session()
         try:
@@ -135,7 +416,7 @@ class RatingSystem:
             existing_rating = session.query(Rating).filter_by(player=player.id).first()
 
             if existing_rating:
-                logging.info(f"Spieler {player.name} bereits im Rating.")
+                logging.info("Spieler %s bereits im Rating.", player.name)
                 raise PlayerAlreadyInRatingException(player.name)
 
             new_rating = Rating(
@@ -148,15 +429,16 @@ class RatingSystem:
 
             session.add(new_rating)
             session.commit()
-            logging.info(f"Spieler {player.name} zum Rating hinzugefügt.")
+            logging.info("Spieler %s zum Rating hinzugefügt.", player.name)
         except Exception as e:
             session.rollback()
             capture_exception(e)
-            logging.error(f"Transaction failed: {e}")
+            logging.error("Transaction failed: %s", e)
             raise e
         finally:
             session.close()
 
+    @measured
     def delete_player_from_rating(self, phone_number: str):
         session = self.Session()
         try:
@@ -168,32 +450,93 @@ class RatingSystem:
             existing_rating = session.query(Rating).filter_by(player=player.id).first()
 
             if not existing_rating:
-                logging.info(f"Spieler {player.name} nicht im Rating.")
+                logging.info("Spieler %s nicht im Rating.", player.name)
                 raise PlayerNotInRatingException(player.name)
 
             session.query(Rating).filter_by(player=player.id).delete()
             session.commit()
-            logging.info(f"Spieler {player.name} aus dem Rating gelöscht.")
+            logging.info("Spieler %s aus dem Rating gelöscht.", player.name)
         except Exception as e:
             session.rollback()
             capture_exception(e)
-            logging.error(f"Transaction failed: {e}")
+            logging.error("Transaction failed: %s", e)
             raise e
         finally:
             session.close()
 
+    @measured
     def add_games(self, playerA, playerB, scores, game_type, phone_number) -> list[tuple[str, float]]:
-        changes = []
-        for score1, score2 in scores:
-            id, rating_change = self.add_game(playerA, playerB, score1, score2, game_type, phone_number)
-            changes.append((id, rating_change))
-        return changes
+        games = [ParsedGame(0, game_type, playerA, playerB, score1, score2) for score1, score2 in scores]
+        return [(game_id, rating_change) for game_id, *_, rating_change in self.add_game_batch(games, phone_number)]
+
+    @measured
+    def add_game_batch(self, games: list[ParsedGame], phone_number: str) -> list[tuple[str, str, str, int, int, float]]:
+        """Adds all games of a message in one transaction, either all of them or none.
+
+        Every name is resolved once against a single lookup of all names. The session is
+        flushed after every game, so the next game is rated with the updated ratings.
+        Returns (id, playerA, playerB, scoreA, scoreB, rating change) per game.
+        """
+        session = self.Session()
+        try:
+            all_names = self._all_names(session)
+            resolved = {}
+            for game in games:
+                for name in (game.nameA, game.nameB):
+                    if name not in resolved:
+                        resolved[name] = self.find_closest_name(name, all_names)
+
+            players = {player.name: player for player in session.query(Player).filter(Player.name.in_(set(resolved.values())))}
+            rated = {
+                player for (player,) in session.query(Rating.player).filter(Rating.player.in_([p.id for p in players.values()]))
+            }
+
+            admin = is_admin(phone_number)
+            for game in games:
+                playerA, playerB = players[resolved[game.nameA]], players[resolved[game.nameB]]
+                if not admin and phone_number not in (playerA.phone_number, playerB.phone_number):
+                    raise PlayerNotInGameException()
+                missing = [player.name for player in (playerA, playerB) if player.id not in rated]
+                if missing:
+                    raise PlayerNotInRatingException(*missing)
+
+            results = []
+            for game in games:
+                playerA, playerB = players[resolved[game.nameA]], players[resolved[game.nameB]]
+                new_game = Game(
+                    playerA=playerA.id,
+                    playerB=playerB.id,
+                    scoreA=game.scoreA,
+                    scoreB=game.scoreB,
+                    race_to=max(game.scoreA, game.scoreB),
+                    disciplin=game.disciplin,
+                    session=session,
+                )
+                session.add(new_game)
+                self._update_statistics(session, new_game)
+                # The rating triggers run on flush, the next game reads the updated ratings
+                session.flush()
+                results.append((new_game.id, playerA.name, playerB.name, game.scoreA, game.scoreB, new_game.rating_change))
+
+            self._record_ratings(session, *{player.id for player in players.values()})
+            session.commit()
+            logging.info("%s Spiele in einem Batch hinzugefügt.", len(results))
+            return results
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
 
+    @measured
     def add_game(self, playerA_name, playerB_name, scoreA, scoreB, game_type, phone_number) -> tuple[str, float]:
         session = self.Session()
         try:
-            playerA_name = self.find_closest_name(playerA_name)
-            playerB_name = self.find_closest_name(playerB_name)
+            all_names = self._all_names(session)
+            playerA_name = self.find_closest_name(playerA_name, all_names)
+            playerB_name = self.find_closest_name(playerB_name, all_names)
 
             playerA = session.query(Player).filter_by(name=playerA_name).first()
             playerB = session.query(Player).filter_by(name=playerB_name).first()
@@ -205,8 +548,8 @@ class RatingSystem:
             elif not playerB:
                 raise PlayerNotFoundException(playerB_name)
 
-            if phone_number == environ["ADMIN_PHONE_NUMBER"]:
-                logging.info(f"Admin {phone_number} fügt Spiel hinzu.")
+            if is_admin(phone_number):
+                logging.info("Admin %s fügt Spiel hinzu.", phone_number)
             else:
                 # Check if the player adding the game is one of the players
                 if playerA.phone_number != phone_number and playerB.phone_number != phone_number:
@@ -231,20 +574,27 @@ class RatingSystem:
                 session=session,
             )
             session.add(new_game)
+            self._update_statistics(session, new_game)
+            self._record_ratings(session, playerA.id, playerB.id)
             session.commit()
             logging.info(
-                f"Neues Spiel hinzugefügt (ID: {new_game.id}) zwischen {playerA_name} und {playerB_name}\nRating change {new_game.rating_change}."
+                "Neues Spiel hinzugefügt (ID: %s) zwischen %s und %s\nRating change %s.",
+                new_game.id,
+                playerA_name,
+                playerB_name,
+                new_game.rating_change,
             )
 
             return (str(new_game.id), new_game.rating_change)
         except Exception as e:
             session.rollback()
             capture_exception(e)
-            logging.error(f"Transaction failed: {e}")
+            logging.error("Transaction failed: %s", e)
             raise e
         finally:
             session.close()
 
+    @measured
     def delete_game(self, game_id: str, phone_number: str):
         session = self.Session()
         try:
@@ -261,8 +611,8 @@ class RatingSystem:
                 raise GameTooOldException(game_id)
             """
 
-            if phone_number == environ["ADMIN_PHONE_NUMBER"]:
-                logging.info(f"Admin {phone_number} löscht Spiel.")
+            if is_admin(phone_number):
+                logging.info("Admin %s löscht Spiel.", phone_number)
             else:
                 if (not playerA or playerA.phone_number != phone_number) and (
                     not playerB or playerB.phone_number != phone_number
@@ -276,25 +626,649 @@ class RatingSystem:
             ):
                 raise PlayerNotInRatingException(playerA.name, playerB.name)
 
+            self._update_statistics(session, game, sign=-1)
             session.query(Game).filter_by(id=game_id).delete()
             # Ratings should be updated in the after_delete_game event
+            self._record_ratings(session, game.playerA, game.playerB)
+            session.commit()
+            logging.info("Spiel mit ID %s gelöscht.", game_id)
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
+
+    def _update_statistics(self, session, game: Game, sign: int = 1):
+        """Adds (sign=1) or removes (sign=-1) a game from the player and head-to-head statistics."""
+        played = game.created_at.date() if isinstance(game.created_at, datetime) else game.created_at
+
+        sides = [
+            (game.playerA, game.scoreA, game.scoreB, game.rating_change),
+            (game.playerB, game.scoreB, game.scoreA, -game.rating_change),
+        ]
+        for player, won, lost, change in sides:
+            stats = session.get(PlayerStats, player, with_for_update=True)
+            if not stats:
+                stats = PlayerStats(player=player, games=0, games_won=0, racks_won=0, racks_lost=0, rating_exchanged=0.0)
+                session.add(stats)
+            stats.games += sign
+            stats.games_won += sign * int(won > lost)
+            stats.racks_won += sign * won
+            stats.racks_lost += sign * lost
+            stats.rating_exchanged += sign * change
+            if sign > 0 and (not stats.last_played or played > stats.last_played):
+                stats.last_played = played
+
+        # The pair is stored once, from the perspective of the smaller id
+        if game.playerA < game.playerB:
+            first, second = sides
+        else:
+            second, first = sides
+        pair = session.get(PairStats, (first[0], second[0]), with_for_update=True)
+        if not pair:
+            pair = PairStats(
+                playerA=first[0], playerB=second[0], games=0, games_wonA=0, games_wonB=0, racksA=0, racksB=0, rating_exchanged=0.0
+            )
+            session.add(pair)
+        pair.games += sign
+        pair.games_wonA += sign * int(first[1] > first[2])
+        pair.games_wonB += sign * int(second[1] > second[2])
+        pair.racksA += sign * first[1]
+        pair.racksB += sign * second[1]
+        pair.rating_exchanged += sign * first[3]
+        if sign > 0 and (not pair.last_played or played > pair.last_played):
+            pair.last_played = played
+
+    def _record_ratings(self, session, *players):
+        """Appends the current ratings of the players to their rating history."""
+        if not players:
+            return
+        # Flush first, the database triggers update the ratings of added and deleted games
+        session.flush()
+        current = session.query(Rating.player, Rating.rating).filter(Rating.player.in_(players)).all()
+        # One locking select for all histories, the flush writes the changed rows as one executemany
+        histories = {
+            history.player: history
+            for history in session.query(RatingHistory).filter(RatingHistory.player.in_(players)).with_for_update()
+        }
+        today = date.today()
+        for player, rating in current:
+            history = histories.get(player)
+            if not history:
+                history = RatingHistory(player=player, days=b"", ratings=b"", version=0)
+                session.add(history)
+            history.append(today, rating)
+
+    @measured
+    def rating_chart(self, phone_number: str) -> str:
+        """Renders the rating progression of a player and returns the public url of the image.
+        A chart is uploaded once per history version, later requests are served from the cache.
+        """
+        session = self.ReadSession()
+        try:
+            player = session.query(Player).filter_by(phone_number=phone_number).first()
+            if not player:
+                raise PlayerNotFoundException(f"mit Handynummer: {phone_number}")
+
+            history = session.get(RatingHistory, player.id)
+            if not history or not history.version:
+                raise PlayerHasNoHistoryException(player.name)
+
+            cached = self._charts.get(player.id)
+            if cached and cached[0] == history.version:
+                return cached[1]
+
+            image = self._render_rating_chart(player.name, *history.points())
+
+            storage = self.supabase.storage
+            try:
+                storage.create_bucket("history", options={"public": True})
+                logging.info("Ein neuer Bucket für die Rating-Verläufe wurde erstellt.")
+            except:
+                logging.debug("Bucket für die Rating-Verläufe bereits vorhanden.")
+
+            history_bucket = storage.from_("history")
+            path = f"{player.id}_{history.version}.png"
+            with storage_upload_seconds.time(bucket="history"):
+                history_bucket.upload(path=path, file=image, file_options={"content-type": "image/png", "upsert": "true"})
+            url = history_bucket.get_public_url(path)
+
+            # Only the latest chart of a player is kept
+            if cached:
+                try:
+                    history_bucket.remove([f"{player.id}_{cached[0]}.png"])
+                except Exception as e:
+                    logging.warning("Alter Rating-Verlauf von %s konnte nicht gelöscht werden: %s", player.name, e)
+
+            self._charts[player.id] = (history.version, url)
+            logging.info("Rating-Verlauf von %s wurde exportiert (Version %s).", player.name, history.version)
+            return url
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
+
+    @staticmethod
+    def _render_rating_chart(name, days, ratings) -> bytes:
+        import matplotlib
+
+        matplotlib.use("Agg")
+        import matplotlib.dates as mdates
+        import matplotlib.pyplot as plt
+
+        dates = [date.fromordinal(day) for day in days]
+
+        with render_seconds.time(image="history"):
+            fig, ax = plt.subplots(figsize=(6, 3), dpi=100)
+            try:
+                ax.plot(dates, ratings, color="#2A9D8F", marker="o" if len(dates) < 30 else None, markersize=3)
+                ax.set_title(f"Rating-Verlauf von {name}")
+                ax.set_ylabel("Rating")
+                ax.grid(alpha=0.3)
+                ax.xaxis.set_major_formatter(mdates.DateFormatter("%d.%m.%y"))
+                fig.autofmt_xdate()
+                fig.tight_layout()
+
+                buffer = BytesIO()
+                fig.savefig(buffer, format="png")
+                return buffer.getvalue()
+            finally:
+                plt.close(fig)
+
+    @measured
+    def get_statistics(self, phone_number: str, opponent_name: str = None) -> dict:
+        """Statistics of the player with the phone number over all seasons, the closed seasons
+        one by one and, optionally, against an opponent."""
+        session = self.ReadSession()
+        try:
+            player = session.query(Player).filter_by(phone_number=phone_number).first()
+            if not player:
+                raise PlayerNotFoundException(f"mit Handynummer: {phone_number}")
+
+            stats = session.get(PlayerStats, player.id)
+            result = {
+                "name": player.name,
+                "games": stats.games if stats else 0,
+                "games_won": stats.games_won if stats else 0,
+                "racks_won": stats.racks_won if stats else 0,
+                "racks_lost": stats.racks_lost if stats else 0,
+                "rating_exchanged": stats.rating_exchanged if stats else 0.0,
+                "last_played": stats.last_played if stats else None,
+            }
+
+            seasons = (
+                session.query(SeasonSummary, Season.cutoff)
+                .join(Season, Season.name == SeasonSummary.season)
+                .filter(SeasonSummary.player == player.id)
+                .order_by(Season.cutoff)
+            )
+            result["seasons"] = [
+                {
+                    "season": summary.season,
+                    "cutoff": cutoff,
+                    "games": summary.games,
+                    "games_won": summary.games_won,
+                    "racks_won": summary.racks_won,
+                    "racks_lost": summary.racks_lost,
+                    "rating_exchanged": summary.rating_exchanged,
+                    "rating": summary.rating,
+                }
+                for summary, cutoff in seasons
+                if summary.games
+            ]
+
+            if opponent_name:
+                opponent_name = self.find_closest_name(opponent_name)
+                opponent = session.query(Player).filter_by(name=opponent_name).first()
+                if not opponent:
+                    raise PlayerNotFoundException(opponent_name)
+
+                is_first = player.id < opponent.id
+                key = (player.id, opponent.id) if is_first else (opponent.id, player.id)
+                pair = session.get(PairStats, key)
+                result["opponent"] = {
+                    "name": opponent.name,
+                    "games": pair.games if pair else 0,
+                    "games_won": (pair.games_wonA if is_first else pair.games_wonB) if pair else 0,
+                    "games_lost": (pair.games_wonB if is_first else pair.games_wonA) if pair else 0,
+                    "racks_won": (pair.racksA if is_first else pair.racksB) if pair else 0,
+                    "racks_lost": (pair.racksB if is_first else pair.racksA) if pair else 0,
+                    "rating_exchanged": (pair.rating_exchanged if is_first else -pair.rating_exchanged) if pair else 0.0,
+                    "last_played": pair.last_played if pair else None,
+                }
+
+            return result
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
+
+    @measured
+    def rebuild_statistics(self, phone_number=None):
+        """Recomputes all player and head-to-head statistics from the games table."""
+        session = self.Session()
+        try:
+            if phone_number and not is_admin(phone_number):
+                raise AdminPermissionException()
+
+            self._rebuild_statistics(session)
+            session.commit()
+            logging.info("Statistiken wurden neu berechnet.")
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
+
+    def _rebuild_statistics(self, session):
+        """Replaces both statistics tables from the games of all seasons, the caller commits.
+        The placeholder of deleted players gets no statistics, its opponents keep the games in their totals.
+        """
+        placeholder = deleted_player_id(club_id())
+        players, pairs = {}, {}
+        games = union_all(
+            *(
+                select(model.playerA, model.playerB, model.scoreA, model.scoreB, model.rating_change, model.created_at)
+                for model in (Game, ArchivedGame)
+            )
+        )
+        rows = session.execute(games, execution_options={"yield_per": 10000})
+        for playerA, playerB, scoreA, scoreB, rating_change, created_at in rows:
+            sides = [(playerA, scoreA, scoreB, rating_change), (playerB, scoreB, scoreA, -rating_change)]
+            for player, won, lost, change in sides:
+                if player == placeholder:
+                    continue
+                stats = players.setdefault(
+                    player,
+                    {"player": player, "games": 0, "games_won": 0, "racks_won": 0, "racks_lost": 0, "rating_exchanged": 0.0},
+                )
+                stats["games"] += 1
+                stats["games_won"] += int(won > lost)
+                stats["racks_won"] += won
+                stats["racks_lost"] += lost
+                stats["rating_exchanged"] += change
+                stats["last_played"] = max(stats.get("last_played") or created_at, created_at)
+
+            if placeholder in (playerA, playerB):
+                continue
+            first, second = sides if playerA < playerB else sides[::-1]
+            pair = pairs.setdefault(
+                (first[0], second[0]),
+                {
+                    "playerA": first[0],
+                    "playerB": second[0],
+                    "games": 0,
+                    "games_wonA": 0,
+                    "games_wonB": 0,
+                    "racksA": 0,
+                    "racksB": 0,
+                    "rating_exchanged": 0.0,
+                },
+            )
+            pair["games"] += 1
+            pair["games_wonA"] += int(first[1] > first[2])
+            pair["games_wonB"] += int(second[1] > second[2])
+            pair["racksA"] += first[1]
+            pair["racksB"] += second[1]
+            pair["rating_exchanged"] += first[3]
+            pair["last_played"] = max(pair.get("last_played") or created_at, created_at)
+
+        # Only the statistics of the club's players are replaced
+        players_of_club = select(Player.id).where(Player.club == club_id())
+        session.query(PairStats).filter(PairStats.playerA.in_(players_of_club)).delete(synchronize_session=False)
+        session.query(PlayerStats).filter(PlayerStats.player.in_(players_of_club)).delete(synchronize_session=False)
+        if players:
+            session.execute(insert(PlayerStats), list(players.values()))
+        if pairs:
+            session.execute(insert(PairStats), list(pairs.values()))
+
+    @measured
+    def find_duplicate_players(self, phone_number: str) -> list[dict]:
+        """Pairs of players whose names likely belong to the same person, with their number of games."""
+        if not is_admin(phone_number):
+            raise AdminPermissionException()
+
+        session = self.ReadSession()
+        try:
+            players = session.query(Player.id, Player.name).filter(Player.phone_number != DELETED_PLAYER_PHONE).all()
+            games = dict(session.query(PlayerStats.player, PlayerStats.games).all())
+
+            return [
+                {
+                    "names": (players[i].name, players[j].name),
+                    "games": (games.get(players[i].id, 0), games.get(players[j].id, 0)),
+                    "score": score,
+                }
+                for i, j, score in find_duplicates([player.name for player in players])
+            ]
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
+
+    @measured
+    def merge_players(self, canonical_name: str, duplicate_name: str, phone_number: str) -> dict:
+        """Moves all games of the duplicate to the canonical player and removes the duplicate.
+
+        Games between both are deleted, in archived seasons as well. The merged rating
+        keeps the rating changes of both players: canonical + duplicate - BASIS_POINTS.
+        Wins, losses and the statistics are recounted from the games, all in one transaction.
+        """
+        if not is_admin(phone_number):
+            raise AdminPermissionException()
+
+        session = self.Session()
+        try:
+            # Exact names, the fuzzy lookup is what duplicates make ambiguous
+            canonical = session.query(Player).filter_by(name=canonical_name.strip()).first()
+            duplicate = session.query(Player).filter_by(name=duplicate_name.strip()).first()
+            if not canonical or not duplicate:
+                raise PlayerNotFoundException(
+                    *[name for name, player in ((canonical_name, canonical), (duplicate_name, duplicate)) if not player]
+                )
+            if canonical.id == duplicate.id:
+                raise ValueError("Die Spieler sind identisch.")
+
+            canonical_rating = session.get(Rating, canonical.id, with_for_update=True)
+            duplicate_rating = session.get(Rating, duplicate.id, with_for_update=True)
+            if not canonical_rating:
+                raise PlayerNotInRatingException(canonical.name)
+            # Read before any game changes, the database triggers update the ratings on delete
+            merged_rating = canonical_rating.rating + (duplicate_rating.rating - BASIS_POINTS if duplicate_rating else 0)
+            last_change = max(filter(None, [canonical_rating.last_change, duplicate_rating and duplicate_rating.last_change]))
+
+            # Archived games move as well, so statistics over all seasons stay correct
+            deleted = moved = won = played = 0
+            for model in (Game, ArchivedGame):
+                mutual = session.query(model).filter(
+                    or_(
+                        and_(model.playerA == canonical.id, model.playerB == duplicate.id),
+                        and_(model.playerA == duplicate.id, model.playerB == canonical.id),
+                    )
+                )
+                removed = mutual.delete(synchronize_session=False)
+                reassigned = (
+                    session.query(model)
+                    .filter(model.playerA == duplicate.id)
+                    .update({model.playerA: canonical.id}, synchronize_session=False)
+                )
+                reassigned += (
+                    session.query(model)
+                    .filter(model.playerB == duplicate.id)
+                    .update({model.playerB: canonical.id}, synchronize_session=False)
+                )
+                if model is Game:
+                    deleted, moved = removed, reassigned
+
+                won += (
+                    session.query(func.count(model.id))
+                    .filter(
+                        or_(
+                            and_(model.playerA == canonical.id, model.scoreA > model.scoreB),
+                            and_(model.playerB == canonical.id, model.scoreB > model.scoreA),
+                        )
+                    )
+                    .scalar()
+                )
+                played += (
+                    session.query(func.count(model.id))
+                    .filter(or_(model.playerA == canonical.id, model.playerB == canonical.id))
+                    .scalar()
+                )
+
+            self._merge_season_summaries(session, canonical.id, duplicate.id)
+
+            session.flush()
+            session.refresh(canonical_rating)
+            canonical_rating.rating = merged_rating
+            canonical_rating.games_won = won
+            canonical_rating.games_lost = played - won
+            canonical_rating.winning_quote = won / played if played else None
+            canonical_rating.last_change = last_change
+
+            for model in (Rating, PlayerStats, RatingHistory):
+                session.query(model).filter(model.player == duplicate.id).delete(synchronize_session=False)
+            session.query(ModelRating).filter(ModelRating.player == duplicate.id).delete(synchronize_session=False)
+            session.query(PairStats).filter(or_(PairStats.playerA == duplicate.id, PairStats.playerB == duplicate.id)).delete(
+                synchronize_session=False
+            )
+            session.query(Player).filter(Player.id == duplicate.id).delete(synchronize_session=False)
+
+            self._rebuild_statistics(session)
+            self._record_ratings(session, canonical.id)
+            names = (canonical.name, duplicate.name)
             session.commit()
-            logging.info(f"Spiel mit ID {game_id} gelöscht.")
+            logging.info(
+                "Spieler %s wurde mit %s zusammengeführt (%s Spiele übernommen, %s gelöscht).", names[1], names[0], moved, deleted
+            )
+            return {"name": names[0], "rating": merged_rating, "moved": moved, "deleted": deleted}
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
+
+    @measured
+    def archive_season(self, season: str, cutoff: date, phone_number: str) -> dict:
+        """Closes a season: moves all games played before the cutoff to `archived_games`.
+
+        Leaves a summary row per player and a checkpoint of every rating. The ratings,
+        the rating history and the statistics over all games are not changed. The games
+        are copied with one INSERT ... SELECT and removed with one DELETE, in one transaction.
+        """
+        if not is_admin(phone_number):
+            raise AdminPermissionException()
+
+        session = self.Session()
+        try:
+            season = season.strip()
+            if not season:
+                raise ValueError("Bitte einen Namen für die Saison angeben.")
+            if session.get(Season, (club_id(), season)):
+                raise ValueError(f"Die Saison {season} existiert bereits.")
+
+            before_cutoff = Game.created_at < cutoff
+            count = session.query(func.count(Game.id)).filter(before_cutoff).scalar()
+            if not count:
+                raise ValueError(f"Keine Spiele vor dem {cutoff:%d.%m.%Y} vorhanden.")
+
+            # Read before any game is deleted, the database triggers update the ratings on delete
+            checkpoint = [
+                dict(row._mapping)
+                for row in session.query(
+                    Rating.player, Rating.rating, Rating.winning_quote, Rating.games_won, Rating.games_lost, Rating.last_change
+                ).with_for_update()
+            ]
+
+            session.add(Season(name=season, cutoff=cutoff, games=count))
+            session.flush()
+            columns = [
+                "id",
+                "club",
+                "playerA",
+                "playerB",
+                "scoreA",
+                "scoreB",
+                "race_to",
+                "disciplin",
+                "rating_change",
+                "created_at",
+            ]
+            session.execute(
+                insert(ArchivedGame).from_select(
+                    columns + ["season"],
+                    select(*(getattr(Game, column) for column in columns), literal(season)).where(
+                        Game.club == club_id(), before_cutoff
+                    ),
+                )
+            )
+            summaries = self._season_summaries(session, season, {row["player"]: row["rating"] for row in checkpoint})
+            if summaries:
+                session.execute(insert(SeasonSummary), summaries)
+
+            session.query(Game).filter(before_cutoff).delete(synchronize_session=False)
+            session.flush()
+            if checkpoint:
+                session.execute(update(Rating), checkpoint)
+
+            session.commit()
+            logging.info("Saison %s mit %s Spielen vor dem %s archiviert.", season, count, cutoff)
+            return {"season": season, "games": count, "players": sum(1 for row in summaries if row["games"])}
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
+
+    @staticmethod
+    def _season_summaries(session, season: str, ratings: dict) -> list[dict]:
+        """Summary rows of a season from its archived games, with the rating of every player in `ratings`."""
+
+        def summary(player, rating=None):
+            return {
+                "season": season,
+                "player": player,
+                "games": 0,
+                "games_won": 0,
+                "racks_won": 0,
+                "racks_lost": 0,
+                "rating_exchanged": 0.0,
+                "rating": rating,
+            }
+
+        summaries = {player: summary(player, rating) for player, rating in ratings.items()}
+        sides = [
+            (ArchivedGame.playerA, ArchivedGame.scoreA, ArchivedGame.scoreB, ArchivedGame.rating_change),
+            (ArchivedGame.playerB, ArchivedGame.scoreB, ArchivedGame.scoreA, -ArchivedGame.rating_change),
+        ]
+        for player, won, lost, change in sides:
+            rows = (
+                session.query(
+                    player,
+                    func.count(),
+                    func.sum(case((won > lost, 1), else_=0)),
+                    func.sum(won),
+                    func.sum(lost),
+                    func.sum(change),
+                )
+                .filter(ArchivedGame.season == season)
+                .group_by(player)
+            )
+            for player_id, games, games_won, racks_won, racks_lost, rating_exchanged in rows:
+                totals = summaries.setdefault(player_id, summary(player_id))
+                totals["games"] += games
+                totals["games_won"] += games_won or 0
+                totals["racks_won"] += racks_won or 0
+                totals["racks_lost"] += racks_lost or 0
+                totals["rating_exchanged"] += rating_exchanged or 0.0
+        return list(summaries.values())
+
+    def _merge_season_summaries(self, session, canonical, duplicate):
+        """Recounts the closed seasons of a duplicate after its archived games were moved to the canonical player."""
+        seasons = [season for (season,) in session.query(SeasonSummary.season).filter(SeasonSummary.player == duplicate)]
+        for season in seasons:
+            ratings = dict(session.query(SeasonSummary.player, SeasonSummary.rating).filter(SeasonSummary.season == season))
+            duplicate_rating = ratings.pop(duplicate)
+            if duplicate_rating is not None:
+                canonical_rating = ratings.get(canonical)
+                ratings[canonical] = (
+                    duplicate_rating if canonical_rating is None else canonical_rating + duplicate_rating - BASIS_POINTS
+                )
+            else:
+                ratings.setdefault(canonical, None)
+
+            session.query(SeasonSummary).filter(SeasonSummary.season == season).delete(synchronize_session=False)
+            session.execute(insert(SeasonSummary), self._season_summaries(session, season, ratings))
+
+    @measured
+    def leaderboard_version(self) -> str:
+        """Fingerprint of the rating table, changes whenever a rating or a result changes.
+        The sum of squares is needed because games move points between players without
+        changing the sum of all ratings.
+        """
+        session = self.ReadSession()
+        try:
+            fingerprint = (
+                session.query(
+                    func.count(Rating.player),
+                    func.sum(Rating.rating),
+                    func.sum(Rating.rating * Rating.rating),
+                    func.sum(Rating.games_won),
+                    func.sum(Rating.games_lost),
+                    func.max(Rating.last_change),
+                )
+                .filter(Rating.club == club_id())
+                .one()
+            )
+            return hashlib.sha1(repr(tuple(fingerprint)).encode()).hexdigest()[:16]
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
+
+    @measured
+    def leaderboard(self) -> list[dict]:
+        session = self.ReadSession()
+        try:
+            return [
+                {
+                    "rank": rank,
+                    "name": row.name,
+                    "rating": round(row.rating, 2),
+                    "winning_quote": row.winning_quote,
+                    "games_won": row.games_won,
+                    "games_lost": row.games_lost,
+                    "last_change": row.last_change.isoformat() if row.last_change else None,
+                }
+                for rank, row in enumerate(read_models.leaderboard(session), start=1)
+            ]
         except Exception as e:
             session.rollback()
             capture_exception(e)
-            logging.error(f"Transaction failed: {e}")
+            logging.error("Transaction failed: %s", e)
             raise e
         finally:
             session.close()
 
+    @measured
     def rating_image(self):
-        """Creates a table with the current ratings and exports it as an image.
+        """Creates a table with the RATING_IMAGE_ROWS best ratings and exports it as an image.
+        The image is only rendered and uploaded again when the leaderboard version changed.
+        Every club has its own image and cache entry.
         See URLS:
             https://medium.com/@romina.elena.mendez/transform-your-pandas-dataframes-styles-colors-and-emojis-bf938d6e98a2
             https://towardsdatascience.com/make-your-tables-look-glorious-2a5ddbfcc0e5
         """
-        session = self.Session()
+        club = tenant()
+        version = self.leaderboard_version()
+        cached = self._rating_images.get(club.id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        import dataframe_image as dfi
+        import pandas as pd
+
+        session = self.ReadSession()
         try:
             query = session.query(
                 func.row_number().over(order_by=Rating.rating.desc()).label("Platz"),
@@ -306,13 +1280,13 @@ class RatingSystem:
                 Rating.last_change.label("Letze Änderung"),
             )
 
-            result = query.join(Player, Player.id == Rating.player).all()
+            result = query.join(Player, Player.id == Rating.player).order_by(Rating.rating.desc()).limit(RATING_IMAGE_ROWS).all()
 
             # Dataframe, styling and export
             data = pd.DataFrame(result)
             data_styled = (
-                data.style.format({"Letze Änderung": "{:%d %b, %Y}", "Rating": "{:.2f}", "Gewinnquote (%)": "{:.2%}"})
-                .set_caption("BV-Q-Club Rating Tabelle")
+                data.style.format({"Letze Änderung": "{:%d %b, %Y}", "Rating": "{:.2f}", "Gewinnquote (%)": "{:.2%}"}, na_rep="-")
+                .set_caption(club.caption)
                 .set_properties(**{"text-align": "center"})
                 .set_properties(**{"background-color": "#FFCFC9", "color": "black"}, subset=["Spiele (V)"])
                 .set_properties(**{"background-color": "#C9FFC9", "color": "black"}, subset=["Spiele (G)"])
@@ -321,7 +1295,9 @@ class RatingSystem:
                 .hide(axis="index")
             )
 
-            dfi.export(data_styled, "./rating.png", table_conversion="matplotlib")
+            path = "rating.png" if club.id == DEFAULT_CLUB else f"rating_{club.id}.png"
+            with render_seconds.time(image="rating"):
+                dfi.export(data_styled, f"./{path}", table_conversion="matplotlib")
 
             # Upload to storage
             storage = self.supabase.storage
@@ -333,23 +1309,26 @@ class RatingSystem:
 
             ratingBucket = storage.from_("rating")
 
-            with open("./rating.png", "rb") as f:
-                storage.empty_bucket("rating")
-                ratingBucket.upload(path="./rating.png", file=f, file_options={"content-type": "image/png"})
+            # The bucket holds the images of all clubs, only this club's image is replaced
+            with open(f"./{path}", "rb") as f:
+                with storage_upload_seconds.time(bucket="rating"):
+                    ratingBucket.upload(path=path, file=f, file_options={"content-type": "image/png", "upsert": "true"})
 
-                res = ratingBucket.get_public_url("rating.png")
-                logging.info("Das Rating-Tabellenbild wurde exportiert.")
+                res = ratingBucket.get_public_url(path)
+                self._rating_images[club.id] = (version, res)
+                logging.info("Das Rating-Tabellenbild von %s wurde exportiert.", club.name)
                 return res
         except Exception as e:
             session.rollback()
             capture_exception(e)
-            logging.error(f"Transaction failed: {e}")
+            logging.error("Transaction failed: %s", e)
             raise e
         finally:
             session.close()
 
+    @measured
     def export_database(self):
-        session = self.Session()
+        session = self.ReadSession()
         try:
             # Upload to storage
             storage = self.supabase.storage
@@ -363,7 +1342,7 @@ class RatingSystem:
             # Delete backups older than 7 days
             files = backup_bucket.list()
             timestamp_format = "%Y-%m-%d %H:%M:%S"
-            logging.info(files)
+            logging.info("Vorhandene Backups: %s", files)
 
             for file in files:
                 file_name = file["name"]
@@ -373,42 +1352,17 @@ class RatingSystem:
                 timestamp = datetime.strptime(timestamp, timestamp_format)
                 if (datetime.now() - timestamp).days > 7:
                     backup_bucket.remove(file["name"])
-                    logging.info(f"Backup {file['name']} wurde gelöscht.")
-
-            # Fetch all ratings and games
-            ratings = session.query(Rating).all()
-            games = session.query(Game).all()
-
-            # Create csv from ratings and games
-            rating_df = pd.DataFrame(
-                [
-                    {
-                        "player": rating.player,
-                        "rating": rating.rating,
-                        "games_won": rating.games_won,
-                        "games_lost": rating.games_lost,
-                    }
-                    for rating in ratings
-                ]
-            )
-            game_df = pd.DataFrame(
-                [
-                    {
-                        "playerA": game.playerA,
-                        "playerB": game.playerB,
-                        "scoreA": game.scoreA,
-                        "scoreB": game.scoreB,
-                        "race_to": game.race_to,
-                        "disciplin": game.disciplin,
-                        "rating_change": game.rating_change,
-                    }
-                    for game in games
-                ]
-            )
+                    logging.info("Backup %s wurde gelöscht.", file["name"])
 
-            # Export to csv
-            rating_df.to_csv("ratings.csv", index=False)
-            game_df.to_csv("games.csv", index=False)
+            # Stream the ratings and games of all clubs into csv files
+            for path, row_type, rows in (
+                ("ratings.csv", read_models.RatingRow, read_models.ratings(session, all_clubs=True)),
+                ("games.csv", read_models.GameRow, read_models.games(session, all_clubs=True)),
+            ):
+                with open(path, "w", newline="") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(row_type._fields)
+                    writer.writerows(rows)
 
             # Create zip from csvs
             with zipfile.ZipFile("backup.zip", "w") as zf:
@@ -419,7 +1373,8 @@ class RatingSystem:
             timestamp = datetime.now().strftime(timestamp_format)
 
             with open("backup.zip", "rb") as f:
-                backup_bucket.upload(path=f"backup_{timestamp}.zip", file=f, file_options={"content-type": "application/zip"})
+                with storage_upload_seconds.time(bucket="backup"):
+                    backup_bucket.upload(path=f"backup_{timestamp}.zip", file=f, file_options={"content-type": "application/zip"})
                 logging.info("Die Datenbank wurde exportiert.")
 
                 # Delete local files
@@ -429,39 +1384,39 @@ class RatingSystem:
         except Exception as e:
             session.rollback()
             capture_exception(e)
-            logging.error(f"Transaction failed: {e}")
+            logging.error("Transaction failed: %s", e)
             raise e
         finally:
             session.close()
 
+    @measured
     def get_rating(self, name):
-        session = self.Session()
+        session = self.ReadSession()
         try:
             name = self.find_closest_name(name)
-            player = session.query(Player).filter_by(name=name).first()
+            player = read_models.player_rating(session, name)
             if not player:
                 raise PlayerNotFoundException(name)
-
-            player_rating = session.query(Rating).filter_by(player=player.id).first()
-            if not player_rating:
+            if player.rating is None:
                 raise PlayerNotInRatingException(name)
 
-            return player_rating.rating
+            return player.rating
         except Exception as e:
             session.rollback()
             capture_exception(e)
-            logging.error(f"Transaction failed: {e}")
+            logging.error("Transaction failed: %s", e)
             raise e
         finally:
             session.close()
 
+    @measured
     def adjust_rating(self, name, rating, games_won, games_lost, phone_number=None):
         session = self.Session()
         try:
-            if phone_number and phone_number != environ["ADMIN_PHONE_NUMBER"]:
+            if phone_number and not is_admin(phone_number):
                 raise AdminPermissionException()
 
-            name = self.find_closest_name(name)
+            name = self.find_closest_name(name, self._all_names(session))
             player = session.query(Player).filter_by(name=name).first()
             if not player:
                 raise PlayerNotFoundException(name)
@@ -480,35 +1435,213 @@ class RatingSystem:
                 player_rating.winning_quote = games_won / (games_won + games_lost)
 
             player_rating.last_change = datetime.now()
+            self._record_ratings(session, player.id)
 
             session.commit()
-            logging.info(f"Rating von {name} wurde angepasst auf {rating}.")
+            logging.info("Rating von %s wurde angepasst auf %s.", name, rating)
         except Exception as e:
             session.rollback()
             capture_exception(e)
-            logging.error(f"Transaction failed: {e}")
+            logging.error("Transaction failed: %s", e)
             raise e
         finally:
             session.close()
 
+    @measured
     def apply_rating_decay(self):
         session = self.Session()
         try:
-            ratings = session.query(Rating).all()
+            # Ratings that did not change for more than 30 days lose 3%, in one UPDATE
+            today = date.today()
+            cutoff = today - timedelta(days=30)
+            decayed = read_models.stale_ratings(session, cutoff)
+            if decayed:
+                session.execute(
+                    update(Rating).where(Rating.last_change < cutoff).values(rating=Rating.rating * 0.97, last_change=today),
+                    execution_options={"synchronize_session": False},
+                )
+
+            self._record_ratings(session, *decayed)
+            session.commit()
+            logging.info("Rating Decay wurde angewendet auf %s Spieler.", len(decayed))
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
 
-            # Check if rating is older than 30 days
-            for rating in ratings:
-                if (datetime.now().date() - rating.last_change).days > 30:
-                    rating.rating = rating.rating * 0.97
-                    rating.last_change = datetime.now()
-                    logging.info(f"Rating von {rating.player} wurde um 3% reduziert.")
+    @measured
+    def run_rating_period(self, model: RatingModel = None, until: date = None) -> int:
+        """Rates all days with games up to `until` (default: yesterday) that the model has not
+        rated yet, every day as one period. The ratings of the model are read once and written
+        once per player, independent of the number of games. Returns the number of rated periods.
+        """
+        import numpy as np
+
+        model = model or Glicko2Model()
+        until = until or date.today() - timedelta(days=1)
+
+        session = self.Session()
+        try:
+            last_day = session.query(func.max(RatingPeriod.day)).filter_by(model=model.name).scalar()
+
+            query = session.query(Game.created_at, Game.playerA, Game.playerB, Game.scoreA, Game.scoreB, Game.disciplin).filter(
+                Game.created_at <= until
+            )
+            if last_day:
+                query = query.filter(Game.created_at > last_day)
+            games = query.order_by(Game.created_at).all()
+            if not games:
+                logging.info("Keine neuen Spiele für das Modell %s.", model.name)
+                return 0
+
+            rows = session.query(ModelRating).filter_by(model=model.name).all()
+            players = [row.player for row in rows]
+            known = set(players)
+            for game in games:
+                for player in (game.playerA, game.playerB):
+                    if player not in known:
+                        known.add(player)
+                        players.append(player)
+            index = {player: i for i, player in enumerate(players)}
+
+            state = model.initial_state(len(players))
+            for row in rows:
+                state[index[row.player]] = [getattr(row, field) for field in model.fields]
+            games_played = np.zeros(len(players), dtype=int)
+            for row in rows:
+                games_played[index[row.player]] = row.games
+
+            days = {}
+            for game in games:
+                days.setdefault(game.created_at, []).append(game[1:])
+
+            for day, day_games in days.items():
+                period = Period.from_games(day_games, index)
+                state = model.rate_period(state, period)
+                games_played += np.bincount(np.concatenate([period.playerA, period.playerB]), minlength=len(players))
+                session.add(RatingPeriod(model=model.name, day=day, games=len(day_games)))
+
+            values = [
+                {"model": model.name, "player": player, "games": int(games_played[i])}
+                | {field: float(state[i, column]) for column, field in enumerate(model.fields)}
+                for player, i in index.items()
+            ]
+            rated = {row.player for row in rows}
+            existing = [value for value in values if value["player"] in rated]
+            new = [value for value in values if value["player"] not in rated]
+            if existing:
+                session.execute(update(ModelRating), existing)
+            if new:
+                session.execute(insert(ModelRating), new)
 
             session.commit()
-            logging.info("Rating Decay wurde angewendet.")
+            logging.info("Modell %s: %s Perioden mit %s Spielen bewertet.", model.name, len(days), len(games))
+            return len(days)
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
+
+    @measured
+    def compare_rating_models(self, model_name: str = Glicko2Model.name) -> list[dict]:
+        """Current rating next to the rating of an alternative model, ordered by the current rating."""
+        session = self.ReadSession()
+        try:
+            result = (
+                session.query(Player.name, Rating.rating, ModelRating.rating, ModelRating.deviation)
+                .join(Rating, Rating.player == Player.id)
+                .outerjoin(ModelRating, (ModelRating.player == Player.id) & (ModelRating.model == model_name))
+                .order_by(Rating.rating.desc())
+                .all()
+            )
+            ranked = sorted((row for row in result if row[2] is not None), key=lambda row: row[2], reverse=True)
+            model_ranks = {row[0]: rank for rank, row in enumerate(ranked, start=1)}
+
+            return [
+                {
+                    "name": name,
+                    "rank": rank,
+                    "rating": rating,
+                    "model_rank": model_ranks.get(name),
+                    "model_rating": model_rating,
+                    "deviation": deviation,
+                }
+                for rank, (name, rating, model_rating, deviation) in enumerate(result, start=1)
+            ]
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
+
+    def _ratings_of(self, session, names: list[str]) -> list[tuple[str, float]]:
+        """Resolves the names with one lookup of all names and returns them with their current rating."""
+        all_names = self.get_names()
+        resolved = [self.find_closest_name(name, all_names) for name in names]
+        ratings = dict(
+            session.query(Player.name, Rating.rating)
+            .join(Rating, Rating.player == Player.id)
+            .filter(Player.name.in_(resolved))
+            .all()
+        )
+        missing = [name for name in resolved if name not in ratings]
+        if missing:
+            raise PlayerNotInRatingException(*missing)
+        return [(name, ratings[name]) for name in resolved]
+
+    @measured
+    def predict_match(self, nameA: str, nameB: str, race_to: int) -> dict:
+        """Win probability and most likely results of a race between two players."""
+        from predictions import match_probability, rack_probability, score_probabilities
+
+        session = self.ReadSession()
+        try:
+            (nameA, ratingA), (nameB, ratingB) = self._ratings_of(session, [nameA, nameB])
+            p = float(rack_probability(ratingA, ratingB))
+            scores = sorted(score_probabilities(p, race_to).items(), key=lambda item: item[1], reverse=True)
+            return {
+                "playerA": nameA,
+                "playerB": nameB,
+                "rack_probability": p,
+                "win_probability": float(match_probability(p, race_to)),
+                "scores": scores[:3],
+            }
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+            raise e
+        finally:
+            session.close()
+
+    @measured
+    def predict_tournament(self, names: list[str], race_to: int) -> list[tuple[str, float]]:
+        """Probability of every entry to win a single elimination tournament, bracket in entry order."""
+        from predictions import tournament_probabilities
+
+        session = self.ReadSession()
+        try:
+            entries = self._ratings_of(session, names)
+            if len({name for name, _ in entries}) != len(entries):
+                raise ValueError("Ein Spieler ist mehrfach in der Liste.")
+            probabilities = tournament_probabilities([rating for _, rating in entries], race_to)
+            return sorted(
+                ((name, float(probability)) for (name, _), probability in zip(entries, probabilities)),
+                key=lambda entry: entry[1],
+                reverse=True,
+            )
         except Exception as e:
             session.rollback()
             capture_exception(e)
-            logging.error(f"Transaction failed: {e}")
+            logging.error("Transaction failed: %s", e)
             raise e
         finally:
             session.close()
@@ -0,0 +1,112 @@
+"""Read models: plain rows for the read-only paths.
+
+The queries are Core selects executed on a session or connection. The rows are
+named tuples instead of ORM entities, so reading thousands of ratings or games
+builds no identity map, no instance state and no change tracking. Core selects
+bypass the club filter of the sessions, every query filters by the club itself.
+"""
+
+from datetime import date
+from typing import Iterator, NamedTuple, Optional
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import DELETED_PLAYER_PHONE, Game, Player, Rating
+from utils.tenancy import club_id
+
+# Rows fetched from the database at a time when streaming a whole table
+STREAM_SIZE = 10000
+
+
+class PlayerRating(NamedTuple):
+    player: Optional[UUID]
+    name: str
+    # None if the player exists but is not in the rating
+    rating: Optional[float]
+
+
+class LeaderboardRow(NamedTuple):
+    name: str
+    rating: float
+    winning_quote: Optional[float]
+    games_won: int
+    games_lost: int
+    last_change: Optional[date]
+
+
+class RatingRow(NamedTuple):
+    player: UUID
+    rating: float
+    games_won: int
+    games_lost: int
+    club: str
+
+
+class GameRow(NamedTuple):
+    playerA: UUID
+    playerB: UUID
+    scoreA: int
+    scoreB: int
+    race_to: int
+    disciplin: str
+    rating_change: float
+    club: str
+
+
+def _execute(executor, statement):
+    """Executes on the connection, a session would route the select through the ORM layer first."""
+    connection = executor.connection() if isinstance(executor, Session) else executor
+    return connection.execute(statement)
+
+
+def player_names(executor) -> list[str]:
+    """Names of the players of the club, without the placeholder of deleted players."""
+    statement = select(Player.name).where(Player.club == club_id(), Player.phone_number != DELETED_PLAYER_PHONE)
+    return list(_execute(executor, statement).scalars())
+
+
+def player_rating(executor, name: str) -> Optional[PlayerRating]:
+    """The player with exactly this name and the rating, in one query. None if there is no such player."""
+    row = _execute(
+        executor,
+        select(Player.id, Player.name, Rating.rating)
+        .outerjoin(Rating, Rating.player == Player.id)
+        .where(Player.club == club_id(), Player.name == name),
+    ).first()
+    return PlayerRating._make(row) if row else None
+
+
+def leaderboard(executor) -> list[LeaderboardRow]:
+    result = _execute(
+        executor,
+        select(Player.name, Rating.rating, Rating.winning_quote, Rating.games_won, Rating.games_lost, Rating.last_change)
+        .join(Player, Player.id == Rating.player)
+        .where(Rating.club == club_id())
+        .order_by(Rating.rating.desc()),
+    )
+    return list(map(LeaderboardRow._make, result))
+
+
+def _stream(executor, statement, row_type) -> Iterator[NamedTuple]:
+    result = _execute(executor, statement.execution_options(yield_per=STREAM_SIZE))
+    for partition in result.partitions():
+        yield from map(row_type._make, partition)
+
+
+def ratings(executor, all_clubs: bool = False) -> Iterator[RatingRow]:
+    """All ratings of the club or of all clubs, fetched in chunks of STREAM_SIZE rows."""
+    statement = select(*(getattr(Rating, field) for field in RatingRow._fields))
+    return _stream(executor, statement if all_clubs else statement.where(Rating.club == club_id()), RatingRow)
+
+
+def games(executor, all_clubs: bool = False) -> Iterator[GameRow]:
+    """All games of the club or of all clubs, fetched in chunks of STREAM_SIZE rows."""
+    statement = select(*(getattr(Game, field) for field in GameRow._fields))
+    return _stream(executor, statement if all_clubs else statement.where(Game.club == club_id()), GameRow)
+
+
+def stale_ratings(executor, before: date) -> list[UUID]:
+    """Players whose rating did not change since before the day."""
+    return list(_execute(executor, select(Rating.player).where(Rating.club == club_id(), Rating.last_change < before)).scalars())
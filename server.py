@@ -1,52 +1,103 @@
+import json
 import logging
-import re
+import threading
+from datetime import datetime
+from functools import wraps
 from os import environ
 
+import requests
 import sentry_sdk
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from dotenv import load_dotenv
 from flask import Flask, request
 from pytz import timezone
 from sentry_sdk import capture_exception, set_user
+from sentry_sdk.integrations.flask import FlaskIntegration
 from sentry_sdk.integrations.logging import LoggingIntegration
+from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
 from sqlalchemy.exc import PendingRollbackError
 from waitress import serve
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from rating_system import RatingSystem
+from utils.deduplication import SeenMessages
 from utils.enums import UserState
 from utils.exceptions import *
+from utils.game_parser import parse_games
+from utils.http_cache import VersionedCache, cached_response
+from utils.internal_auth import internal_only
+from utils.job_runner import JobRunner
+from utils.log import configure_logging
+from utils.message_batch import MessageBatch
 from utils.message_provider import MessageProvider
+from utils.message_queue import MessageQueue
+from utils.metrics import registry as metrics_registry
+from utils.player_import import normalize_phone_number, parse_players
+from utils.rate_limiter import RateLimiter, rate_limited
+from utils.read_routing import acting_user
+from utils.tenancy import DEFAULT_CLUB, club_context, is_admin
+from utils.user_state_store import create_user_state_store
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s %(message)s",
-    force=True,
-)
+load_dotenv()
 
-sentry_logging = LoggingIntegration(level=logging.INFO, event_level=logging.CRITICAL)
+# Breadcrumbs only for warnings, hooking every INFO record costs time on the request thread
+sentry_logging = LoggingIntegration(level=logging.WARNING, event_level=logging.CRITICAL)
 
-load_dotenv()
+# Sample rate per route, e.g. "/whatsapp=0.05,/metrics=0", other routes use SENTRY_TRACES_SAMPLE_RATE
+TRACES_SAMPLE_RATE = float(environ.get("SENTRY_TRACES_SAMPLE_RATE", 1.0))
+ROUTE_TRACES_SAMPLE_RATES = {
+    route.strip(): float(rate)
+    for route, rate in (item.split("=") for item in environ.get("SENTRY_TRACES_SAMPLE_RATES", "").split(",") if item)
+}
+
+
+def traces_sampler(sampling_context):
+    wsgi_environ = sampling_context.get("wsgi_environ") or {}
+    return ROUTE_TRACES_SAMPLE_RATES.get(wsgi_environ.get("PATH_INFO"), TRACES_SAMPLE_RATE)
 
-sentry_sdk.init(
-    dsn=environ["SENTRY_DSN"],
-    # Set traces_sample_rate to 1.0 to capture 100%
-    # of transactions for performance monitoring.
-    traces_sample_rate=1.0,
-    # Set profiles_sample_rate to 1.0 to profile 100%
-    # of sampled transactions.
-    # We recommend adjusting this value in production.
-    profiles_sample_rate=1.0,
-    integrations=[sentry_logging],
-)
 
 app = Flask(__name__)
-session = dict()
+# Number of reverse proxies in front of the app whose X-Forwarded-For entries are trusted, 0 if clients connect directly
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(environ.get("TRUSTED_PROXIES", 0)))
+# Conversation state of every user and ids of received messages, opened by start()
+user_states = None
+seen_messages = None
 
 ratingSystem = RatingSystem()
 
+# The leaderboard version is looked up at most every LEADERBOARD_CHECK_SECONDS, responses are served from the snapshot.
+# Every club has its own cache, so a busy club neither evicts nor blocks the snapshots of another club
+LEADERBOARD_CHECK_SECONDS = float(environ.get("LEADERBOARD_CHECK_SECONDS", 5))
+leaderboard_caches = {}
+leaderboard_caches_lock = threading.Lock()
+
+
+def leaderboard_cache(club) -> VersionedCache:
+    with leaderboard_caches_lock:
+        cache = leaderboard_caches.get(club.id)
+        if cache is None:
+
+            def version():
+                with club_context(club):
+                    return ratingSystem.leaderboard_version()
+
+            cache = leaderboard_caches[club.id] = VersionedCache(version, check_interval=LEADERBOARD_CHECK_SECONDS)
+        return cache
+
+
+def requested_club():
+    """Club of the public routes, given as ?club=<id>, the default club without it."""
+    return ratingSystem.get_club(request.args.get("club", DEFAULT_CLUB))
+
+
+LEADERBOARD_MAX_AGE = int(environ.get("LEADERBOARD_MAX_AGE", 60))
+# Requests per second and burst of a single client on the public routes
+public_limiter = RateLimiter(rate=float(environ.get("PUBLIC_RATE_LIMIT", 1)), burst=float(environ.get("PUBLIC_RATE_BURST", 10)))
+
 EINGABE_NICHT_ERKANNT = "Eingabe nicht erkannt.\nBenutze den Befehl 'Start' um zu beginnen. oder 'Hilfe' für Hilfe."
-HELP_COMMAND = "Es sind folgende Befehle verfügbar:\nStart\nSpieler hinzufügen\nSpieler löschen\nSpiel hinzufügen\nSpiel löschen\nRating anschauen\nHilfe"
+HELP_COMMAND = "Es sind folgende Befehle verfügbar:\nStart\nSpieler hinzufügen\nSpieler löschen\nSpiel hinzufügen\nSpiel löschen\nRating anschauen\nMein Verlauf\nStatistik\nPrognose\nHilfe"
 
 
 @app.route("/")
@@ -55,22 +106,47 @@ def test():
 
 
 @app.route("/rating")
+@rate_limited(public_limiter)
 def rating():
     try:
-        url = ratingSystem.rating_image()
-        return f'<img src="{url}" style="display: block; margin-left: auto; margin-right: auto; height: 100%;" />'
+        club = requested_club()
+        with club_context(club):
+            version, page = leaderboard_cache(club).get(
+                "rating",
+                lambda: f'<img src="{ratingSystem.rating_image()}" style="display: block; margin-left: auto; margin-right: auto; height: 100%;" />',
+            )
+        return cached_response(page, version, "text/html", LEADERBOARD_MAX_AGE)
+    except ClubNotFoundException as e:
+        return str(e), 404
     except Exception as e:
         capture_exception(e)
         return f"Rating konnte nicht aktualisiert werden. Wende dich an den Admin."
 
 
+@app.route("/api/leaderboard")
+@rate_limited(public_limiter)
+def leaderboard():
+    try:
+        club = requested_club()
+        with club_context(club):
+            version, body = leaderboard_cache(club).get(
+                "leaderboard", lambda: json.dumps({"club": club.name, "players": ratingSystem.leaderboard()})
+            )
+        return cached_response(body, version, "application/json", LEADERBOARD_MAX_AGE)
+    except ClubNotFoundException as e:
+        return {"error": str(e)}, 404
+    except Exception as e:
+        capture_exception(e)
+        return {"error": "Rangliste konnte nicht geladen werden."}, 500
+
+
 @app.get("/whatsapp")
 def verify_webhook():
     mode = request.args.get("hub.mode")
     token = request.args.get("hub.verify_token")
     challenge = request.args.get("hub.challenge")
 
-    logging.info(f"Received request with mode: {mode}, token: {token}, challenge: {challenge}")
+    logging.info("Received request with mode: %s, token: %s, challenge: %s", mode, token, challenge)
 
     # Check if a token and mode are in the query string
     if mode and token:
@@ -110,14 +186,51 @@ def whatsapp_message():
     else:
         username = "Unknown User"
 
+    phone_number_id = value["metadata"]["phone_number_id"]
+    message = value["messages"][0]
+    if not message.get("from"):
+        return {"status": "OK"}, 200
+
+    # Meta redelivers webhooks, every message must only be processed once
+    message_id = message.get("id")
+    if message_id and not seen_messages.check_and_add(message_id):
+        logging.info("Doppelte Nachricht %s wird ignoriert.", message_id)
+        return {"status": "OK"}, 200
+
+    # Acknowledge immediately, the message is processed by the worker pool
+    try:
+        message_queue.submit(message["from"], phone_number_id, username, message)
+    except MessageQueueFullException as e:
+        capture_exception(e)
+        if message_id:
+            seen_messages.discard(message_id)
+        return {"status": "Queue full"}, 503
+
+    return {"status": "OK"}, 200
+
+
+@app.route("/queue")
+@internal_only
+def queue_stats():
+    return {**message_queue.stats(), "deduplication": seen_messages.stats()}, 200
+
+
+@app.route("/metrics")
+@internal_only
+def metrics():
+    return metrics_registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+def process_message(phone_number_id, username, message):
     try:
-        phone_number_id = value["metadata"]["phone_number_id"]
-        message = value["messages"][0]
         phone_number = message["from"]
         set_user({"id": phone_number, "username": username})
-        logging.info(f"Received message: {message} with phone number id: {phone_number_id}")
-        logging.info(f"Inital Session: {session.get(phone_number)}")
+        logging.debug("Received message: %s with phone number id: %s", message, phone_number_id)
+        # Take the state atomically, the handlers set the next state if the conversation continues
+        current_state = user_states.pop(phone_number) or UserState.INITIAL.value
+        logging.info("Inital State: %s", current_state)
 
+        incoming_message = None
         match message["type"]:
             case "text":
                 incoming_message = message["text"]["body"]
@@ -125,28 +238,31 @@ def whatsapp_message():
                 if message["interactive"]["type"] == "list_reply":
                     incoming_message = message["interactive"]["list_reply"]["title"]
                 else:
-                    logging.info(f"Interactive message type not supported: {message}")
-                    MessageProvider.send_message(phone_number_id, phone_number, EINGABE_NICHT_ERKANNT)
+                    logging.info("Interactive message type not supported: %s", message)
+            case "document" if current_state == UserState.ADMIN_ADD_PLAYER.value:
+                # Player lists can be sent as CSV file
+                try:
+                    incoming_message = MessageProvider.download_media(message["document"]["id"]).decode(
+                        "utf-8-sig", errors="replace"
+                    )
+                except Exception as e:
+                    capture_exception(e)
+                    MessageProvider.send_message(phone_number_id, phone_number, f"Datei konnte nicht gelesen werden: {e}")
+                    return
             case _:
-                logging.info(f"Message type not supported: {message}")
-                MessageProvider.send_message(phone_number_id, phone_number, EINGABE_NICHT_ERKANNT)
+                logging.info("Message type not supported: %s", message)
 
         if phone_number and incoming_message:
-            if not session.get(phone_number):
-                session[phone_number] = {"state": UserState.INITIAL.value}
-
-            handle_message(phone_number_id, phone_number, incoming_message, session[phone_number]["state"])
+            # The WhatsApp number that received the message decides the club.
+            # Reads of a user who just wrote go to the primary, not to a possibly lagging replica
+            with club_context(ratingSystem.club_for(phone_number_id)), acting_user(phone_number):
+                handle_message(phone_number_id, phone_number, incoming_message, current_state)
         else:
-            del session[phone_number]
             MessageProvider.send_message(phone_number_id, phone_number, EINGABE_NICHT_ERKANNT)
 
-        logging.info(f"Final Session: {session.get(phone_number)}")
+        logging.info("Final State: %s", user_states.get(phone_number))
+    finally:
         set_user(None)
-        return {"status": "OK"}, 200
-    except Exception as e:
-        capture_exception(e)
-        set_user(None)
-        return {"status": "Error handling message"}, 200
 
 
 def handle_message(phone_number_id, phone_number, message: str, current_state: str):
@@ -154,9 +270,8 @@ def handle_message(phone_number_id, phone_number, message: str, current_state: s
         case UserState.ADMIN.value:
             handle_admin_message(message, phone_number_id, phone_number)
         case UserState.ADMIN_ADD_PLAYER.value:
-            handle_add_player(message.splitlines[0].strip(), phone_number_id, message.splitlines[1].strip())
+            handle_import_players(message, phone_number_id, phone_number)
         case UserState.ADMIN_DELETE_PLAYER.value:
-            session.pop(phone_number, None)
             try:
                 name = ratingSystem.delete_player(phone_number, name=message.strip())
                 MessageProvider.send_message(phone_number_id, phone_number, f"Spieler {name} erfolgreich gelöscht.")
@@ -165,6 +280,10 @@ def handle_message(phone_number_id, phone_number, message: str, current_state: s
                 MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
         case UserState.ADMIN_ADJUST_RATING.value:
             handle_adjust_rating(message, phone_number_id, phone_number)
+        case UserState.ADMIN_MERGE_PLAYERS.value:
+            handle_merge_players(message, phone_number_id, phone_number)
+        case UserState.ADMIN_ARCHIVE_SEASON.value:
+            handle_archive_season(message, phone_number_id, phone_number)
         case UserState.INITIAL.value:
             handle_initial_state(message, phone_number_id, phone_number)
         case UserState.ADD_PLAYER.value:
@@ -175,32 +294,34 @@ def handle_message(phone_number_id, phone_number, message: str, current_state: s
             handle_add_game(message, phone_number_id, phone_number)
         case UserState.DELETE_GAME.value:
             handle_delete_game(message, phone_number_id, phone_number)
+        case UserState.STATISTICS.value:
+            handle_statistics(message, phone_number_id, phone_number)
+        case UserState.PREDICTION.value:
+            handle_prediction(message, phone_number_id, phone_number)
         case _:
-            session.pop(phone_number, None)
             MessageProvider.send_message(phone_number_id, phone_number, EINGABE_NICHT_ERKANNT)
 
 
 def handle_initial_state(message, phone_number_id, phone_number):
     match message:
         case "admin" | "Admin":
-            if phone_number != environ["ADMIN_PHONE_NUMBER"]:
+            if not is_admin(phone_number):
                 MessageProvider.send_message(
                     phone_number_id, phone_number, "Du hast keine Berechtigung, diese Aktion auszuführen."
                 )
                 return
-            session[phone_number]["state"] = UserState.ADMIN.value
+            user_states.set(phone_number, UserState.ADMIN.value)
             MessageProvider.send_admin_list(phone_number_id, phone_number)
         case "start" | "Start":
-            logging.info(f"Sending initial message to {phone_number}")
+            logging.info("Sending initial message to %s", phone_number)
             MessageProvider.send_inital_message(phone_number_id, phone_number)
         case "Turnier hinzufügen":
-            session[phone_number]["state"] = UserState.ADD_TOURNAMENT.value
+            user_states.set(phone_number, UserState.ADD_TOURNAMENT.value)
             MessageProvider.send_message(phone_number_id, phone_number, "Bitte geben Sie die Tournier ID ein.")
         case "Spieler hinzufügen":
-            session[phone_number]["state"] = UserState.ADD_PLAYER.value
+            user_states.set(phone_number, UserState.ADD_PLAYER.value)
             MessageProvider.send_message(phone_number_id, phone_number, "Bitte geben Sie den Namen des Spielers ein.")
         case "Spieler löschen":
-            session.pop(phone_number, None)
             try:
                 name = ratingSystem.delete_player(phone_number)
                 MessageProvider.send_message(phone_number_id, phone_number, f"Spieler {name} erfolgreich gelöscht.")
@@ -208,19 +329,18 @@ def handle_initial_state(message, phone_number_id, phone_number):
                 capture_exception(e)
                 MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
         case "Spiel hinzufügen":
-            session[phone_number]["state"] = UserState.ADD_GAME.value
+            user_states.set(phone_number, UserState.ADD_GAME.value)
             MessageProvider.send_message(
                 phone_number_id,
                 phone_number,
-                "Bitte geben Sie das Spiel im folgenden Format ein:\n\nSpieltyp\nSpieler A: Spieler B\nScore A: Score B\nScore A: Score B\n...",
+                "Bitte geben Sie die Spiele im folgenden Format ein:\n\nSpieltyp\nSpieler A: Spieler B\nScore A: Score B\nScore A: Score B\nSpieler C: Spieler D\nScore C: Score D\n...\n\nEs können beliebig viele Paarungen und Spieltypen folgen.",
             )
         case "Spiel löschen":
-            session[phone_number]["state"] = UserState.DELETE_GAME.value
+            user_states.set(phone_number, UserState.DELETE_GAME.value)
             MessageProvider.send_message(
                 phone_number_id, phone_number, "Bitte geben Sie die ID des Spiels ein, das Sie löschen möchten."
             )
         case "Rating anschauen":
-            session.pop(phone_number, None)
             try:
                 url = ratingSystem.rating_image()
                 MessageProvider.send_image(phone_number_id, phone_number, url)
@@ -231,15 +351,40 @@ def handle_initial_state(message, phone_number_id, phone_number):
                     phone_number,
                     f"Rating konnte nicht aktualisiert werden. Wende dich an den Admin.",
                 )
+        case "Mein Verlauf":
+            try:
+                url = ratingSystem.rating_chart(phone_number)
+                MessageProvider.send_image(phone_number_id, phone_number, url)
+            except (PlayerNotFoundException, PlayerHasNoHistoryException) as e:
+                MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
+            except Exception as e:
+                capture_exception(e)
+                MessageProvider.send_message(
+                    phone_number_id,
+                    phone_number,
+                    f"Verlauf konnte nicht erstellt werden. Wende dich an den Admin.",
+                )
+        case "Statistik":
+            user_states.set(phone_number, UserState.STATISTICS.value)
+            MessageProvider.send_message(
+                phone_number_id,
+                phone_number,
+                "Bitte geben Sie den Namen Ihres Gegners ein oder 'Alle' für Ihre Gesamtstatistik.",
+            )
+        case "Prognose":
+            user_states.set(phone_number, UserState.PREDICTION.value)
+            MessageProvider.send_message(
+                phone_number_id,
+                phone_number,
+                "Bitte geben Sie die Prognose im folgenden Format ein:\n\nRace to\nSpieler A: Spieler B\n\noder für ein Turnier (Setzliste):\n\nRace to\nSpieler 1\nSpieler 2\n...",
+            )
         case "hilfe" | "Hilfe":
-            session.pop(phone_number, None)
             MessageProvider.send_message(
                 phone_number_id,
                 phone_number,
                 HELP_COMMAND,
             )
         case _:
-            session.pop(phone_number, None)
             MessageProvider.send_message(
                 phone_number_id,
                 phone_number,
@@ -248,48 +393,44 @@ def handle_initial_state(message, phone_number_id, phone_number):
 
 
 def handle_add_tournament(message, phone_number_id, phone_number):
-    session.pop(phone_number, None)
-    try:
-        tournament_id = int(message.strip())
+    with MessageBatch(phone_number_id, phone_number) as batch:
+        try:
+            tournament_id = int(message.strip())
 
-        url = f"https://api.cuescore.com/tournament/?id={tournament_id}"
+            url = f"https://api.cuescore.com/tournament/?id={tournament_id}"
 
-        response = requests.get(url)
-        data = response.json()
+            response = requests.get(url, timeout=30)
+            data = response.json()
 
-        matches = data["matches"]
+            matches = data["matches"]
 
-        for match in matches:
-            if match["matchstatus"] != "finished":
-                continue
-            try:
+            for match in matches:
+                if match["matchstatus"] != "finished":
+                    continue
                 playerA = match["playerA"]["name"]
                 playerB = match["playerB"]["name"]
-                scoreA = int(match["scoreA"])
-                scoreB = int(match["scoreB"])
-
-                (game_id, rating_change) = ratingSystem.add_game(playerA, playerB, scoreA, scoreB, "Normal", phone_number)
-                results.append()
-                MessageProvider.send_message(
-                    phone_number_id, phone_number, f"Spiel {game_id} hinzugefügt.\nRatingänderung: {rating_change:.2f}"
-                )
-            except Exception as e:
-                MessageProvider.send_message(phone_number_id, phone_number, f"Spiel konnte nicht hinzugefügt werden.\n{e}")
-        MessageProvider.send_message(phone_number_id, phone_number, f"Turnier {tournament_id} erfolgreich hinzugefügt.")
-    except PlayerAlreadyExistsException as e:
-        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
-    except PlayerNotFoundException as e:
-        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
-    except PlayerAlreadyInRatingException as e:
-        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
-    except ValueError as e:
-        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
-    except Exception as e:
-        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
+                try:
+                    scoreA = int(match["scoreA"])
+                    scoreB = int(match["scoreB"])
+
+                    (game_id, rating_change) = ratingSystem.add_game(playerA, playerB, scoreA, scoreB, "Normal", phone_number)
+                    batch.add(f"Spiel {game_id} hinzugefügt. Ratingänderung: {rating_change:.2f}")
+                except Exception as e:
+                    batch.add(f"Spiel {playerA}: {playerB} konnte nicht hinzugefügt werden. {e}")
+            batch.add(f"Turnier {tournament_id} erfolgreich hinzugefügt.")
+        except PlayerAlreadyExistsException as e:
+            batch.add(f"Fehler: {e}")
+        except PlayerNotFoundException as e:
+            batch.add(f"Fehler: {e}")
+        except PlayerAlreadyInRatingException as e:
+            batch.add(f"Fehler: {e}")
+        except ValueError as e:
+            batch.add(f"Fehler: {e}")
+        except Exception as e:
+            batch.add(f"Fehler: {e}")
 
 
 def handle_add_player(name, phone_number_id, phone_number):
-    session.pop(phone_number, None)
     try:
         ratingSystem.add_player(name, phone_number)
         ratingSystem.add_player_to_rating(phone_number)
@@ -302,32 +443,55 @@ def handle_add_player(name, phone_number_id, phone_number):
         MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
 
 
+def handle_import_players(message, phone_number_id, phone_number):
+    with MessageBatch(phone_number_id, phone_number) as batch:
+        try:
+            lines = [line.strip() for line in message.strip().splitlines() if line.strip()]
+            # Single player in the former format, name and phone number on separate lines
+            if len(lines) == 2 and not normalize_phone_number(lines[0]) and normalize_phone_number(lines[1]):
+                message = f"{lines[0]}\t{lines[1]}"
+
+            rows, errors = parse_players(message)
+            result = ratingSystem.import_players(rows, phone_number)
+
+            batch.add(f"{len(result['added'])} Spieler hinzugefügt.")
+            if result["added"]:
+                batch.add(", ".join(result["added"]))
+            for line, name in result["existing"]:
+                batch.add(f"Zeile {line}: Handynummer gehört bereits {name}.")
+            for line, name, similar, score in result["similar"]:
+                batch.add(f"Zeile {line}: {name} ist {similar} sehr ähnlich ({score:.0f}%), bitte einzeln hinzufügen.")
+            for error in errors:
+                batch.add(error)
+        except AdminPermissionException as e:
+            batch.add(f"Fehler: {e}")
+        except Exception as e:
+            capture_exception(e)
+            batch.add(f"Fehler: {e}")
+
+
 def handle_add_game(message, phone_number_id, phone_number):
-    session.pop(phone_number, None)
     try:
-        game_type = message.split("\n")[0]
-        names = message.split("\n")[1]
-        nameA, nameB = names.strip().split(":")
-        scores = [tuple(map(int, match)) for match in re.findall(r"(\d+)[ \t]*:[ \t]*(\d+)", message)]
-
-        logging.info(f"Identified matches: {game_type}, {names}, {scores}")
+        games = parse_games(message)
+        logging.info("Identified matches: %s", games)
 
-        changes = ratingSystem.add_games(nameA, nameB, scores, game_type, phone_number)
+        changes = ratingSystem.add_game_batch(games, phone_number)
 
         if not changes:
             MessageProvider.send_message(phone_number_id, phone_number, "Keine Spiele hinzugefügt.")
         elif len(changes) == 1:
-            id, rating_change = changes[0]
+            id, *_, rating_change = changes[0]
             MessageProvider.send_message(
                 phone_number_id, phone_number, f"Spiel hinzugefügt.\nID: {id}.\nRatingänderung: {rating_change:.2f}"
             )
         else:
-            message = "Spiele hinzugefügt.\n"
-            # Write scores with ids
-            for i, (id, rating_change) in enumerate(changes):
-                message += f"Spiel {i+1}:\nID: {id}. Änderung: {rating_change:.2f}\n"
-
-            MessageProvider.send_message(phone_number_id, phone_number, message)
+            with MessageBatch(phone_number_id, phone_number) as batch:
+                batch.add(f"{len(changes)} Spiele hinzugefügt.")
+                # Write scores with ids
+                for id, nameA, nameB, scoreA, scoreB, rating_change in changes:
+                    batch.add(f"{id}: {nameA} {scoreA}:{scoreB} {nameB}, Änderung: {rating_change:.2f}")
+    except GameFormatException as e:
+        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
     except PlayerNotFoundException as e:
         MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
     except PlayerNotInRatingException as e:
@@ -350,7 +514,6 @@ def handle_delete_game(
     phone_number_id,
     phone_number,
 ):
-    session.pop(phone_number, None)
     try:
         if not id.startswith("#"):
             id = f"#{id}"
@@ -367,34 +530,195 @@ def handle_delete_game(
         MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
 
 
+def handle_statistics(message, phone_number_id, phone_number):
+    try:
+        opponent_name = message.strip()
+        if opponent_name.lower() == "alle":
+            opponent_name = None
+        stats = ratingSystem.get_statistics(phone_number, opponent_name)
+
+        lines = [
+            f"Statistik von {stats['name']}:",
+            f"Spiele: {stats['games']} ({stats['games_won']} gewonnen)",
+            f"Racks: {stats['racks_won']}:{stats['racks_lost']}",
+            f"Ratingpunkte gewonnen: {stats['rating_exchanged']:.2f}",
+        ]
+        if stats["last_played"]:
+            lines.append(f"Zuletzt gespielt: {stats['last_played']:%d.%m.%Y}")
+        for season in stats["seasons"]:
+            rating = f", Rating {season['rating']:.2f}" if season["rating"] is not None else ""
+            lines.append(f"Saison {season['season']}: {season['games']} Spiele ({season['games_won']} gewonnen){rating}")
+
+        opponent = stats.get("opponent")
+        if opponent:
+            lines += [
+                "",
+                f"Gegen {opponent['name']}:",
+                f"Spiele: {opponent['games']} ({opponent['games_won']}:{opponent['games_lost']})",
+                f"Racks: {opponent['racks_won']}:{opponent['racks_lost']}",
+                f"Ratingpunkte gewonnen: {opponent['rating_exchanged']:.2f}",
+            ]
+            if opponent["last_played"]:
+                lines.append(f"Zuletzt gespielt: {opponent['last_played']:%d.%m.%Y}")
+
+        MessageProvider.send_message(phone_number_id, phone_number, "\n".join(lines))
+    except PlayerNotFoundException as e:
+        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
+    except Exception as e:
+        capture_exception(e)
+        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler. Versuche es später erneut.")
+
+
+def handle_prediction(message, phone_number_id, phone_number):
+    try:
+        lines = [line.strip() for line in message.strip().splitlines() if line.strip()]
+        race_to = int(lines[0])
+        if race_to < 1 or len(lines) < 2:
+            raise ValueError("Ungültige Eingabe.")
+
+        if len(lines) == 2:
+            if ":" not in lines[1]:
+                raise ValueError("Bitte geben Sie die Paarung als 'Spieler A: Spieler B' ein.")
+            nameA, nameB = lines[1].split(":", 1)
+            prediction = ratingSystem.predict_match(nameA.strip(), nameB.strip(), race_to)
+            scores = ", ".join(f"{a}:{b} ({p:.0%})" for (a, b), p in prediction["scores"])
+            MessageProvider.send_message(
+                phone_number_id,
+                phone_number,
+                f"Prognose Race to {race_to}:\n"
+                f"{prediction['playerA']}: {prediction['win_probability']:.1%}\n"
+                f"{prediction['playerB']}: {1 - prediction['win_probability']:.1%}\n"
+                f"Wahrscheinlichste Ergebnisse: {scores}",
+            )
+        else:
+            entries = ratingSystem.predict_tournament(lines[1:], race_to)
+            with MessageBatch(phone_number_id, phone_number) as batch:
+                batch.add(f"Turnierprognose Race to {race_to} (Turniersieg):")
+                for name, probability in entries:
+                    batch.add(f"{name}: {probability:.1%}")
+    except (PlayerNotFoundException, PlayerNotInRatingException, ValueError) as e:
+        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
+    except Exception as e:
+        capture_exception(e)
+        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler. Versuche es später erneut.")
+
+
 def handle_admin_message(message: str, phone_number_id: str, phone_number: str):
-    session.pop(phone_number, None)
-    if phone_number != environ["ADMIN_PHONE_NUMBER"]:
+    if not is_admin(phone_number):
         MessageProvider.send_message(phone_number_id, phone_number, "Du hast keine Berechtigung, diese Aktion auszuführen.")
         return
 
     match message:
         case "Backup erstellen":
             export_database(phone_number_id, phone_number)
+        case "Modelle vergleichen":
+            try:
+                with MessageBatch(phone_number_id, phone_number) as batch:
+                    batch.add("Platz | Name | Rating | Glicko-2 (±RD)")
+                    for row in ratingSystem.compare_rating_models():
+                        glicko = (
+                            f"{row['model_rating']:.0f} ±{row['deviation']:.0f} (#{row['model_rank']})"
+                            if row["model_rating"] is not None
+                            else "-"
+                        )
+                        batch.add(f"{row['rank']}. {row['name']}: {row['rating']:.2f} | {glicko}")
+            except Exception as e:
+                capture_exception(e)
+                MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
+        case "Statistik neu berechnen":
+            try:
+                ratingSystem.rebuild_statistics(phone_number)
+                MessageProvider.send_message(phone_number_id, phone_number, "Statistiken erfolgreich neu berechnet.")
+            except Exception as e:
+                capture_exception(e)
+                MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
         case "Rating anpassen":
-            session[phone_number]["state"] = UserState.ADMIN_ADJUST_RATING.value
+            user_states.set(phone_number, UserState.ADMIN_ADJUST_RATING.value)
             MessageProvider.send_message(
                 phone_number_id, phone_number, "Bitte geben Sie den Name, Rating, gewonnene und verlorene Spiele ein."
             )
+        case "Saison archivieren":
+            user_states.set(phone_number, UserState.ADMIN_ARCHIVE_SEASON.value)
+            MessageProvider.send_message(
+                phone_number_id,
+                phone_number,
+                "Bitte geben Sie den Namen der Saison und den Stichtag ein. Alle Spiele vor dem Stichtag werden archiviert.\n\nSaison 2025, 01.01.2026",
+            )
         case "Spieler hinzufügen":
-            session[phone_number]["state"] = UserState.ADMIN_ADD_PLAYER.value
+            user_states.set(phone_number, UserState.ADMIN_ADD_PLAYER.value)
+            MessageProvider.send_message(
+                phone_number_id,
+                phone_number,
+                "Bitte geben Sie die Spieler im folgenden Format ein oder schicken Sie eine CSV-Datei:\n\nName, Handynummer\nName, Handynummer\n...",
+            )
+        case "Duplikate suchen":
+            try:
+                duplicates = ratingSystem.find_duplicate_players(phone_number)
+                with MessageBatch(phone_number_id, phone_number) as batch:
+                    batch.add(f"{len(duplicates)} mögliche Duplikate gefunden.")
+                    for duplicate in duplicates:
+                        (nameA, nameB), (gamesA, gamesB) = duplicate["names"], duplicate["games"]
+                        batch.add(f"{nameA} ({gamesA} Spiele) ≈ {nameB} ({gamesB} Spiele): {duplicate['score']:.0f}%")
+            except Exception as e:
+                capture_exception(e)
+                MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
+        case "Spieler zusammenführen":
+            user_states.set(phone_number, UserState.ADMIN_MERGE_PLAYERS.value)
             MessageProvider.send_message(
-                phone_number_id, phone_number, "Bitte geben Sie den Namen und Handynummer des Spielers ein."
+                phone_number_id,
+                phone_number,
+                "Bitte geben Sie die genauen Namen im folgenden Format ein:\n\nSpieler (behalten)\nDuplikat (entfernen)",
             )
         case "Spieler löschen":
-            session[phone_number]["state"] = UserState.ADMIN_DELETE_PLAYER.value
+            user_states.set(phone_number, UserState.ADMIN_DELETE_PLAYER.value)
             MessageProvider.send_message(phone_number_id, phone_number, "Bitte geben Sie den Namen des Spielers ein.")
         case _:
             MessageProvider.send_message(phone_number_id, phone_number, "Admin Command nicht erkannt.")
 
 
+def handle_merge_players(message: str, phone_number_id: str, phone_number: str):
+    try:
+        lines = [line.strip() for line in message.strip().splitlines() if line.strip()]
+        if len(lines) != 2:
+            raise ValueError("Bitte genau zwei Namen angeben.")
+
+        result = ratingSystem.merge_players(lines[0], lines[1], phone_number)
+        MessageProvider.send_message(
+            phone_number_id,
+            phone_number,
+            f"{lines[1]} wurde mit {result['name']} zusammengeführt.\n"
+            f"{result['moved']} Spiele übernommen, {result['deleted']} gemeinsame Spiele gelöscht.\n"
+            f"Neues Rating: {result['rating']:.2f}",
+        )
+    except (PlayerNotFoundException, PlayerNotInRatingException, AdminPermissionException, ValueError) as e:
+        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
+    except Exception as e:
+        capture_exception(e)
+        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
+
+
+def handle_archive_season(message: str, phone_number_id: str, phone_number: str):
+    try:
+        season, _, cutoff = message.strip().rpartition(",")
+        try:
+            cutoff = datetime.strptime(cutoff.strip(), "%d.%m.%Y").date()
+        except ValueError:
+            raise ValueError("Bitte den Stichtag im Format TT.MM.JJJJ angeben.")
+
+        result = ratingSystem.archive_season(season, cutoff, phone_number)
+        MessageProvider.send_message(
+            phone_number_id,
+            phone_number,
+            f"Saison {result['season']} archiviert: {result['games']} Spiele von {result['players']} Spielern.",
+        )
+    except (AdminPermissionException, ValueError) as e:
+        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
+    except Exception as e:
+        capture_exception(e)
+        MessageProvider.send_message(phone_number_id, phone_number, f"Fehler: {e}")
+
+
 def handle_adjust_rating(message: str, phone_number_id: str, phone_number: str):
-    session.pop(phone_number, None)
     lines = message.splitlines()
     try:
         name = lines[0]
@@ -431,22 +755,115 @@ def export_database(phone_number_id=None, phone_number=None):
         return "Error exporting database."
 
 
-def apply_rating_decay():
-    try:
-        ratingSystem.apply_rating_decay()
-        return "Rating decay applied successfully."
-    except Exception as e:
-        capture_exception(e)
-        return "Error applying rating decay."
+message_queue = MessageQueue(
+    process_message,
+    workers=int(environ.get("MESSAGE_WORKERS", 4)),
+    max_size=int(environ.get("MESSAGE_QUEUE_SIZE", 1000)),
+)
+
+
+def for_every_club(job):
+    """Runs the job once per club, a failing club does not stop the others."""
+
+    @wraps(job)
+    def run():
+        failed = []
+        for club in ratingSystem.clubs():
+            with club_context(club):
+                try:
+                    job()
+                except Exception as e:
+                    capture_exception(e)
+                    failed.append(club.id)
+        if failed:
+            raise RuntimeError(f"{job.__name__} fehlgeschlagen für: {', '.join(failed)}")
+
+    return run
+
+
+# Every job runs only once across all server processes
+job_runner = JobRunner(lambda: ratingSystem.Session())
+
+
+@app.route("/jobs")
+@internal_only
+def job_history():
+    return {"runs": job_runner.history(request.args.get("job"))}, 200
+
+
+def start():
+    """Side effects of a running server: logging, Sentry, the stores, the message workers and the jobs.
+
+    Importing the module has none of them, so processes that only import it, e.g. the
+    spawned prediction workers which import the main module, stay idle.
+    """
+    global user_states, seen_messages
+
+    configure_logging(
+        level=getattr(logging, environ.get("LOG_LEVEL", "INFO")),
+        rate=float(environ.get("LOG_SAMPLE_RATE", 5)),
+        burst=float(environ.get("LOG_SAMPLE_BURST", 20)),
+    )
+    sentry_sdk.init(
+        dsn=environ["SENTRY_DSN"],
+        # Share of transactions captured for performance monitoring, configurable per route.
+        traces_sampler=traces_sampler,
+        # Share of sampled transactions that are profiled.
+        profiles_sample_rate=float(environ.get("SENTRY_PROFILES_SAMPLE_RATE", 1.0)),
+        # Only load the integrations we use, auto-enabling imports every supported library that is installed
+        auto_enabling_integrations=False,
+        integrations=[sentry_logging, FlaskIntegration(), SqlalchemyIntegration()],
+    )
+
+    # Shared between processes if USER_STATE_DB_PATH and DEDUP_DB_PATH are set
+    user_states = create_user_state_store(
+        path=environ.get("USER_STATE_DB_PATH"),
+        ttl=float(environ.get("USER_STATE_TTL_SECONDS", 60 * 60)),
+        max_size=int(environ.get("USER_STATE_MAX_SIZE", 10000)),
+    )
+    seen_messages = SeenMessages(
+        ttl=float(environ.get("DEDUP_TTL_SECONDS", 24 * 60 * 60)),
+        max_size=int(environ.get("DEDUP_MAX_SIZE", 100000)),
+        path=environ.get("DEDUP_DB_PATH"),
+    )
+
+    message_queue.start()
+    metrics_registry.gauge("message_queue_depth", "Messages waiting to be processed.", message_queue.depth)
+    metrics_registry.gauge(
+        "message_queue_rejected", "Messages rejected because the queue was full.", lambda: message_queue.stats()["rejected"]
+    )
+    metrics_registry.gauge(
+        "duplicate_messages_suppressed", "Redelivered webhooks that were ignored.", lambda: seen_messages.stats()["duplicates"]
+    )
+    metrics_registry.gauge("user_states", "Open conversations.", lambda: len(user_states))
+
+    # The backup covers all clubs
+    job_runner.add_job("export_database", ratingSystem.export_database, IntervalTrigger(hours=1))
+    job_runner.add_job(
+        "apply_rating_decay",
+        for_every_club(ratingSystem.apply_rating_decay),
+        CronTrigger(hour=8, minute=0, timezone=timezone("Europe/Berlin")),
+    )
+    job_runner.add_job(
+        "rating_period",
+        for_every_club(ratingSystem.run_rating_period),
+        CronTrigger(hour=8, minute=15, timezone=timezone("Europe/Berlin")),
+    )
 
 
 if __name__ == "__main__":
+    start()
     scheduler = BackgroundScheduler()
-    scheduler.add_job(func=export_database, trigger="interval", hours=1)
-    scheduler.add_job(func=apply_rating_decay, trigger=CronTrigger(hour=8, minute=0, timezone=timezone("Europe/Berlin")))
+    scheduler.add_job(func=job_runner.tick, trigger="interval", seconds=int(environ.get("JOB_POLL_SECONDS", 30)), coalesce=True)
     scheduler.start()
+    # predictions loads numpy, so it is only imported at startup if predictions run in a process pool
+    if int(environ.get("PREDICTION_WORKERS", 1)) > 1:
+        import predictions
+
+        predictions.start_pool()
 
     try:
         serve(app, host="0.0.0.0", port=8080)
     except (KeyboardInterrupt, SystemExit):
         scheduler.shutdown()
+        message_queue.stop()
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("ADMIN_PHONE_NUMBER", "490000000000")
+
+from benchmarks.local_storage import LocalSupabase
+from rating_system import RatingSystem
+
+
+@pytest.fixture
+def players():
+    """Name and phone number of the players the rating system starts with, override it in a module to change them."""
+    return [("Anna", "491111111111"), ("Bernd", "492222222222"), ("Carla", "493333333333")]
+
+
+@pytest.fixture
+def rating_system(tmp_path, players):
+    rating_system = RatingSystem(
+        engine=create_engine(f"sqlite:///{tmp_path / 'rating.db'}"),
+        supabase=LocalSupabase(str(tmp_path / "storage")),
+    )
+    for name, phone_number in players:
+        rating_system.add_player(name, phone_number)
+        rating_system.add_player_to_rating(phone_number)
+    return rating_system
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from backtest import backtest, parameter_grid, replay
+from rating_models import EloModel, Period
+
+
+def history(games: int = 300, players: int = 12, seed: int = 5):
+    rng = np.random.default_rng(seed)
+    playerA = rng.integers(0, players, games)
+    playerB = (playerA + rng.integers(1, players, games)) % players
+    winnerA = rng.random(games) < 0.5
+    loser = rng.integers(0, 5, games)
+    period = Period(
+        playerA=playerA,
+        playerB=playerB,
+        scoreA=np.where(winnerA, 5, loser).astype(float),
+        scoreB=np.where(winnerA, loser, 5).astype(float),
+        disciplin=["Normal"] * games,
+    )
+    return period, np.full(games, 5), players
+
+
+def test_replay_matches_the_sequential_model():
+    games, race_to, players = history()
+    model = EloModel(k_factor=0.8, rating_factor=150)
+
+    result = replay(games, race_to, players, [1.2, 0.8], [120, 150])
+
+    expected = model.rate_period(model.initial_state(players), games)
+    assert result["ratings"][:, 1] == pytest.approx(expected[:, 0])
+    assert result["scored"] == len(race_to)
+    assert np.all(result["brier"] < 1) and np.all(result["log_loss"] > 0)
+
+
+def test_backtest_in_process_pool_matches_serial_replay():
+    games, race_to, players = history()
+    k, rf = parameter_grid([0.5, 1.2, 2.0], [60, 120, 240])
+
+    parallel = backtest(games, race_to, players, k, rf, burn_in=50, workers=3)
+    serial = replay(games, race_to, players, k, rf, burn_in=50)
+
+    assert len(parallel["log_loss"]) == 9
+    assert parallel["log_loss"] == pytest.approx(serial["log_loss"])
+    assert parallel["brier"] == pytest.approx(serial["brier"])
+    assert parallel["scored"] == len(race_to) - 50
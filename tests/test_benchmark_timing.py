@@ -0,0 +1,27 @@
+import os
+import sys
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from benchmarks.timing import compare
+
+
+def test_slower_medians_are_regressions():
+    baseline = {"add_game": {"p50_ms": 10.0}, "rating_image": {"p50_ms": 100.0}}
+    results = {"add_game": {"p50_ms": 13.0}, "rating_image": {"p50_ms": 110.0}, "new": {"p50_ms": 1.0}}
+
+    [regression] = compare(results, baseline, threshold=0.2)
+
+    assert regression["benchmark"] == "add_game"
+    assert regression["change"] == 13.0 / 10.0 - 1
+
+
+def test_failed_benchmarks_are_reported_not_raised():
+    baseline = {"add_game": {"p50_ms": 10.0}, "export_database": {"error": "OSError: kaputt"}}
+    results = {"add_game": {"error": "ValueError: kaputt"}, "export_database": {"error": "OSError: kaputt"}}
+
+    assert compare(results, baseline, threshold=0.2) == [
+        {"benchmark": "add_game", "baseline_p50_ms": 10.0, "error": "ValueError: kaputt"}
+    ]
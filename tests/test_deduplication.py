@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from utils.deduplication import SeenMessages
+
+
+def test_redelivered_message_is_suppressed():
+    seen = SeenMessages()
+
+    assert seen.check_and_add("wamid.1")
+    assert not seen.check_and_add("wamid.1")
+    assert seen.check_and_add("wamid.2")
+    assert seen.stats() == {"checked": 3, "duplicates": 1, "size": 2}
+
+
+def test_message_ids_expire(monkeypatch):
+    seen = SeenMessages(ttl=10)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    seen.check_and_add("wamid.1")
+
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert seen.check_and_add("wamid.1")
+
+
+def test_memory_is_bounded():
+    seen = SeenMessages(max_size=2)
+    for message_id in ("wamid.1", "wamid.2", "wamid.3"):
+        seen.check_and_add(message_id)
+
+    assert seen.stats()["size"] == 2
+    assert seen.check_and_add("wamid.1")
+
+
+def test_discarded_message_can_be_processed_again(tmp_path):
+    seen = SeenMessages(path=str(tmp_path / "seen.db"))
+    seen.check_and_add("wamid.1")
+    seen.discard("wamid.1")
+
+    assert seen.check_and_add("wamid.1")
+
+
+def test_seen_messages_survive_restarts(tmp_path):
+    path = str(tmp_path / "seen.db")
+    SeenMessages(path=path).check_and_add("wamid.1")
+
+    restarted = SeenMessages(path=path)
+    assert restarted.stats()["size"] == 1
+    assert not restarted.check_and_add("wamid.1")
+
+
+def test_seen_messages_are_shared_between_processes(tmp_path):
+    path = str(tmp_path / "seen.db")
+    first = SeenMessages(path=path)
+    second = SeenMessages(path=path)
+
+    assert first.check_and_add("wamid.1")
+    assert not second.check_and_add("wamid.1")
+
+
+def test_expired_rows_are_pruned_while_running(tmp_path, monkeypatch):
+    seen = SeenMessages(ttl=10, path=str(tmp_path / "seen.db"), prune_every=2)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    seen.check_and_add("wamid.1")
+    seen.check_and_add("wamid.2")
+
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    seen.check_and_add("wamid.3")
+    assert seen.db.execute("SELECT COUNT(*) FROM seen_messages").fetchone()[0] == 3
+    seen.check_and_add("wamid.4")
+
+    assert [row[0] for row in seen.db.execute("SELECT id FROM seen_messages ORDER BY id")] == ["wamid.3", "wamid.4"]
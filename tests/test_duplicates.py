@@ -0,0 +1,81 @@
+import os
+import sys
+
+import pytest
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("ADMIN_PHONE_NUMBER", "490000000000")
+
+from models import Game, Player, PlayerStats, Rating
+from utils.duplicates import blocking_keys, find_duplicates
+from utils.enums import GameType
+
+ADMIN = os.environ["ADMIN_PHONE_NUMBER"]
+
+
+def test_blocking_keys_ignore_order_and_punctuation():
+    assert blocking_keys("Streit, Horst") == blocking_keys("Horst Streit") == {"streit", "horst", "str*", "hor*"}
+
+
+def test_find_duplicates():
+    names = ["Streit, Horst", "Anna Schmidt", "Horst Streit", "Horst Streid", "Bernd Meier", "Meier Bernd"]
+
+    pairs = find_duplicates(names)
+
+    assert [(i, j) for i, j, _ in pairs] == [(0, 2), (4, 5), (0, 3), (2, 3)]
+    assert pairs[0][2] == 100
+
+
+@pytest.fixture
+def players():
+    return [("Horst Streit", "491111111111"), ("Streit, Horst", "492222222222"), ("Carla", "493333333333")]
+
+
+def add_game(rating_system, nameA, nameB, scoreA, scoreB):
+    # add_game resolves names fuzzily and cannot tell the duplicates apart
+    session = rating_system.Session()
+    playerA = session.query(Player).filter_by(name=nameA).one()
+    playerB = session.query(Player).filter_by(name=nameB).one()
+    session.add(Game(playerA.id, playerB.id, scoreA, scoreB, max(scoreA, scoreB), GameType.NORMAL.value, session))
+    session.commit()
+    session.close()
+    rating_system.rebuild_statistics(ADMIN)
+
+
+def test_merge_players_moves_games_and_combines_ratings(rating_system):
+    add_game(rating_system, "Horst Streit", "Carla", 5, 3)
+    add_game(rating_system, "Carla", "Streit, Horst", 2, 5)
+    add_game(rating_system, "Carla", "Streit, Horst", 5, 1)
+    add_game(rating_system, "Horst Streit", "Streit, Horst", 5, 4)
+    # There are no rating triggers in SQLite, set the ratings the games would have given
+    session = rating_system.Session()
+    for name, rating in [("Horst Streit", 54.0), ("Streit, Horst", 47.0)]:
+        player = session.query(Player).filter_by(name=name).one()
+        session.get(Rating, player.id).rating = rating
+    session.commit()
+    session.close()
+
+    assert [duplicate["names"] for duplicate in rating_system.find_duplicate_players(ADMIN)] == [
+        ("Horst Streit", "Streit, Horst")
+    ]
+
+    result = rating_system.merge_players("Horst Streit", "Streit, Horst", ADMIN)
+
+    assert (result["moved"], result["deleted"]) == (2, 1)
+    session = rating_system.Session()
+    try:
+        horst = session.query(Player).filter_by(name="Horst Streit").one()
+        assert session.query(Player).count() == 2
+        assert session.query(Game).filter((Game.playerA == horst.id) | (Game.playerB == horst.id)).count() == 3
+
+        rating = session.get(Rating, horst.id)
+        assert rating.rating == pytest.approx(54.0 + 47.0 - 50)
+        assert (rating.games_won, rating.games_lost) == (2, 1)
+
+        stats = session.get(PlayerStats, horst.id)
+        assert (stats.games, stats.racks_won, stats.racks_lost) == (3, 11, 10)
+    finally:
+        session.close()
@@ -0,0 +1,81 @@
+import os
+import sys
+
+import pytest
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("ADMIN_PHONE_NUMBER", "490000000000")
+
+from models import Game, PlayerStats
+from utils.exceptions import GameFormatException, GameTypeNotSupportedException, PlayerNotInGameException
+from utils.game_parser import ParsedGame, parse_games
+
+ADMIN = os.environ["ADMIN_PHONE_NUMBER"]
+
+
+def test_parse_many_pairings_and_types():
+    games = parse_games("normal\nAnna: Bernd\n5:3\n4 : 5\n\nCarla:Dieter\n5:1, 5:2\n14.1\nAnna: Carla\n100:80\n")
+
+    assert games == [
+        ParsedGame(3, "Normal", "Anna", "Bernd", 5, 3),
+        ParsedGame(4, "Normal", "Anna", "Bernd", 4, 5),
+        ParsedGame(7, "Normal", "Carla", "Dieter", 5, 1),
+        ParsedGame(7, "Normal", "Carla", "Dieter", 5, 2),
+        ParsedGame(10, "14.1", "Anna", "Carla", 100, 80),
+    ]
+
+
+def test_parse_former_single_pairing_format():
+    assert parse_games("Normal\nAnna: Bernd\n5:3") == [ParsedGame(3, "Normal", "Anna", "Bernd", 5, 3)]
+
+
+@pytest.mark.parametrize(
+    "message, error, line",
+    [
+        ("Normal\n5:3", GameFormatException, 2),
+        ("Normal\nAnna: Bernd\nCarla: Dieter\n5:1", GameFormatException, 2),
+        ("Normal\nAnna: Bernd", GameFormatException, 2),
+        ("Normal\nAnna: Bernd\n5:3\nfünf zu drei", GameFormatException, 4),
+        ("8-Ball\nAnna: Bernd\n5:3", GameTypeNotSupportedException, None),
+    ],
+)
+def test_parse_errors(message, error, line):
+    with pytest.raises(error) as info:
+        parse_games(message)
+    if line:
+        assert info.value.line == line
+
+
+def count(rating_system, model):
+    session = rating_system.Session()
+    try:
+        return session.query(model).count()
+    finally:
+        session.close()
+
+
+def test_add_game_batch_in_one_transaction(rating_system):
+    games = parse_games("Normal\nAna: Bernd\n5:3\n4:5\nCarla: Anna\n5:1")
+
+    results = rating_system.add_game_batch(games, ADMIN)
+
+    assert [(nameA, nameB, scoreA, scoreB) for _, nameA, nameB, scoreA, scoreB, _ in results] == [
+        ("Anna", "Bernd", 5, 3),
+        ("Anna", "Bernd", 4, 5),
+        ("Carla", "Anna", 5, 1),
+    ]
+    assert count(rating_system, Game) == 3
+    assert rating_system.get_statistics("491111111111")["games"] == 3
+
+
+def test_add_game_batch_adds_nothing_if_one_game_is_not_allowed(rating_system):
+    games = parse_games("Normal\nAnna: Bernd\n5:3\nBernd: Carla\n5:1")
+
+    with pytest.raises(PlayerNotInGameException):
+        rating_system.add_game_batch(games, "491111111111")
+
+    assert count(rating_system, Game) == 0
+    assert count(rating_system, PlayerStats) == 0
@@ -0,0 +1,73 @@
+import os
+import sys
+
+from flask import Flask
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from utils.http_cache import VersionedCache, cached_response
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_values_are_rebuilt_only_for_a_new_version():
+    clock = Clock()
+    versions = iter(["v1", "v1", "v2"])
+    lookups, builds = [], []
+
+    def version():
+        lookups.append(clock.now)
+        return next(versions)
+
+    cache = VersionedCache(version, check_interval=5, clock=clock)
+    build = lambda: builds.append(1) or len(builds)
+
+    assert cache.get("rating", build) == ("v1", 1)
+    clock.now = 3
+    assert cache.get("rating", build) == ("v1", 1)
+    assert lookups == [0]
+
+    clock.now = 6
+    assert cache.get("rating", build) == ("v1", 1)
+    clock.now = 12
+    assert cache.get("rating", build) == ("v2", 2)
+    assert lookups == [0, 6, 12]
+
+
+def test_cached_response_answers_matching_etag_with_304():
+    app = Flask(__name__)
+
+    @app.route("/leaderboard")
+    def leaderboard():
+        return cached_response('{"players": []}', "abc123", "application/json", 60)
+
+    client = app.test_client()
+    response = client.get("/leaderboard")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"abc123"'
+    assert "max-age=60" in response.headers["Cache-Control"]
+
+    response = client.get("/leaderboard", headers={"If-None-Match": '"abc123"'})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    response = client.get("/leaderboard", headers={"If-None-Match": '"old"'})
+    assert response.status_code == 200
+
+
+def test_leaderboard_version_changes_with_the_ratings(rating_system):
+    before = rating_system.leaderboard_version()
+    assert rating_system.leaderboard_version() == before
+
+    rating_system.adjust_rating("Anna", 55.0, 1, 0)
+    after = rating_system.leaderboard_version()
+    assert after != before
+    assert [row["name"] for row in rating_system.leaderboard()][0] == "Anna"
@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from utils.internal_auth import internal_only
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+
+    @app.route("/")
+    @internal_only
+    def index():
+        return "ok"
+
+    return app.test_client()
+
+
+def test_requests_need_the_internal_token(client, monkeypatch):
+    monkeypatch.setenv("INTERNAL_API_TOKEN", "geheim")
+
+    assert client.get("/").status_code == 403
+    assert client.get("/", headers={"Authorization": "Bearer falsch"}).status_code == 403
+    assert client.get("/", headers={"Authorization": "Basic geheim"}).status_code == 403
+    assert client.get("/", headers={"Authorization": "Bearer geheim"}).status_code == 200
+
+
+def test_routes_are_closed_without_a_configured_token(client, monkeypatch):
+    monkeypatch.delenv("INTERNAL_API_TOKEN", raising=False)
+
+    assert client.get("/").status_code == 403
+    assert client.get("/", headers={"Authorization": "Bearer "}).status_code == 403
+
+
+@pytest.mark.parametrize("route", ["/jobs", "/queue", "/metrics"])
+def test_server_operations_routes_are_internal(route, monkeypatch):
+    from benchmarks.bench_startup import ENVIRONMENT
+
+    for name, value in ENVIRONMENT.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setenv("INTERNAL_API_TOKEN", "geheim")
+    import server
+
+    assert server.app.test_client().get(route).status_code == 403
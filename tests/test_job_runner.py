@@ -0,0 +1,79 @@
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from models import Base, ScheduledJob
+from utils.job_runner import ERROR, SUCCESS, JobRunner, utcnow
+
+
+@pytest.fixture
+def Session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def make_due(Session, name, delta=timedelta(minutes=1)):
+    session = Session()
+    session.query(ScheduledJob).filter_by(name=name).update({ScheduledJob.next_run_at: utcnow() - delta})
+    session.commit()
+    session.close()
+
+
+def test_job_runs_once_across_workers(Session):
+    runs = []
+    workers = [JobRunner(Session) for _ in range(3)]
+    for worker in workers:
+        worker.add_job("export_database", lambda: runs.append(1), IntervalTrigger(hours=1))
+
+    # The first tick only registers the job
+    for worker in workers:
+        worker.tick()
+    assert runs == []
+
+    make_due(Session, "export_database")
+    for worker in workers:
+        worker.tick()
+
+    assert runs == [1]
+    history = workers[0].history()
+    assert len(history) == 1
+    assert history[0]["outcome"] == SUCCESS
+
+
+def test_missed_runs_are_coalesced(Session):
+    runs = []
+    runner = JobRunner(Session)
+    runner.add_job("export_database", lambda: runs.append(1), IntervalTrigger(hours=1))
+    runner.tick()
+
+    # Ten hours of downtime
+    make_due(Session, "export_database", timedelta(hours=10))
+    runner.tick()
+    runner.tick()
+
+    assert runs == [1]
+
+
+def test_failed_job_is_recorded(Session):
+    def fail():
+        raise ValueError("kaputt")
+
+    runner = JobRunner(Session)
+    runner.add_job("apply_rating_decay", fail, IntervalTrigger(hours=1))
+    runner.tick()
+    make_due(Session, "apply_rating_decay")
+    runner.tick()
+
+    [run] = runner.history("apply_rating_decay")
+    assert run["outcome"] == ERROR
+    assert run["error"] == "kaputt"
@@ -0,0 +1,53 @@
+import json
+import logging
+import os
+import sys
+from queue import Queue
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from utils.log import BackgroundQueueHandler, JsonFormatter, SamplingFilter
+
+
+def make_record(msg, *args, level=logging.INFO, **extra):
+    record = logging.makeLogRecord({"name": "rating", "levelno": level, "levelname": logging.getLevelName(level), "msg": msg})
+    record.args = args
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_formats_lazily_and_keeps_extra_fields():
+    entry = json.loads(JsonFormatter().format(make_record("Spiel %s gelöscht.", "#000001", game="#000001")))
+
+    assert entry["message"] == "Spiel #000001 gelöscht."
+    assert entry["level"] == "INFO"
+    assert entry["game"] == "#000001"
+
+
+def test_queue_handler_does_not_format_on_calling_thread():
+    queue = Queue()
+    record = make_record("Spieler %s gefunden.", "Horst, Streit")
+    BackgroundQueueHandler(queue).emit(record)
+
+    queued = queue.get_nowait()
+    assert queued.msg == "Spieler %s gefunden."
+    assert queued.args == ("Horst, Streit",)
+
+
+def test_full_queue_drops_records():
+    handler = BackgroundQueueHandler(Queue(maxsize=1))
+    handler.emit(make_record("eins"))
+    handler.emit(make_record("zwei"))
+
+    assert handler.dropped == 1
+
+
+def test_chatty_lines_are_sampled():
+    sampling = SamplingFilter(rate=0.001, burst=2)
+    passed = [sampling.filter(make_record("Rating von %s reduziert.", i)) for i in range(5)]
+
+    assert passed == [True, True, False, False, False]
+    assert sampling.filter(make_record("Fehler %s", 1, level=logging.ERROR))
+    assert sampling.filter(make_record(["kein", "string"]))
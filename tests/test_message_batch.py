@@ -0,0 +1,35 @@
+import os
+import sys
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("WHATSAPP_TOKEN", "test")
+
+from utils.message_batch import split_message
+
+
+def test_short_lines_are_joined_into_one_message():
+    assert split_message(["Spiel #000001 hinzugefügt.", "Spiel #000002 hinzugefügt."]) == [
+        "Spiel #000001 hinzugefügt.\nSpiel #000002 hinzugefügt."
+    ]
+
+
+def test_messages_are_split_at_the_limit():
+    lines = [f"Spiel #{i:06} hinzugefügt." for i in range(60)]
+    messages = split_message(lines, limit=200)
+
+    assert all(len(message) <= 200 for message in messages)
+    assert "\n".join(messages).splitlines() == lines
+    assert len(messages) < len(lines) / 5
+
+
+def test_overlong_line_is_cut():
+    messages = split_message(["a" * 25, "b"], limit=10)
+
+    assert messages == ["a" * 10, "a" * 10, "a" * 5 + "\nb"]
+
+
+def test_no_lines_no_messages():
+    assert split_message([]) == []
@@ -0,0 +1,65 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("WHATSAPP_TOKEN", "test")
+
+from utils.message_provider import create_session
+
+
+@pytest.fixture
+def server():
+    """Answers POSTs with the next status of `responses`, None drops the connection without an answer."""
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            requests_seen.append(self.path)
+            status = server.responses.pop(0)
+            if status is None:
+                self.close_connection = True
+                return
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.responses = []
+    server.requests = requests_seen
+    server.url = f"http://127.0.0.1:{server.server_port}/messages"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_listed_status_codes_are_retried(server):
+    server.responses = [503, 200]
+
+    response = create_session({}).post(server.url, json={"text": "Hallo"})
+
+    assert response.status_code == 200
+    assert len(server.requests) == 2
+
+
+def test_dropped_connections_are_not_retried(server):
+    # The message may have been delivered before the connection dropped, a retry would send it twice
+    server.responses = [None, 200]
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        create_session({}).post(server.url, json={"text": "Hallo"})
+
+    assert len(server.requests) == 1
@@ -0,0 +1,83 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from utils.exceptions import MessageQueueFullException
+from utils.message_queue import MessageQueue
+
+
+def test_messages_of_one_phone_number_keep_their_order():
+    handled = []
+    lock = threading.Lock()
+
+    def handler(phone_number, index):
+        time.sleep(0.001)
+        with lock:
+            handled.append((phone_number, index))
+
+    queue = MessageQueue(handler, workers=4, max_size=400)
+    queue.start()
+    for index in range(50):
+        for phone_number in ("491111", "492222", "493333"):
+            queue.submit(phone_number, phone_number, index)
+    queue.join()
+    queue.stop()
+
+    for phone_number in ("491111", "492222", "493333"):
+        assert [index for number, index in handled if number == phone_number] == list(range(50))
+    assert queue.stats()["processed"] == 150
+
+
+def test_failing_messages_are_counted():
+    def handler():
+        raise ValueError("kaputt")
+
+    queue = MessageQueue(handler, workers=1, max_size=10)
+    queue.start()
+    queue.submit("491111")
+    queue.join()
+    queue.stop()
+
+    assert queue.stats()["failed"] == 1
+
+
+def test_full_queue_raises_exception():
+    queue = MessageQueue(lambda: None, workers=1, max_size=1)
+    queue.submit("491111")
+    with pytest.raises(MessageQueueFullException):
+        queue.submit("491111")
+    assert queue.stats()["rejected"] == 1
+
+
+def test_stop_does_not_block_on_a_full_queue():
+    release = threading.Event()
+    handled = []
+
+    def handler(index):
+        release.wait()
+        handled.append(index)
+
+    queue = MessageQueue(handler, workers=1, max_size=1)
+    queue.start()
+    queue.submit("491111", 1)
+    while queue.depth():
+        time.sleep(0.001)
+    queue.submit("491111", 2)
+    [worker] = queue.threads
+
+    started = time.monotonic()
+    queue.stop(timeout=0.2)
+    assert time.monotonic() - started < 1
+
+    # The worker finishes the queued messages after the stop and exits
+    release.set()
+    worker.join(1)
+    assert not worker.is_alive()
+    assert handled == [1, 2]
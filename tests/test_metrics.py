@@ -0,0 +1,49 @@
+import os
+import sys
+
+from sqlalchemy import create_engine, text
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from utils.metrics import Registry, db_seconds, instrument_engine, measured
+
+
+def test_histogram_is_rendered_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("render_seconds", "Rendering.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, image="rating")
+
+    rendered = registry.render()
+
+    assert 'render_seconds_bucket{image="rating",le="0.1"} 2' in rendered
+    assert 'render_seconds_bucket{image="rating",le="1.0"} 3' in rendered
+    assert 'render_seconds_bucket{image="rating",le="+Inf"} 4' in rendered
+    assert 'render_seconds_count{image="rating"} 4' in rendered
+
+
+def test_counter_and_gauge():
+    registry = Registry()
+    registry.counter("whatsapp_send_errors_total", "Errors.").inc(type="text")
+    registry.gauge("message_queue_depth", "Depth.", lambda: 3)
+
+    rendered = registry.render()
+
+    assert 'whatsapp_send_errors_total{type="text"} 1' in rendered
+    assert "message_queue_depth 3" in rendered
+
+
+def test_database_time_is_recorded_per_method():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+
+    @measured
+    def count_players():
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    before = db_seconds.count(method="count_players")
+    count_players()
+    assert db_seconds.count(method="count_players") == before + 1
@@ -0,0 +1,123 @@
+import os
+import sys
+from datetime import date
+
+import pytest
+from sqlalchemy import event, update
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("ADMIN_PHONE_NUMBER", "490000000000")
+
+from models import DELETED_PLAYER_NAME, ArchivedGame, Game, PairStats, Player, PlayerStats, Rating
+from utils.enums import GameType
+from utils.exceptions import PlayerNotFoundException
+from utils.player_import import ImportRow
+
+ADMIN = os.environ["ADMIN_PHONE_NUMBER"]
+
+
+def play(rating_system, playerA, playerB, games):
+    rating_system.add_games(playerA, playerB, [(5, 3)] * games, GameType.NORMAL.value, ADMIN)
+
+
+def count_statements(rating_system, func) -> int:
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+
+    event.listen(rating_system.engine, "before_cursor_execute", count)
+    try:
+        func()
+    finally:
+        event.remove(rating_system.engine, "before_cursor_execute", count)
+    return len(statements)
+
+
+def test_games_of_a_deleted_player_are_kept_anonymized(rating_system):
+    play(rating_system, "Anna", "Bernd", 2)
+    play(rating_system, "Carla", "Anna", 1)
+    with rating_system.Session() as session:
+        session.execute(update(Game).where(Game.playerA != Game.playerB).values(created_at=date(2025, 6, 1)))
+        session.commit()
+    rating_system.archive_season("2025", date(2026, 1, 1), ADMIN)
+    play(rating_system, "Bernd", "Anna", 1)
+
+    assert rating_system.delete_player("491111111111") == "Anna"
+
+    assert sorted(rating_system.get_names()) == ["Bernd", "Carla"]
+    assert rating_system.get_statistics("492222222222")["games"] == 3
+    with rating_system.Session() as session:
+        names = {player.id: player.name for player in session.query(Player)}
+        assert sorted(names.values()) == ["Bernd", "Carla", DELETED_PLAYER_NAME]
+        for model, played in ((Game, 1), (ArchivedGame, 3)):
+            players = [name for game in session.query(model) for name in (names[game.playerA], names[game.playerB])]
+            assert players.count(DELETED_PLAYER_NAME) == played
+        assert session.query(Rating).count() == 2
+
+
+def test_the_placeholder_is_shared_and_cannot_be_deleted(rating_system):
+    play(rating_system, "Anna", "Bernd", 1)
+
+    assert rating_system.delete_player(ADMIN, name="Anna") == "Anna"
+    assert rating_system.delete_player(ADMIN, name="Bernd") == "Bernd"
+
+    with rating_system.Session() as session:
+        [game] = session.query(Game).all()
+        assert game.playerA == game.playerB
+        assert session.query(Player).filter_by(name=DELETED_PLAYER_NAME).count() == 1
+    with pytest.raises(PlayerNotFoundException):
+        rating_system.delete_player(ADMIN, name=DELETED_PLAYER_NAME)
+
+
+def statistics(rating_system):
+    with rating_system.Session() as session:
+        names = dict(session.query(Player.id, Player.name))
+        players = {names[row.player]: row.games for row in session.query(PlayerStats)}
+        pairs = {(names[row.playerA], names[row.playerB]) for row in session.query(PairStats)}
+    return players, pairs
+
+
+def test_rebuilt_statistics_leave_out_the_placeholder(rating_system):
+    play(rating_system, "Anna", "Bernd", 2)
+    play(rating_system, "Carla", "Anna", 1)
+    play(rating_system, "Bernd", "Carla", 1)
+    rating_system.delete_player("491111111111")
+
+    rating_system.rebuild_statistics(ADMIN)
+
+    players, pairs = statistics(rating_system)
+    # The opponents keep the games in their totals, the head-to-head rows against the deleted player are gone
+    assert players == {"Bernd": 3, "Carla": 2}
+    assert pairs in ({("Bernd", "Carla")}, {("Carla", "Bernd")})
+
+    rating_system.add_player("Bernd B.", "495555555555")
+    rating_system.add_player_to_rating("495555555555")
+    rating_system.merge_players("Bernd", "Bernd B.", ADMIN)
+    assert statistics(rating_system)[0] == {"Bernd": 3, "Carla": 2}
+
+
+def test_the_placeholder_is_not_a_duplicate_or_import_conflict(rating_system):
+    play(rating_system, "Anna", "Bernd", 1)
+    rating_system.delete_player("491111111111")
+
+    assert rating_system.find_duplicate_players(ADMIN) == []
+    result = rating_system.import_players([ImportRow(1, DELETED_PLAYER_NAME, "494444444444")], ADMIN)
+    assert result["similar"] == []
+
+
+def test_deletion_cost_does_not_grow_with_the_games(rating_system):
+    rating_system.add_player("Dieter", "494444444444")
+    rating_system.add_player_to_rating("494444444444")
+    play(rating_system, "Anna", "Bernd", 1)
+    play(rating_system, "Carla", "Dieter", 50)
+    # Creates the placeholder, so both deletions below run the same statements
+    rating_system.delete_player(ADMIN, name="Bernd")
+
+    few = count_statements(rating_system, lambda: rating_system.delete_player("491111111111"))
+    many = count_statements(rating_system, lambda: rating_system.delete_player("493333333333"))
+
+    assert few == many
@@ -0,0 +1,81 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("ADMIN_PHONE_NUMBER", "490000000000")
+
+from rating_system import RatingSystem
+from utils.exceptions import AdminPermissionException
+from utils.player_import import normalize_phone_number, parse_players, similar_names
+
+ADMIN = os.environ["ADMIN_PHONE_NUMBER"]
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("+49 171 1234567", "491711234567"),
+        ("0049-171-1234567", "491711234567"),
+        ("0171 / 1234567", "491711234567"),
+        ("491711234567", "491711234567"),
+        ("12345", ""),
+        ("0171 12x4567", ""),
+    ],
+)
+def test_normalize_phone_number(raw, expected):
+    assert normalize_phone_number(raw) == expected
+
+
+def test_parse_players_accepts_csv_and_messages():
+    rows, errors = parse_players(
+        "Name;Handynummer\n"
+        "Max Müller;0171 1234567\n"
+        '"Schmidt, Anna", +49 160 9876543\n'
+        "Moritz Müller +49 171 7654321\n"
+        "Hans\n"
+        "Erika Mustermann, 123\n"
+        "Max, 0049 171 1234567\n"
+    )
+
+    assert [(row.line, row.name, row.phone_number) for row in rows] == [
+        (2, "Max Müller", "491711234567"),
+        (3, "Schmidt, Anna", "491609876543"),
+        (4, "Moritz Müller", "491717654321"),
+    ]
+    assert errors == [
+        "Zeile 5: Name oder Handynummer fehlt.",
+        "Zeile 6: Ungültige Handynummer 123.",
+        "Zeile 7: Handynummer bereits in Zeile 2.",
+    ]
+
+
+def test_similar_names_checks_existing_and_earlier_names():
+    matches = similar_names(["Erika Musterman", "Jan Neu", "Neu Jan", "Max Schulz"], ["Erika Mustermann", "Max Müller"])
+
+    assert set(matches) == {0, 2}
+    assert matches[0][0] == "Erika Mustermann"
+    assert matches[2] == ("Jan Neu", 100.0)
+
+
+def test_import_players_in_one_transaction(tmp_path):
+    rating_system = RatingSystem(engine=create_engine(f"sqlite:///{tmp_path / 'import.db'}"))
+    rating_system.add_player("Max Müller", "491711234567")
+
+    rows, _ = parse_players(
+        "Max Müller, 0171 1234567\nMax Mülller, 0171 5555555\nAnna Schmidt, 0160 9876543\nJan Neu, 0151 1111111"
+    )
+    with pytest.raises(AdminPermissionException):
+        rating_system.import_players(rows, "491711234567")
+
+    result = rating_system.import_players(rows, ADMIN)
+
+    assert result["added"] == ["Anna Schmidt", "Jan Neu"]
+    assert result["existing"] == [(1, "Max Müller")]
+    assert [(line, name) for line, name, _, _ in result["similar"]] == [(2, "Max Mülller")]
+    assert rating_system.get_rating("Anna Schmidt") == 50
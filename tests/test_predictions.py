@@ -0,0 +1,85 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+import predictions
+from predictions import (
+    bracket,
+    match_probability,
+    rack_probability,
+    score_probabilities,
+    simulate_bracket,
+    simulate_matches,
+    tournament_probabilities,
+)
+
+
+def test_rack_probability_is_the_expected_score():
+    assert rack_probability(50, 50) == pytest.approx(0.5)
+    assert rack_probability(170, 50) == pytest.approx(10 / 11)
+
+
+def test_match_probability_matches_simulation():
+    assert match_probability(0.5, 5) == pytest.approx(0.5)
+    assert match_probability(0.6, 1) == pytest.approx(0.6)
+
+    rng = np.random.default_rng(1)
+    simulated = simulate_matches(np.full(200_000, 0.55), 7, rng).mean()
+    assert simulated == pytest.approx(match_probability(0.55, 7), abs=0.005)
+
+
+def test_score_probabilities_add_up():
+    scores = score_probabilities(0.6, 5)
+    assert len(scores) == 10
+    assert sum(scores.values()) == pytest.approx(1)
+    assert sum(p for (a, b), p in scores.items() if a == 5) == pytest.approx(match_probability(0.6, 5))
+
+
+def test_bracket_gives_byes_to_the_first_entries():
+    assert list(bracket(2)) == [0, 1]
+    assert list(bracket(5)) == [0, -1, 1, -1, 2, -1, 3, 4]
+    assert len(bracket(16)) == 16
+
+
+def test_simulated_bracket():
+    titles = simulate_bracket([50, 50, 50, 50], 5, 40_000, seed=3)
+    assert titles.sum() == 40_000
+    assert titles / 40_000 == pytest.approx([0.25] * 4, abs=0.01)
+
+    # With two entries the tournament is a single match
+    titles = simulate_bracket([80, 50], 4, 100_000, seed=3)
+    assert titles[0] / 100_000 == pytest.approx(match_probability(rack_probability(80, 50), 4), abs=0.005)
+
+
+def test_tournament_probabilities_in_process_pool(monkeypatch):
+    monkeypatch.setattr(predictions, "WORKERS", 2)
+    monkeypatch.setattr(predictions, "PARALLEL_THRESHOLD", 0)
+
+    probabilities = tournament_probabilities([90, 60, 50, 40, 30], 3, simulations=20_000, seed=7)
+
+    assert probabilities.sum() == pytest.approx(1)
+    assert probabilities[0] == probabilities.max()
+
+
+def test_pool_is_started_ahead_of_time_only_for_workers(monkeypatch):
+    monkeypatch.setattr(predictions, "_executor", None)
+    monkeypatch.setattr(predictions, "WORKERS", 2)
+
+    # The example field of 64 players stays in the calling process
+    tournament_probabilities(list(range(64)), 5, simulations=20_000, seed=1)
+    assert predictions._executor is None
+
+    monkeypatch.setattr(predictions, "WORKERS", 1)
+    predictions.start_pool()
+    assert predictions._executor is None
+
+    monkeypatch.setattr(predictions, "WORKERS", 2)
+    predictions.start_pool()
+    assert predictions._executor is not None
+    predictions._executor.shutdown()
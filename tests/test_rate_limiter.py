@@ -0,0 +1,111 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+import utils.rate_limiter
+from utils.rate_limiter import RateLimiter, rate_limited
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(utils.rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(utils.rate_limiter.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_bursts_are_allowed_and_tokens_refill(clock):
+    limiter = RateLimiter(rate=2, burst=3)
+
+    assert [limiter.try_acquire("a") for _ in range(4)] == [True, True, True, False]
+    clock.now = 0.5
+    assert limiter.try_acquire("a")
+    assert not limiter.try_acquire("a")
+    # Every key has its own bucket
+    assert limiter.try_acquire("b")
+
+
+def test_refill_is_capped_at_the_burst(clock):
+    limiter = RateLimiter(rate=1, burst=2)
+    limiter.try_acquire("a")
+
+    clock.now = 100
+    assert [limiter.try_acquire("a") for _ in range(3)] == [True, True, False]
+
+
+def test_acquire_waits_for_the_next_token(clock):
+    limiter = RateLimiter(rate=4, burst=1)
+
+    limiter.acquire("a")
+    limiter.acquire("a")
+
+    assert clock.sleeps == [pytest.approx(0.25)]
+
+
+def test_least_recently_used_buckets_are_dropped(clock):
+    limiter = RateLimiter(rate=1, burst=1, max_keys=2)
+    for key in ("a", "b", "a", "c"):
+        limiter.try_acquire(key)
+
+    assert list(limiter.buckets) == ["a", "c"]
+
+
+def client(limiter, trusted_proxies=0):
+    app = Flask(__name__)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies)
+
+    @app.route("/")
+    @rate_limited(limiter)
+    def index():
+        return "ok"
+
+    return app.test_client()
+
+
+def test_spoofed_forwarded_for_does_not_reset_the_bucket():
+    limiter = RateLimiter(rate=0.001, burst=2)
+    test_client = client(limiter)
+
+    statuses = [
+        test_client.get("/", headers={"X-Forwarded-For": f"10.0.0.{i}"}, environ_base={"REMOTE_ADDR": "203.0.113.7"}).status_code
+        for i in range(4)
+    ]
+
+    assert statuses == [200, 200, 429, 429]
+    assert list(limiter.buckets) == ["203.0.113.7"]
+
+
+def test_trusted_proxy_forwards_the_client_address():
+    limiter = RateLimiter(rate=0.001, burst=1)
+    test_client = client(limiter, trusted_proxies=1)
+
+    def get(forwarded_for):
+        return test_client.get("/", headers={"X-Forwarded-For": forwarded_for}, environ_base={"REMOTE_ADDR": "10.0.0.1"})
+
+    assert get("198.51.100.1").status_code == 200
+    # Only the entry appended by the trusted proxy counts, not what the client sent before it
+    assert get("1.2.3.4, 198.51.100.1").status_code == 429
+    assert get("198.51.100.2").status_code == 200
+    response = get("198.51.100.2")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1000"
@@ -0,0 +1,75 @@
+import os
+import sys
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("ADMIN_PHONE_NUMBER", "490000000000")
+
+from models import Player, RatingHistory
+from utils.enums import GameType
+from utils.exceptions import PlayerHasNoHistoryException
+
+ADMIN = os.environ["ADMIN_PHONE_NUMBER"]
+
+
+def test_append_keeps_one_point_per_day():
+    history = RatingHistory(days=b"", ratings=b"", version=0)
+    history.append(date(2024, 3, 1), 50.0)
+    history.append(date(2024, 3, 1), 52.5)
+    history.append(date(2024, 3, 4), 49.0)
+
+    days, ratings = history.points()
+    assert [date.fromordinal(day) for day in days] == [date(2024, 3, 1), date(2024, 3, 4)]
+    assert list(ratings) == [52.5, 49.0]
+    assert history.version == 3
+
+
+def test_chart_is_uploaded_once_per_version(rating_system, tmp_path):
+    with pytest.raises(PlayerHasNoHistoryException):
+        rating_system.rating_chart("491111111111")
+
+    rating_system.add_game("Anna", "Bernd", 5, 3, GameType.NORMAL.value, ADMIN)
+    url = rating_system.rating_chart("491111111111")
+    assert url.endswith("_1.png")
+    assert rating_system.rating_chart("491111111111") == url
+
+    rating_system.adjust_rating("Anna", 60.0, 1, 0)
+    new_url = rating_system.rating_chart("491111111111")
+    assert new_url.endswith("_2.png")
+    # The previous chart of the player is removed
+    assert [file["name"][-6:] for file in rating_system.supabase.storage.from_("history").list()] == ["_2.png"]
+
+
+def history_selects(rating_system, count) -> int:
+    for i in range(count):
+        rating_system.add_player(f"Spieler {i}", f"4950000{i:05d}")
+        rating_system.add_player_to_rating(f"4950000{i:05d}")
+    statements = []
+
+    def collect(*args):
+        if args[2].lstrip().startswith("SELECT") and "rating_history" in args[2]:
+            statements.append(args[2])
+
+    with rating_system.Session() as session:
+        players = [player for (player,) in session.query(Player.id)]
+        event.listen(rating_system.engine, "before_cursor_execute", collect)
+        try:
+            rating_system._record_ratings(session, *players)
+            session.commit()
+            rating_system._record_ratings(session, *players)
+            session.commit()
+        finally:
+            event.remove(rating_system.engine, "before_cursor_execute", collect)
+        assert session.query(RatingHistory).count() == len(players)
+    return len(statements)
+
+
+def test_histories_are_loaded_once_for_all_players(rating_system):
+    # New and existing histories, both are loaded with one select per call
+    assert history_selects(rating_system, 30) == 2
@@ -0,0 +1,87 @@
+import os
+import sys
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("ADMIN_PHONE_NUMBER", "490000000000")
+
+from models import Game, ModelRating
+from rating_models import EloModel, Glicko2Model, Period
+from utils.enums import GameType
+
+ADMIN = os.environ["ADMIN_PHONE_NUMBER"]
+
+
+def test_glicko2_matches_example_from_paper():
+    # Example from Glickman's "Example of the Glicko-2 system"
+    model = Glicko2Model(tau=0.5)
+    state = np.array([[1500, 200, 0.06], [1400, 30, 0.06], [1550, 100, 0.06], [1700, 300, 0.06]], dtype=float)
+    period = Period(
+        playerA=np.array([0, 0, 0]),
+        playerB=np.array([1, 2, 3]),
+        scoreA=np.array([1.0, 0.0, 0.0]),
+        scoreB=np.array([0.0, 1.0, 1.0]),
+        disciplin=["Normal"] * 3,
+    )
+
+    rating, deviation, volatility = model.rate_period(state, period)[0]
+
+    assert rating == pytest.approx(1464.06, abs=0.01)
+    assert deviation == pytest.approx(151.52, abs=0.01)
+    assert volatility == pytest.approx(0.05999, abs=1e-5)
+
+
+def test_glicko2_idle_players_only_gain_deviation():
+    model = Glicko2Model()
+    state = model.initial_state(3)
+    state[2] = [1600, 50, 0.06]
+    period = Period(np.array([0]), np.array([1]), np.array([5.0]), np.array([3.0]), ["Normal"])
+
+    new_state = model.rate_period(state, period)
+
+    assert new_state[0, 0] > 1500 > new_state[1, 0]
+    assert new_state[2, 0] == 1600
+    assert new_state[2, 1] == pytest.approx(np.hypot(50, 0.06 * 173.7178))
+
+
+def test_elo_period_applies_games_in_order():
+    model = EloModel()
+    period = Period(np.array([0, 1]), np.array([1, 0]), np.array([5.0, 5.0]), np.array([3.0, 1.0]), ["Normal", "Normal"])
+
+    state = model.rate_period(model.initial_state(2), period)
+
+    first = model.rating_change(50, 50, 5, 3, "Normal")
+    second = model.rating_change(50 - first, 50 + first, 5, 1, "Normal")
+    assert state[:, 0] == pytest.approx([50 + first - second, 50 - first + second])
+
+
+def test_elo_rates_straight_pool():
+    assert EloModel().rating_change(50, 50, 100, 60, GameType.STRAIGHT.value) > 0
+
+
+def test_rating_period_rates_every_day_once(rating_system):
+    rating_system.add_game("Anna", "Bernd", 5, 3, GameType.NORMAL.value, ADMIN)
+    rating_system.add_game("Anna", "Carla", 5, 0, GameType.NORMAL.value, ADMIN)
+    session = rating_system.Session()
+    session.query(Game).update({Game.created_at: date.today() - timedelta(days=2)})
+    session.commit()
+    session.close()
+    rating_system.add_game("Bernd", "Carla", 5, 4, GameType.NORMAL.value, ADMIN)
+
+    assert rating_system.run_rating_period(until=date.today()) == 2
+    assert rating_system.run_rating_period(until=date.today()) == 0
+
+    session = rating_system.Session()
+    ratings = {row.player: row for row in session.query(ModelRating).filter_by(model="glicko2")}
+    session.close()
+    assert sorted(row.games for row in ratings.values()) == [2, 2, 2]
+
+    comparison = rating_system.compare_rating_models()
+    assert [row["name"] for row in comparison][0] == "Anna"
+    assert {row["model_rank"] for row in comparison} == {1, 2, 3}
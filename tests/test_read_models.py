@@ -0,0 +1,113 @@
+import csv
+import os
+import sys
+import zipfile
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import update
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("ADMIN_PHONE_NUMBER", "490000000000")
+
+import read_models
+from benchmarks.local_storage import LocalSupabase
+from models import Rating
+from utils.enums import GameType
+from utils.exceptions import PlayerNotFoundException, PlayerNotInRatingException
+
+ADMIN = os.environ["ADMIN_PHONE_NUMBER"]
+
+
+@pytest.fixture
+def rating_system(rating_system):
+    for name, rating in [("Anna", 60), ("Bernd", 40), ("Carla", 50)]:
+        rating_system.adjust_rating(name, rating, 0, 0)
+    rating_system.add_player("Dieter", "494444444444")
+    return rating_system
+
+
+def test_rows_are_named_tuples(rating_system):
+    with rating_system.Session() as session:
+        assert read_models.player_names(session) == ["Anna", "Bernd", "Carla", "Dieter"]
+        assert [(row.name, row.rating) for row in read_models.leaderboard(session)] == [
+            ("Anna", 60),
+            ("Carla", 50),
+            ("Bernd", 40),
+        ]
+        assert read_models.player_rating(session, "Dieter").rating is None
+        assert read_models.player_rating(session, "Erika") is None
+        assert not hasattr(read_models.leaderboard(session)[0], "__dict__")
+
+
+def test_get_rating(rating_system):
+    assert rating_system.get_rating("Bernd") == 40
+    with pytest.raises(PlayerNotInRatingException):
+        rating_system.get_rating("Dieter")
+    with pytest.raises(PlayerNotFoundException):
+        rating_system.get_rating("Unbekannter Name")
+
+
+def test_games_are_streamed(rating_system, monkeypatch):
+    monkeypatch.setattr(read_models, "STREAM_SIZE", 2)
+    for scoreB in range(5):
+        rating_system.add_game("Anna", "Bernd", 5, scoreB, GameType.NORMAL.value, ADMIN)
+
+    with rating_system.Session() as session:
+        games = list(read_models.games(session))
+
+    assert sorted(game.scoreB for game in games) == [0, 1, 2, 3, 4]
+
+
+def test_rating_decay_only_changes_stale_ratings(rating_system):
+    with rating_system.Session() as session:
+        session.execute(update(Rating).values(last_change=date.today() - timedelta(days=31)))
+        session.execute(update(Rating).where(Rating.rating == 50).values(last_change=date.today() - timedelta(days=30)))
+        session.commit()
+
+    rating_system.apply_rating_decay()
+
+    ratings = {row["name"]: row["rating"] for row in rating_system.leaderboard()}
+    assert ratings == {"Anna": pytest.approx(58.2), "Carla": 50, "Bernd": pytest.approx(38.8)}
+    with rating_system.Session() as session:
+        assert {row.last_change for row in session.query(Rating)} == {date.today(), date.today() - timedelta(days=30)}
+
+
+def test_export_writes_csv_files(rating_system, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rating_system._supabase = LocalSupabase(str(tmp_path / "storage"))
+    rating_system.add_game("Anna", "Bernd", 5, 3, GameType.NORMAL.value, ADMIN)
+
+    rating_system.export_database()
+
+    [backup] = os.listdir(tmp_path / "storage" / "backup")
+    with zipfile.ZipFile(tmp_path / "storage" / "backup" / backup) as zf:
+        ratings = list(csv.DictReader(zf.read("ratings.csv").decode().splitlines()))
+        games = list(csv.DictReader(zf.read("games.csv").decode().splitlines()))
+    assert list(ratings[0]) == ["player", "rating", "games_won", "games_lost", "club"]
+    assert len(ratings) == 3
+    assert (games[0]["scoreA"], games[0]["scoreB"], games[0]["disciplin"]) == ("5", "3", "Normal")
+
+
+def test_rating_image_shows_the_best_ratings(rating_system, tmp_path, monkeypatch):
+    import dataframe_image
+
+    import rating_system as rating_system_module
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rating_system_module, "RATING_IMAGE_ROWS", 2)
+    rating_system._supabase = LocalSupabase(str(tmp_path / "storage"))
+    exported = []
+    export = dataframe_image.export
+    monkeypatch.setattr(
+        dataframe_image, "export", lambda styled, *args, **kwargs: exported.append(styled.data) or export(styled, *args, **kwargs)
+    )
+
+    rating_system.rating_image()
+
+    [table] = exported
+    assert list(table["Name"]) == ["Anna", "Carla"]
+    assert os.listdir(tmp_path / "storage" / "rating") == ["rating.png"]
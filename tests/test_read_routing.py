@@ -0,0 +1,132 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("ADMIN_PHONE_NUMBER", "490000000000")
+
+from models import Base
+from rating_system import RatingSystem
+from utils.read_routing import ReadYourWrites, acting_user, current_user
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_read_your_writes_window():
+    clock = Clock()
+    writes = ReadYourWrites(window=10, clock=clock)
+
+    writes.wrote("491111111111")
+    assert writes.needs_primary("491111111111")
+    assert not writes.needs_primary("492222222222")
+    assert not writes.needs_primary(None)
+
+    clock.now = 10
+    assert not writes.needs_primary("491111111111")
+
+
+def test_read_your_writes_forgets_old_writes():
+    clock = Clock()
+    writes = ReadYourWrites(window=10, clock=clock, max_size=2)
+
+    writes.wrote("a")
+    clock.now = 5
+    writes.wrote("b")
+    writes.wrote("c")
+    assert list(writes.last_writes) == ["b", "c"]
+
+    clock.now = 20
+    writes.wrote("d")
+    assert list(writes.last_writes) == ["d"]
+
+
+def test_acting_user_is_reset():
+    with acting_user("491111111111"):
+        assert current_user.get() == "491111111111"
+    assert current_user.get() is None
+
+
+@pytest.fixture
+def rating_system(tmp_path):
+    """Two SQLite files stand in for the primary and a replica that has not caught up yet."""
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    Base.metadata.create_all(replica)
+    rating_system = RatingSystem(engine=create_engine(f"sqlite:///{tmp_path / 'primary.db'}"), read_engine=replica)
+    rating_system._writes = ReadYourWrites(window=10, clock=Clock())
+    return rating_system
+
+
+def test_writes_go_to_the_primary_and_reads_to_the_replica(rating_system):
+    with acting_user("491111111111"):
+        rating_system.add_player("Anna", "491111111111")
+        rating_system.add_player_to_rating("491111111111")
+
+    # Another user reads the replica, which does not have the player yet
+    with acting_user("492222222222"):
+        assert rating_system.get_names() == []
+        assert rating_system.leaderboard() == []
+
+    # Without replica lag the new player shows up for everyone
+    rating_system._writes.clock.now = 10
+    with rating_system.Session() as session, rating_system.read_engine.begin() as replica:
+        for table in Base.metadata.sorted_tables:
+            rows = [dict(row._mapping) for row in session.execute(table.select())]
+            if rows:
+                replica.execute(table.insert(), rows)
+    with acting_user("492222222222"):
+        assert rating_system.get_names() == ["Anna"]
+
+
+def test_user_reads_own_write_from_the_primary(rating_system):
+    with acting_user("491111111111"):
+        rating_system.add_player("Anna", "491111111111")
+        rating_system.add_player_to_rating("491111111111")
+
+        assert rating_system.get_names() == ["Anna"]
+        assert rating_system.get_rating("Anna") == 50
+        assert [row["name"] for row in rating_system.leaderboard()] == ["Anna"]
+
+    rating_system._writes.clock.now = 10
+    with acting_user("491111111111"):
+        assert rating_system.get_names() == []
+
+
+def test_writes_resolve_names_on_the_primary(rating_system):
+    rating_system.add_player("Anna", "491111111111")
+    rating_system.add_player("Bernd", "492222222222")
+    rating_system.add_player_to_rating("491111111111")
+    rating_system.add_player_to_rating("492222222222")
+
+    # The window has passed, the replica still knows neither player
+    rating_system._writes.clock.now = 10
+    assert rating_system.get_names() == []
+    rating_system.add_game("Anna", "Bernd", 5, 3, "Normal", "491111111111")
+
+
+def test_without_replica_reads_use_the_primary(tmp_path):
+    rating_system = RatingSystem(engine=create_engine(f"sqlite:///{tmp_path / 'primary.db'}"))
+
+    assert rating_system.read_engine is rating_system.engine
+    assert rating_system.ReadSession is rating_system.Session
+
+
+def test_database_url_replaces_the_supabase_connection(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'local.db'}")
+    monkeypatch.delenv("SUPABASE_READ_HOST", raising=False)
+    rating_system = RatingSystem()
+
+    rating_system.add_player("Anna", "491111111111")
+
+    assert rating_system.engine.url.database == str(tmp_path / "local.db")
+    assert rating_system.get_names() == ["Anna"]
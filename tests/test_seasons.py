@@ -0,0 +1,139 @@
+import os
+import sys
+from datetime import date
+
+import pytest
+from sqlalchemy import text, update
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("ADMIN_PHONE_NUMBER", "490000000000")
+
+from backtest import load_history
+from models import ArchivedGame, Game, Rating, SeasonSummary
+from utils.enums import GameType
+from utils.exceptions import AdminPermissionException
+
+ADMIN = os.environ["ADMIN_PHONE_NUMBER"]
+CUTOFF = date(2026, 1, 1)
+
+
+@pytest.fixture
+def rating_system(rating_system):
+    # Stands in for the rating triggers of the database, which take back the rating change of a deleted game
+    with rating_system.engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TRIGGER revert_rating AFTER DELETE ON games BEGIN "
+                "UPDATE ratings SET rating = rating - OLD.rating_change WHERE player = OLD.playerA; "
+                "UPDATE ratings SET rating = rating + OLD.rating_change WHERE player = OLD.playerB; "
+                "END"
+            )
+        )
+    return rating_system
+
+
+def play(rating_system, playerA, playerB, scoreA, scoreB, day):
+    game_id, change = rating_system.add_game(playerA, playerB, scoreA, scoreB, GameType.NORMAL.value, ADMIN)
+    with rating_system.Session() as session:
+        session.execute(update(Game).where(Game.id == game_id).values(created_at=day))
+        session.commit()
+    return game_id, change
+
+
+def ratings(rating_system):
+    return {row["name"]: row["rating"] for row in rating_system.leaderboard()}
+
+
+@pytest.fixture
+def season(rating_system):
+    """Three games in 2025, one in 2026 and ratings that differ from the initial rating."""
+    changes = [
+        play(rating_system, "Anna", "Bernd", 5, 3, date(2025, 10, 1))[1],
+        -play(rating_system, "Bernd", "Anna", 5, 1, date(2025, 11, 1))[1],
+        play(rating_system, "Anna", "Carla", 5, 0, date(2025, 12, 1))[1],
+    ]
+    play(rating_system, "Anna", "Carla", 2, 5, date(2026, 2, 1))
+    with rating_system.Session() as session:
+        session.execute(update(Rating).values(rating=60))
+        session.commit()
+    return changes
+
+
+def test_archive_season_moves_old_games(rating_system, season):
+    before = rating_system.get_statistics("491111111111", "Carla")
+
+    result = rating_system.archive_season(" 2025 ", CUTOFF, ADMIN)
+
+    assert result == {"season": "2025", "games": 3, "players": 3}
+    with rating_system.Session() as session:
+        assert [game.created_at for game in session.query(Game)] == [date(2026, 2, 1)]
+        assert session.query(ArchivedGame).filter_by(season="2025").count() == 3
+        assert [summary.rating for summary in session.query(SeasonSummary)] == [60, 60, 60]
+    # The delete trigger took back the rating changes, the checkpoint restored the ratings
+    assert ratings(rating_system) == {"Anna": 60, "Bernd": 60, "Carla": 60}
+
+    stats = rating_system.get_statistics("491111111111", "Carla")
+    assert stats.pop("seasons") == [
+        {
+            "season": "2025",
+            "cutoff": CUTOFF,
+            "games": 3,
+            "games_won": 2,
+            "racks_won": 11,
+            "racks_lost": 8,
+            "rating_exchanged": pytest.approx(sum(season)),
+            "rating": 60,
+        }
+    ]
+    # Statistics over all games include the archived season
+    before.pop("seasons")
+    assert stats == before
+
+
+def test_statistics_can_be_rebuilt_after_archiving(rating_system, season):
+    # The games were moved into the past after they were counted
+    rating_system.rebuild_statistics(ADMIN)
+    rating_system.archive_season("2025", CUTOFF, ADMIN)
+    before = rating_system.get_statistics("492222222222", "Anna")
+
+    rating_system.rebuild_statistics(ADMIN)
+
+    assert rating_system.get_statistics("492222222222", "Anna") == before
+    assert before["games"] == 2
+
+
+def test_archive_season_is_checked(rating_system, season):
+    with pytest.raises(AdminPermissionException):
+        rating_system.archive_season("2025", CUTOFF, "491111111111")
+    with pytest.raises(ValueError):
+        rating_system.archive_season("2024", date(2025, 1, 1), ADMIN)
+
+    rating_system.archive_season("2025", CUTOFF, ADMIN)
+    with pytest.raises(ValueError):
+        rating_system.archive_season("2025", date(2026, 3, 1), ADMIN)
+
+
+def test_merge_players_moves_archived_games(rating_system, season):
+    rating_system.archive_season("2025", CUTOFF, ADMIN)
+
+    rating_system.merge_players("Anna", "Bernd", ADMIN)
+
+    with rating_system.Session() as session:
+        # Both games between Anna and Bernd are gone, the game against Carla belongs to Anna
+        assert session.query(ArchivedGame).count() == 1
+        summaries = {summary.player: summary for summary in session.query(SeasonSummary)}
+    assert len(summaries) == 2
+    assert sorted((summary.games, summary.rating) for summary in summaries.values()) == [(1, 60), (1, 70)]
+
+
+def test_backtest_replays_archived_games(rating_system, season):
+    rating_system.archive_season("2025", CUTOFF, ADMIN)
+
+    with rating_system.Session() as session:
+        games, race_to, players = load_history(session)
+
+    assert len(race_to) == 4
+    assert players == 3
@@ -0,0 +1,33 @@
+import json
+import os
+import subprocess
+import sys
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from benchmarks.bench_startup import ENVIRONMENT
+
+# What a spawned pool worker does before it runs a task: it runs the main module of the parent as __mp_main__
+WORKER = """
+import json, runpy, threading
+import sentry_sdk
+server = runpy.run_path("server.py", run_name="__mp_main__")
+print(json.dumps({
+    "threads": [thread.name for thread in threading.enumerate()],
+    "sentry": sentry_sdk.get_client().is_active(),
+    "stores": [server["user_states"] is None, server["seen_messages"] is None],
+}))
+"""
+
+
+def test_pool_workers_do_not_start_the_server():
+    output = subprocess.run(
+        [sys.executable, "-c", WORKER], cwd=parent, env={**os.environ, **ENVIRONMENT}, capture_output=True, text=True, check=True
+    )
+    worker = json.loads(output.stdout.strip().splitlines()[-1])
+
+    assert not [name for name in worker["threads"] if name.startswith("message-worker")]
+    assert not worker["sentry"]
+    assert worker["stores"] == [True, True]
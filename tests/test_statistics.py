@@ -0,0 +1,41 @@
+import os
+import sys
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("ADMIN_PHONE_NUMBER", "490000000000")
+
+from utils.enums import GameType
+
+ADMIN = os.environ["ADMIN_PHONE_NUMBER"]
+
+
+def test_statistics_follow_added_and_deleted_games(rating_system):
+    rating_system.add_game("Anna", "Bernd", 5, 3, GameType.NORMAL.value, ADMIN)
+    game_id, _ = rating_system.add_game("Bernd", "Anna", 5, 1, GameType.NORMAL.value, ADMIN)
+    rating_system.add_game("Anna", "Carla", 5, 0, GameType.NORMAL.value, ADMIN)
+
+    stats = rating_system.get_statistics("491111111111", "Bernd")
+    assert (stats["games"], stats["games_won"]) == (3, 2)
+    assert (stats["racks_won"], stats["racks_lost"]) == (11, 8)
+    assert stats["opponent"]["name"] == "Bernd"
+    assert (stats["opponent"]["games_won"], stats["opponent"]["games_lost"]) == (1, 1)
+    assert (stats["opponent"]["racks_won"], stats["opponent"]["racks_lost"]) == (6, 8)
+
+    rating_system.delete_game(game_id, ADMIN)
+
+    stats = rating_system.get_statistics("491111111111", "Bernd")
+    assert (stats["games"], stats["games_won"]) == (2, 2)
+    assert (stats["opponent"]["games_won"], stats["opponent"]["games_lost"]) == (1, 0)
+
+
+def test_rebuild_statistics_matches_incremental_updates(rating_system):
+    rating_system.add_game("Anna", "Bernd", 5, 3, GameType.NORMAL.value, ADMIN)
+    rating_system.add_game("Carla", "Anna", 5, 4, GameType.NORMAL.value, ADMIN)
+    before = rating_system.get_statistics("491111111111", "Carla")
+
+    rating_system.rebuild_statistics(ADMIN)
+
+    assert rating_system.get_statistics("491111111111", "Carla") == before
@@ -0,0 +1,137 @@
+import os
+import sys
+
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import create_engine, inspect, text, update
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+os.environ.setdefault("ADMIN_PHONE_NUMBER", "490000000000")
+
+from models import Base, Game, ModelRating, upgrade_schema
+from rating_system import RatingSystem
+from utils.enums import GameType
+from utils.exceptions import AdminPermissionException, ClubNotFoundException, GameNotFoundException, PlayerNotFoundException
+from utils.tenancy import DEFAULT_CLUB, club_context, club_id, is_admin
+
+ADMIN = os.environ["ADMIN_PHONE_NUMBER"]
+NORTH_ADMIN = "497777777777"
+
+
+@pytest.fixture
+def players():
+    return [("Anna", "491111111111"), ("Bernd", "492222222222")]
+
+
+@pytest.fixture
+def rating_system(rating_system):
+    rating_system.register_club("nord", "Billard Nord", "pnid-nord", [NORTH_ADMIN])
+    with club_context(rating_system.club_for("pnid-nord")):
+        # The same phone number can play in both clubs
+        for name, phone_number in [("Anna Nord", "491111111111"), ("Carla", "493333333333")]:
+            rating_system.add_player(name, phone_number)
+            rating_system.add_player_to_rating(phone_number)
+    return rating_system
+
+
+def test_messages_are_routed_by_whatsapp_number(rating_system):
+    north = rating_system.club_for("pnid-nord")
+    assert (north.id, north.caption, north.admins) == ("nord", "Billard Nord Rating Tabelle", {NORTH_ADMIN})
+    assert rating_system.club_for("unknown").id == DEFAULT_CLUB
+    assert [club.id for club in rating_system.clubs()] == [DEFAULT_CLUB, "nord"]
+    with pytest.raises(ClubNotFoundException):
+        rating_system.get_club("süd")
+
+    with club_context(north):
+        assert club_id() == "nord"
+        assert is_admin(NORTH_ADMIN) and not is_admin(ADMIN)
+    assert is_admin(ADMIN) and not is_admin(NORTH_ADMIN)
+
+
+def test_clubs_only_see_their_own_players_and_games(rating_system):
+    north = rating_system.club_for("pnid-nord")
+    game_id, _ = rating_system.add_game("Anna", "Bernd", 5, 3, GameType.NORMAL.value, ADMIN)
+
+    with club_context(north):
+        assert sorted(rating_system.get_names()) == ["Anna Nord", "Carla"]
+        assert [row["name"] for row in rating_system.leaderboard()] == ["Anna Nord", "Carla"]
+        # Fuzzy matching never resolves to a player of another club
+        with pytest.raises(PlayerNotFoundException):
+            rating_system.find_closest_name("Bernd")
+        with pytest.raises(GameNotFoundException):
+            rating_system.delete_game(game_id, NORTH_ADMIN)
+
+        rating_system.add_game("Carla", "Anna Nord", 5, 1, GameType.NORMAL.value, NORTH_ADMIN)
+        rating_system.adjust_rating("Carla", 60, 1, 0)
+        assert rating_system.get_statistics("491111111111")["games"] == 1
+        north_version = rating_system.leaderboard_version()
+
+    assert sorted(rating_system.get_names()) == ["Anna", "Bernd"]
+    assert rating_system.get_statistics("491111111111")["games"] == 1
+    assert rating_system.get_statistics("491111111111")["name"] == "Anna"
+    assert rating_system.leaderboard_version() != north_version
+
+
+def test_admins_are_per_club(rating_system):
+    north = rating_system.club_for("pnid-nord")
+
+    with pytest.raises(AdminPermissionException):
+        rating_system.find_duplicate_players(NORTH_ADMIN)
+    with club_context(north):
+        assert rating_system.find_duplicate_players(NORTH_ADMIN) == []
+        with pytest.raises(AdminPermissionException):
+            rating_system.find_duplicate_players(ADMIN)
+
+
+def test_rebuilding_statistics_keeps_other_clubs(rating_system):
+    rating_system.add_game("Anna", "Bernd", 5, 3, GameType.NORMAL.value, ADMIN)
+    north = rating_system.club_for("pnid-nord")
+
+    with club_context(north):
+        rating_system.rebuild_statistics(NORTH_ADMIN)
+
+    assert rating_system.get_statistics("492222222222")["games"] == 1
+
+
+def test_rating_periods_leave_other_clubs_alone(rating_system):
+    def play(playerA, playerB, scoreB, days_ago, phone_number):
+        game_id, _ = rating_system.add_game(playerA, playerB, 5, scoreB, GameType.NORMAL.value, phone_number)
+        with rating_system.Session() as session:
+            session.execute(update(Game).where(Game.id == game_id).values(created_at=date.today() - timedelta(days=days_ago)))
+            session.commit()
+
+    def model_ratings():
+        with rating_system.Session() as session:
+            return {row.player: (row.club, row.rating, row.deviation) for row in session.query(ModelRating)}
+
+    play("Anna", "Bernd", 3, 5, ADMIN)
+    assert rating_system.run_rating_period() == 1
+    default_ratings = model_ratings()
+    assert len(default_ratings) == 2
+
+    with club_context(rating_system.club_for("pnid-nord")):
+        for days_ago in (3, 2, 1):
+            play("Carla", "Anna Nord", days_ago, days_ago, NORTH_ADMIN)
+        assert rating_system.run_rating_period() == 3
+        assert {club for club, *_ in model_ratings().values()} == {"nord"}
+
+    assert model_ratings() == default_ratings
+
+
+def test_upgrade_adds_the_club_column(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE players (id CHAR(32) PRIMARY KEY, name VARCHAR NOT NULL, phone_number VARCHAR)"))
+        connection.execute(text("INSERT INTO players VALUES ('00000000000000000000000000000001', 'Anna', '491111111111')"))
+    Base.metadata.create_all(engine)
+
+    upgrade_schema(engine)
+    upgrade_schema(engine)
+
+    assert "club" in {column["name"] for column in inspect(engine).get_columns("players")}
+    rating_system = RatingSystem(engine=engine)
+    assert rating_system.get_names() == ["Anna"]
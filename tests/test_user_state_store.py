@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+
+import pytest
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from utils.enums import UserState
+from utils.user_state_store import InMemoryUserStateStore, SQLiteUserStateStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def create_store(request, tmp_path):
+    def create(**kwargs):
+        if request.param == "memory":
+            return InMemoryUserStateStore(**kwargs)
+        return SQLiteUserStateStore(str(tmp_path / "states.db"), **kwargs)
+
+    return create
+
+
+def test_set_get_and_pop(create_store):
+    store = create_store()
+    store.set("491111", UserState.ADD_GAME.value)
+
+    assert store.get("491111") == UserState.ADD_GAME.value
+    assert store.pop("491111") == UserState.ADD_GAME.value
+    assert store.get("491111") is None
+    assert store.pop("491111") is None
+
+
+def test_transition_only_from_expected_state(create_store):
+    store = create_store()
+
+    assert store.transition("491111", None, UserState.ADMIN.value)
+    assert not store.transition("491111", None, UserState.ADD_GAME.value)
+    assert store.transition("491111", UserState.ADMIN.value, UserState.ADMIN_ADJUST_RATING.value)
+    assert store.get("491111") == UserState.ADMIN_ADJUST_RATING.value
+
+
+def test_states_expire(create_store, monkeypatch):
+    store = create_store(ttl=10)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    store.set("491111", UserState.ADD_GAME.value)
+
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert store.get("491111") is None
+    assert len(store) == 0
+
+
+def test_store_is_bounded(create_store):
+    store = create_store(max_size=2)
+    for phone_number in ("491111", "492222", "493333"):
+        store.set(phone_number, UserState.ADD_GAME.value)
+
+    assert len(store) == 2
+    assert store.get("491111") is None
+    assert store.get("493333") == UserState.ADD_GAME.value
+
+
+def test_sqlite_store_is_shared(tmp_path):
+    path = str(tmp_path / "states.db")
+    first = SQLiteUserStateStore(path)
+    second = SQLiteUserStateStore(path)
+
+    first.set("491111", UserState.DELETE_GAME.value)
+    assert second.pop("491111") == UserState.DELETE_GAME.value
+    assert first.get("491111") is None
@@ -0,0 +1,93 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class SeenMessages:
+    """Remembers the ids of received WhatsApp messages to suppress redelivered webhooks.
+
+    Ids are kept for `ttl` seconds, at most `max_size` of them in memory. If a `path` is
+    given, the ids are also written to a SQLite file, so they survive restarts and can be
+    shared between server processes. Expired rows are deleted from the file every
+    `prune_every` stored ids.
+    """
+
+    def __init__(self, ttl: float = 24 * 60 * 60, max_size: int = 100000, path: str = None, prune_every: int = 1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.prune_every = prune_every
+        self.stored = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.checked = 0
+        self.duplicates = 0
+
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.db.execute("CREATE TABLE IF NOT EXISTS seen_messages (id TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS seen_messages_expires_at ON seen_messages (expires_at)")
+            self._load()
+
+    def _prune(self, now: float):
+        self.db.execute("DELETE FROM seen_messages WHERE expires_at <= ?", (now,))
+
+    def _load(self):
+        self._prune(time.time())
+        rows = self.db.execute(
+            "SELECT id, expires_at FROM seen_messages ORDER BY expires_at DESC LIMIT ?", (self.max_size,)
+        ).fetchall()
+        for message_id, expires_at in reversed(rows):
+            self.entries[message_id] = expires_at
+
+    def _expire(self, now: float):
+        # All ids live equally long, so the oldest entries expire first
+        while self.entries:
+            message_id, expires_at = next(iter(self.entries.items()))
+            if expires_at > now:
+                break
+            self.entries.popitem(last=False)
+
+    def _claim_persisted(self, message_id: str, now: float) -> bool:
+        """Stores the id in the database and returns False if another process already stored it."""
+        cursor = self.db.execute(
+            "INSERT INTO seen_messages (id, expires_at) VALUES (?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET expires_at = excluded.expires_at WHERE seen_messages.expires_at <= ?",
+            (message_id, now + self.ttl, now),
+        )
+        if cursor.rowcount != 1:
+            return False
+
+        self.stored += 1
+        if self.stored % self.prune_every == 0:
+            self._prune(now)
+        return True
+
+    def check_and_add(self, message_id: str) -> bool:
+        """Returns True if the message id is new and marks it as seen."""
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            self.checked += 1
+
+            if message_id in self.entries or (self.db and not self._claim_persisted(message_id, now)):
+                self.duplicates += 1
+                return False
+
+            self.entries[message_id] = now + self.ttl
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            return True
+
+    def discard(self, message_id: str):
+        """Forgets the message id, e.g. because the message could not be processed."""
+        with self.lock:
+            self.entries.pop(message_id, None)
+            if self.db:
+                self.db.execute("DELETE FROM seen_messages WHERE id = ?", (message_id,))
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"checked": self.checked, "duplicates": self.duplicates, "size": len(self.entries)}
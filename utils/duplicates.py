@@ -0,0 +1,51 @@
+from collections import defaultdict
+from itertools import combinations
+
+# token_sort_ratio from which two player names are reported as likely duplicates
+DUPLICATE_THRESHOLD = 85
+# Blocks larger than this (e.g. a very common first name) are not compared as a whole
+MAX_BLOCK_SIZE = 200
+
+
+def blocking_keys(name: str) -> set[str]:
+    """Tokens of the name and their first three characters.
+
+    Two names are only compared if they share a key, so 'Streit, Horst' meets 'Horst Streit'
+    and 'Horst Streid' without scoring every pair of players.
+    """
+    from rapidfuzz import utils
+
+    tokens = [token for token in utils.default_process(name).split() if len(token) > 1]
+    return set(tokens) | {f"{token[:3]}*" for token in tokens if len(token) > 3}
+
+
+def find_duplicates(names: list[str], threshold: float = DUPLICATE_THRESHOLD) -> list[tuple[int, int, float]]:
+    """Pairs of indices (i < j) of names that likely belong to the same person, best first.
+
+    Names are grouped by their blocking keys, every block is scored with one rapidfuzz
+    cdist call instead of comparing all n² pairs.
+    """
+    from rapidfuzz import fuzz, process, utils
+
+    blocks = defaultdict(list)
+    for i, name in enumerate(names):
+        for key in blocking_keys(name):
+            blocks[key].append(i)
+
+    pairs = {}
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > MAX_BLOCK_SIZE:
+            continue
+        scores = process.cdist(
+            [names[i] for i in members],
+            [names[i] for i in members],
+            scorer=fuzz.token_sort_ratio,
+            processor=utils.default_process,
+            score_cutoff=threshold,
+        )
+        for a, b in combinations(range(len(members)), 2):
+            if scores[a, b]:
+                i, j = sorted((members[a], members[b]))
+                pairs[(i, j)] = float(scores[a, b])
+
+    return sorted(((i, j, score) for (i, j), score in pairs.items()), key=lambda pair: (-pair[2], pair[0], pair[1]))
@@ -32,7 +32,11 @@ class UserState(Enum):
     ADD_TOURNAMENT = "add_tournament"
     ADD_GAME = "add_game"
     DELETE_GAME = "delete_game"
+    STATISTICS = "statistics"
+    PREDICTION = "prediction"
 
     ADMIN_ADD_PLAYER = "admin_add_player"
     ADMIN_DELETE_PLAYER = "admin_delete_player"
     ADMIN_ADJUST_RATING = "admin_adjust_rating"
+    ADMIN_MERGE_PLAYERS = "admin_merge_players"
+    ADMIN_ARCHIVE_SEASON = "admin_archive_season"
@@ -50,6 +50,14 @@ class GameTypeNotSupportedException(Exception):
         self.game_type = game_type
 
 
+class GameFormatException(Exception):
+    """Exception raised for errors in the Rating System."""
+
+    def __init__(self, line: int, text: str):
+        super().__init__(f"Zeile {line} nicht erkannt: {text}")
+        self.line = line
+
+
 class PlayerNotInGameException(Exception):
     """Exception raised for errors in the Rating System."""
 
@@ -62,3 +70,26 @@ class AdminPermissionException(Exception):
 
     def __init__(self):
         super().__init__(f"Du hast keine Berechtigung, diese Aktion auszuführen.")
+
+
+class PlayerHasNoHistoryException(Exception):
+    """Exception raised for errors in the Rating System."""
+
+    def __init__(self, name: str):
+        super().__init__(f"Für {name} gibt es noch keinen Rating-Verlauf.")
+
+
+class MessageQueueFullException(Exception):
+    """Exception raised when the message queue cannot take any more messages."""
+
+    def __init__(self, phone_number: str):
+        super().__init__(f"Nachricht von {phone_number} konnte nicht eingereiht werden, die Warteschlange ist voll.")
+        self.phone_number = phone_number
+
+
+class ClubNotFoundException(Exception):
+    """Exception raised for errors in the Rating System."""
+
+    def __init__(self, club: str):
+        super().__init__(f"Verein {club} nicht gefunden.")
+        self.club = club
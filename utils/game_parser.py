@@ -0,0 +1,67 @@
+import re
+from typing import NamedTuple
+
+from utils.enums import GameType
+from utils.exceptions import GameFormatException, GameTypeNotSupportedException
+
+SCORE = re.compile(r"(\d+)[ \t]*:[ \t]*(\d+)")
+SCORE_LINE = re.compile(r"^(\s*\d+[ \t]*:[ \t]*\d+[\s,;]*)+$")
+GAME_TYPES = {game_type.lower(): game_type for game_type in GameType.get_values()}
+
+
+class ParsedGame(NamedTuple):
+    line: int
+    disciplin: str
+    nameA: str
+    nameB: str
+    scoreA: int
+    scoreB: int
+
+
+def parse_games(message: str, default_type: str = GameType.NORMAL.value) -> list[ParsedGame]:
+    """Reads any number of pairings from one message.
+
+    A game type line applies to all following pairings, a 'Spieler A: Spieler B' line
+    starts a pairing and every score 'A:B' below it is one game:
+
+        Normal
+        Anna: Bernd
+        5:3
+        4:5
+        Carla: Dieter
+        5:1 5:2
+        14.1
+        Anna: Carla
+        100:80
+    """
+    games = []
+    disciplin = default_type
+    pairing = None
+    pairing_games = 0
+
+    for number, line in enumerate(message.strip().splitlines(), start=1):
+        text = line.strip()
+        if not text:
+            continue
+
+        if text.lower() in GAME_TYPES:
+            disciplin = GAME_TYPES[text.lower()]
+        elif SCORE_LINE.match(text):
+            if not pairing:
+                raise GameFormatException(number, "Ergebnis ohne Spieler")
+            for scoreA, scoreB in SCORE.findall(text):
+                games.append(ParsedGame(number, disciplin, *pairing, int(scoreA), int(scoreB)))
+                pairing_games += 1
+        elif text.count(":") == 1 and all(name.strip() for name in text.split(":")):
+            if pairing and not pairing_games:
+                raise GameFormatException(pairing_line, "Paarung ohne Ergebnis")
+            pairing = tuple(name.strip() for name in text.split(":"))
+            pairing_line, pairing_games = number, 0
+        elif ":" not in text and not pairing:
+            raise GameTypeNotSupportedException(text)
+        else:
+            raise GameFormatException(number, text)
+
+    if pairing and not pairing_games:
+        raise GameFormatException(pairing_line, "Paarung ohne Ergebnis")
+    return games
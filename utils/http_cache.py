@@ -0,0 +1,62 @@
+import threading
+import time
+
+from flask import Response, request
+
+
+class VersionedCache:
+    """Keeps values built from the database until the data version changes.
+
+    Looking up the version costs a query itself, so it is checked at most every
+    `check_interval` seconds. A value is built by one thread only, concurrent
+    requests for the same value wait for it instead of building it again.
+    """
+
+    def __init__(self, version, check_interval: float = 5.0, clock=time.monotonic):
+        self._version = version
+        self.check_interval = check_interval
+        self.clock = clock
+        self.values = {}
+        self.lock = threading.Lock()
+        self.build_locks = {}
+        self.checked = (None, float("-inf"))
+
+    def version(self) -> str:
+        with self.lock:
+            version, checked_at = self.checked
+            if self.clock() - checked_at < self.check_interval:
+                return version
+        version = self._version()
+        with self.lock:
+            self.checked = (version, self.clock())
+        return version
+
+    def get(self, name: str, build) -> tuple[str, object]:
+        """Returns the version and the value, built with `build()` if it is missing or outdated."""
+        version = self.version()
+        cached = self.values.get(name)
+        if cached and cached[0] == version:
+            return cached
+
+        with self.lock:
+            build_lock = self.build_locks.setdefault(name, threading.Lock())
+        with build_lock:
+            cached = self.values.get(name)
+            if cached and cached[0] == version:
+                return cached
+            cached = (version, build())
+            self.values[name] = cached
+            return cached
+
+    def invalidate(self):
+        with self.lock:
+            self.checked = (None, float("-inf"))
+
+
+def cached_response(body, version: str, mimetype: str, max_age: int) -> Response:
+    """Response with a strong ETag of the version, answered with 304 if the client already has it."""
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(version)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
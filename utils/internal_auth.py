@@ -0,0 +1,25 @@
+import hmac
+import logging
+from functools import wraps
+from os import environ
+
+from flask import request
+
+
+def internal_only(view):
+    """Answers with 403 before the Flask view runs unless the request carries the internal token.
+
+    Monitoring and operations routes expect `Authorization: Bearer <INTERNAL_API_TOKEN>`.
+    Without INTERNAL_API_TOKEN in the environment the routes are closed for everyone.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = environ.get("INTERNAL_API_TOKEN")
+        scheme, _, given = request.headers.get("Authorization", "").partition(" ")
+        if not token or scheme.lower() != "bearer" or not hmac.compare_digest(given.encode(), token.encode()):
+            logging.warning("Unberechtigter Zugriff von %s auf %s.", request.remote_addr, request.path)
+            return "Forbidden", 403
+        return view(*args, **kwargs)
+
+    return wrapper
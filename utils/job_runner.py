@@ -0,0 +1,156 @@
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from sentry_sdk import capture_exception
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from models import JobRun, ScheduledJob
+
+SUCCESS = "success"
+ERROR = "error"
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class JobRunner:
+    """Runs scheduled jobs exactly once across all server processes.
+
+    Every process calls `tick` regularly. A job is only run by the process that manages
+    to move its `next_run_at` forward in the `scheduled_jobs` table. The next run is
+    always computed from the current time, so runs missed during a downtime are
+    coalesced into a single run. Every run is recorded in `job_runs`.
+    """
+
+    def __init__(self, Session, lease_seconds: float = 60 * 60):
+        self.Session = Session
+        self.lease = timedelta(seconds=lease_seconds)
+        self.worker = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.jobs = {}
+
+    def add_job(self, name: str, func, trigger):
+        """Registers a job with an APScheduler trigger that computes its fire times."""
+        self.jobs[name] = (func, trigger)
+
+    def tick(self):
+        for name in self.jobs:
+            scheduled_for = self._claim(name)
+            if scheduled_for:
+                self._run(name, scheduled_for)
+
+    def _next_run(self, trigger, now: datetime) -> datetime:
+        aware_now = now.replace(tzinfo=timezone.utc)
+        next_run = trigger.get_next_fire_time(aware_now, aware_now)
+        return next_run.astimezone(timezone.utc).replace(tzinfo=None)
+
+    def _claim(self, name: str) -> datetime | None:
+        """Takes the lease of a due job and returns the time it was scheduled for."""
+        _, trigger = self.jobs[name]
+        session = self.Session()
+        try:
+            now = utcnow()
+            job = session.query(ScheduledJob).filter_by(name=name).first()
+            if not job:
+                session.add(ScheduledJob(name=name, next_run_at=self._next_run(trigger, now)))
+                session.commit()
+                return None
+
+            scheduled_for = job.next_run_at
+            if scheduled_for > now:
+                return None
+
+            claimed = (
+                session.query(ScheduledJob)
+                .filter(
+                    ScheduledJob.name == name,
+                    ScheduledJob.next_run_at == scheduled_for,
+                    or_(ScheduledJob.locked_until.is_(None), ScheduledJob.locked_until < now),
+                )
+                .update(
+                    {
+                        ScheduledJob.next_run_at: self._next_run(trigger, now),
+                        ScheduledJob.locked_by: self.worker,
+                        ScheduledJob.locked_until: now + self.lease,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            session.commit()
+            return scheduled_for if claimed == 1 else None
+        except IntegrityError:
+            # Another process registered the job at the same time
+            session.rollback()
+            return None
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Job %s konnte nicht gestartet werden: %s", name, e)
+            return None
+        finally:
+            session.close()
+
+    def _run(self, name: str, scheduled_for: datetime):
+        func, _ = self.jobs[name]
+        started_at = utcnow()
+        start = time.perf_counter()
+        outcome, error = SUCCESS, None
+        try:
+            func()
+            logging.info("Job %s wurde ausgeführt.", name)
+        except Exception as e:
+            outcome, error = ERROR, str(e)
+            capture_exception(e)
+            logging.error("Job %s ist fehlgeschlagen: %s", name, e)
+        duration = time.perf_counter() - start
+
+        session = self.Session()
+        try:
+            session.add(
+                JobRun(
+                    job=name,
+                    worker=self.worker,
+                    scheduled_for=scheduled_for,
+                    started_at=started_at,
+                    duration=duration,
+                    outcome=outcome,
+                    error=error,
+                )
+            )
+            session.query(ScheduledJob).filter_by(name=name, locked_by=self.worker).update(
+                {ScheduledJob.locked_by: None, ScheduledJob.locked_until: None}, synchronize_session=False
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            capture_exception(e)
+            logging.error("Transaction failed: %s", e)
+        finally:
+            session.close()
+
+    def history(self, job: str = None, limit: int = 50) -> list[dict]:
+        session = self.Session()
+        try:
+            query = session.query(JobRun)
+            if job:
+                query = query.filter_by(job=job)
+            runs = query.order_by(JobRun.started_at.desc()).limit(limit).all()
+            return [
+                {
+                    "job": run.job,
+                    "worker": run.worker,
+                    "scheduled_for": run.scheduled_for.isoformat(),
+                    "started_at": run.started_at.isoformat(),
+                    "duration": run.duration,
+                    "outcome": run.outcome,
+                    "error": run.error,
+                }
+                for run in runs
+            ]
+        finally:
+            session.close()
@@ -0,0 +1,109 @@
+import atexit
+import json
+import logging
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+
+from utils.rate_limiter import RateLimiter
+
+# Attributes every LogRecord has, everything else was passed with `extra`
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "suppressed"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """Hands records to the writer thread without formatting them on the calling thread.
+
+    If the queue is full the record is dropped instead of blocking the request.
+    """
+
+    def __init__(self, queue: Queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """Rate limits chatty lines below WARNING per logger and message template.
+
+    The number of dropped records is attached to the next record of the same template.
+    """
+
+    def __init__(self, rate: float = 5, burst: float = 20):
+        super().__init__()
+        self.limiter = RateLimiter(rate=rate, burst=burst)
+        self.suppressed = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        # Non-string messages (e.g. logging.info(some_list)) share one bucket per type
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg).__name__)
+        if not self.limiter.try_acquire(key):
+            with self.lock:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+            return False
+
+        with self.lock:
+            record.suppressed = self.suppressed.pop(key, 0)
+        return True
+
+
+_listener = None
+
+
+def configure_logging(level: int = logging.INFO, rate: float = 5, burst: float = 20, max_queue_size: int = 10000):
+    """Routes all records through a queue to a JSON writer thread. Calling it again has no effect."""
+    global _listener
+    if _listener:
+        return _listener
+
+    queue = Queue(maxsize=max_queue_size)
+    handler = BackgroundQueueHandler(queue)
+    handler.addFilter(SamplingFilter(rate=rate, burst=burst))
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,56 @@
+from utils.message_provider import MessageProvider
+
+# WhatsApp rejects text messages with a longer body
+MAX_BODY_LENGTH = 4096
+
+
+def split_message(lines: list[str], limit: int = MAX_BODY_LENGTH) -> list[str]:
+    """Joins the lines into as few messages as possible, each at most `limit` characters long."""
+    messages = []
+    current = ""
+    for line in lines:
+        # Lines that do not fit into one message on their own are cut
+        while len(line) > limit:
+            if current:
+                messages.append(current)
+                current = ""
+            messages.append(line[:limit])
+            line = line[limit:]
+
+        if not current:
+            current = line
+        elif len(current) + 1 + len(line) <= limit:
+            current += "\n" + line
+        else:
+            messages.append(current)
+            current = line
+
+    if current:
+        messages.append(current)
+    return messages
+
+
+class MessageBatch:
+    """Collects the results of one operation and sends them as a few summary messages."""
+
+    def __init__(self, phone_number_id, phone_number, limit: int = MAX_BODY_LENGTH):
+        self.phone_number_id = phone_number_id
+        self.phone_number = phone_number
+        self.limit = limit
+        self.lines = []
+
+    def add(self, line: str):
+        self.lines.append(line)
+
+    def send(self) -> int:
+        messages = split_message(self.lines, self.limit)
+        self.lines = []
+        for message in messages:
+            MessageProvider.send_message(self.phone_number_id, self.phone_number, message)
+        return len(messages)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.send()
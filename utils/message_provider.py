@@ -2,17 +2,81 @@ from os import environ
 
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.metrics import whatsapp_send_errors, whatsapp_send_seconds
+from utils.rate_limiter import RateLimiter
 
 load_dotenv()
 
+API_URL = environ.get("WHATSAPP_API_URL", "https://graph.facebook.com/v20.0")
+# (connect, read) timeouts in seconds
+TIMEOUT = (3.05, 10)
+
+
+def create_session(headers) -> requests.Session:
+    """Creates a keep-alive session that retries rate limited and failed requests with backoff.
+
+    A request is only retried on the listed status codes or if the connection could not
+    be established. After a read timeout or a dropped connection the message may have been
+    delivered already, so these are not retried.
+    """
+    retry = Retry(
+        total=3,
+        connect=3,
+        read=0,
+        other=0,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=int(environ.get("WHATSAPP_POOL_SIZE", 16)), max_retries=retry)
+
+    session = requests.Session()
+    session.headers.update(headers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
 
 class MessageProvider:
 
-    url_for = lambda phone_number_id: f"https://graph.facebook.com/v20.0/{phone_number_id}/messages"
+    url_for = lambda phone_number_id: f"{API_URL}/{phone_number_id}/messages"
     headers = {
         "Authorization": f"Bearer {environ['WHATSAPP_TOKEN']}",
         "Content-Type": "application/json",
     }
+    session = create_session(headers)
+    # Messages per second and phone number id
+    rate_limiter = RateLimiter(rate=float(environ.get("WHATSAPP_RATE_LIMIT", 20)))
+
+    @staticmethod
+    def post(phone_number_id, payload):
+        MessageProvider.rate_limiter.acquire(phone_number_id)
+        try:
+            with whatsapp_send_seconds.time(type=payload.get("type", "unknown")):
+                response = MessageProvider.session.post(MessageProvider.url_for(phone_number_id), json=payload, timeout=TIMEOUT)
+            response.raise_for_status()
+        except requests.RequestException:
+            whatsapp_send_errors.inc(type=payload.get("type", "unknown"))
+            raise
+        return response
+
+    @staticmethod
+    def download_media(media_id: str, max_size: int = 1 << 20) -> bytes:
+        """Downloads a file sent to the bot, e.g. a CSV document."""
+        response = MessageProvider.session.get(f"{API_URL}/{media_id}", timeout=TIMEOUT)
+        response.raise_for_status()
+        media = response.json()
+        if int(media.get("file_size", 0)) > max_size:
+            raise ValueError(f"Die Datei ist zu groß (maximal {max_size // 1024} KB).")
+
+        response = MessageProvider.session.get(media["url"], timeout=TIMEOUT)
+        response.raise_for_status()
+        return response.content[:max_size]
 
     @staticmethod
     def send_inital_message(phone_number_id, phone_number):
@@ -37,6 +101,21 @@ class MessageProvider:
                                     "title": "Rating anschauen",
                                     "description": "Schickt dir ein Bild mit dem aktuellen Rating",
                                 },
+                                {
+                                    "id": "rating_history",
+                                    "title": "Mein Verlauf",
+                                    "description": "Schickt dir ein Bild mit deinem Rating-Verlauf",
+                                },
+                                {
+                                    "id": "statistics",
+                                    "title": "Statistik",
+                                    "description": "Deine Bilanz insgesamt und gegen einen Gegner",
+                                },
+                                {
+                                    "id": "prediction",
+                                    "title": "Prognose",
+                                    "description": "Siegchancen für ein Spiel oder ein Turnier",
+                                },
                             ],
                         },
                         {
@@ -67,8 +146,7 @@ class MessageProvider:
             },
         }
 
-        response = requests.post(MessageProvider.url_for(phone_number_id), json=payload, headers=MessageProvider.headers)
-        response.raise_for_status()
+        MessageProvider.post(phone_number_id, payload)
 
     @staticmethod
     def send_admin_list(phone_number_id, phone_number):
@@ -93,6 +171,16 @@ class MessageProvider:
                                     "title": "Backup erstellen",
                                     "description": "Erstellt ein Backup der Datenbank",
                                 },
+                                {
+                                    "id": "rebuild_statistics",
+                                    "title": "Statistik neu berechnen",
+                                    "description": "Berechnet die Spielerstatistiken aus allen Spielen neu",
+                                },
+                                {
+                                    "id": "archive_season",
+                                    "title": "Saison archivieren",
+                                    "description": "Archiviert die Spiele vor einem Stichtag",
+                                },
                             ],
                         },
                         {
@@ -103,6 +191,11 @@ class MessageProvider:
                                     "title": "Rating anpassen",
                                     "description": "Passt das Rating eines Spielers an",
                                 },
+                                {
+                                    "id": "compare_models",
+                                    "title": "Modelle vergleichen",
+                                    "description": "Vergleicht das Rating mit Glicko-2",
+                                },
                             ],
                         },
                         {
@@ -118,6 +211,16 @@ class MessageProvider:
                                     "title": "Spieler löschen",
                                     "description": "Löscht einen Spieler aus dem Rating und dem System",
                                 },
+                                {
+                                    "id": "find_duplicates",
+                                    "title": "Duplikate suchen",
+                                    "description": "Findet Spieler, die doppelt angelegt wurden",
+                                },
+                                {
+                                    "id": "merge_players",
+                                    "title": "Spieler zusammenführen",
+                                    "description": "Übernimmt die Spiele eines Duplikats",
+                                },
                             ],
                         },
                     ],
@@ -125,16 +228,14 @@ class MessageProvider:
             },
         }
 
-        response = requests.post(MessageProvider.url_for(phone_number_id), json=payload, headers=MessageProvider.headers)
-        response.raise_for_status()
+        MessageProvider.post(phone_number_id, payload)
 
     @staticmethod
     def send_game_flow_message(phone_number_id, phone_number):
         # TODO: Implement
         payload = {}
 
-        response = requests.post(MessageProvider.url_for(phone_number_id), json=payload, headers=MessageProvider.headers)
-        response.raise_for_status()
+        MessageProvider.post(phone_number_id, payload)
 
     @staticmethod
     def send_image(phone_number_id, phone_number, url):
@@ -146,8 +247,7 @@ class MessageProvider:
             "image": {"link": url},
         }
 
-        response = requests.post(MessageProvider.url_for(phone_number_id), json=payload, headers=MessageProvider.headers)
-        response.raise_for_status()
+        MessageProvider.post(phone_number_id, payload)
 
     @staticmethod
     def send_message(phone_number_id, phone_number, message):
@@ -158,5 +258,4 @@ class MessageProvider:
             "text": {"body": message},
         }
 
-        response = requests.post(MessageProvider.url_for(phone_number_id), json=payload, headers=MessageProvider.headers)
-        response.raise_for_status()
+        MessageProvider.post(phone_number_id, payload)
@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from queue import Empty, Full, Queue
+from zlib import crc32
+
+from sentry_sdk import capture_exception
+
+from utils.exceptions import MessageQueueFullException
+from utils.metrics import registry
+
+queue_wait_seconds = registry.histogram("message_queue_wait_seconds", "Time a message waited in the queue.")
+processing_seconds = registry.histogram("message_processing_seconds", "Processing time of a message.")
+
+
+class MessageQueue:
+    """Bounded worker pool for incoming WhatsApp messages.
+
+    Every phone number is pinned to one worker, so messages of the same user are
+    processed in the order they arrived while different users are handled in parallel.
+    """
+
+    def __init__(self, handler, workers: int = 4, max_size: int = 1000):
+        self.handler = handler
+        self.queues = [Queue(maxsize=max(1, max_size // workers)) for _ in range(workers)]
+        self.threads = []
+        self.stopping = threading.Event()
+
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.total_processing = 0.0
+        self.max_processing = 0.0
+
+    def start(self):
+        self.stopping.clear()
+        for index, queue in enumerate(self.queues):
+            thread = threading.Thread(target=self._work, args=(queue,), name=f"message-worker-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout: float = 30.0):
+        """Lets the workers finish the queued messages and waits at most `timeout` seconds for them.
+
+        Never blocks on a full queue: a worker with an empty queue is woken up by a marker,
+        a worker with a full queue sees the stop event once its queue is empty.
+        """
+        self.stopping.set()
+        for queue in self.queues:
+            try:
+                queue.put_nowait(None)
+            except Full:
+                pass
+
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        running = [thread.name for thread in self.threads if thread.is_alive()]
+        if running:
+            logging.warning("Worker %s nach %s Sekunden nicht beendet.", ", ".join(running), timeout)
+        self.threads = []
+
+    def submit(self, phone_number: str, *args):
+        queue = self.queues[crc32(phone_number.encode()) % len(self.queues)]
+        try:
+            queue.put_nowait((time.monotonic(), args))
+        except Full:
+            with self.lock:
+                self.rejected += 1
+            raise MessageQueueFullException(phone_number)
+
+    def join(self):
+        for queue in self.queues:
+            queue.join()
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    def stats(self) -> dict:
+        with self.lock:
+            done = self.processed + self.failed
+            return {
+                "queue_depth": self.depth(),
+                "workers": len(self.queues),
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_seconds": self.total_wait / done if done else 0.0,
+                "avg_processing_seconds": self.total_processing / done if done else 0.0,
+                "max_processing_seconds": self.max_processing,
+            }
+
+    def _work(self, queue: Queue):
+        while True:
+            if self.stopping.is_set():
+                try:
+                    item = queue.get_nowait()
+                except Empty:
+                    return
+            else:
+                item = queue.get()
+            if item is None:
+                queue.task_done()
+                continue
+
+            enqueued_at, args = item
+            started_at = time.monotonic()
+            failed = False
+            try:
+                self.handler(*args)
+            except Exception as e:
+                failed = True
+                capture_exception(e)
+                logging.error("Nachricht konnte nicht verarbeitet werden: %s", e)
+            finally:
+                finished_at = time.monotonic()
+                queue_wait_seconds.observe(started_at - enqueued_at)
+                processing_seconds.observe(finished_at - started_at, outcome="error" if failed else "success")
+                with self.lock:
+                    if failed:
+                        self.failed += 1
+                    else:
+                        self.processed += 1
+                    self.total_wait += started_at - enqueued_at
+                    self.total_processing += finished_at - started_at
+                    self.max_processing = max(self.max_processing, finished_at - started_at)
+                queue.task_done()
@@ -0,0 +1,169 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback when the metrics are rendered."""
+
+    def __init__(self, name: str, help: str, func):
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.func()}"]
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., +Inf count, sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self.lock:
+            counts = self.values.get(tuple(sorted(labels.items())))
+            return sum(counts[:-1]) if counts else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, counts in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket in zip(self.buckets + ("+Inf",), counts[:-1]):
+                    cumulative += bucket
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {counts[-1]}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, name: str, create):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = create()
+            return self.metrics[name]
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(name, lambda: Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(name, lambda: Histogram(name, help, buckets))
+
+    def gauge(self, name: str, help: str, func) -> Gauge:
+        with self.lock:
+            self.metrics[name] = Gauge(name, help, func)
+            return self.metrics[name]
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+name_resolution_seconds = registry.histogram("name_resolution_seconds", "Fuzzy matching of a player name.")
+method_seconds = registry.histogram("rating_system_method_seconds", "Duration of a RatingSystem method.")
+db_seconds = registry.histogram("rating_system_db_seconds", "Database time spent in a RatingSystem method.")
+render_seconds = registry.histogram("render_seconds", "Rendering of an image.")
+storage_upload_seconds = registry.histogram("storage_upload_seconds", "Upload of a file to the storage.")
+whatsapp_send_seconds = registry.histogram("whatsapp_send_seconds", "Sending a message to the WhatsApp API.")
+whatsapp_send_errors = registry.counter("whatsapp_send_errors_total", "Messages the WhatsApp API did not accept.")
+
+# Database time of the instrumented methods currently running on this thread
+_active = threading.local()
+
+
+def instrument_engine(engine):
+    """Adds the duration of every statement executed on the engine to the running methods."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_start"].pop()
+        for totals in getattr(_active, "stack", []):
+            totals[0] += duration
+
+
+def measured(method):
+    """Records the duration and the database time of a RatingSystem method."""
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        stack = getattr(_active, "stack", None)
+        if stack is None:
+            stack = _active.stack = []
+        totals = [0.0]
+        stack.append(totals)
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            method_seconds.observe(time.perf_counter() - start, method=method.__name__)
+            db_seconds.observe(totals[0], method=method.__name__)
+            stack.pop()
+
+    return wrapper
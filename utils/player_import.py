@@ -0,0 +1,108 @@
+import csv
+import re
+from os import environ
+from typing import NamedTuple
+
+# Country code put in front of national numbers (leading 0)
+DEFAULT_COUNTRY_CODE = environ.get("DEFAULT_COUNTRY_CODE", "49")
+# token_sort_ratio from which two names are reported as likely the same player
+SIMILARITY_THRESHOLD = 90
+
+SEPARATORS = re.compile(r"[,;\t]")
+# Name followed by a phone number that may contain spaces, e.g. 'Max Müller +49 171 1234567'
+PHONE_AT_END = re.compile(r"^(?P<name>.*?\D)\s*(?P<phone>\+?\d[\d\s\-/().]{5,})$")
+HEADER_NAMES = {"name", "spieler", "player"}
+
+
+class ImportRow(NamedTuple):
+    line: int
+    name: str
+    phone_number: str
+
+
+def normalize_phone_number(raw: str) -> str:
+    """Phone number in the format WhatsApp reports it (country code, digits only), or '' if invalid."""
+    raw = raw.strip()
+    digits = re.sub(r"[\s\-/().]", "", raw)
+    if digits.startswith("+"):
+        digits = digits[1:]
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif digits.startswith("0"):
+        digits = DEFAULT_COUNTRY_CODE + digits[1:]
+
+    if not digits.isdigit() or not 8 <= len(digits) <= 15:
+        return ""
+    return digits
+
+
+def parse_players(text: str) -> tuple[list[ImportRow], list[str]]:
+    """Reads one player per line as 'Name, Handynummer' (also ; or tab, i.e. CSV exports).
+
+    Returns the valid rows and an error message for every line that could not be used.
+    """
+    rows, errors = [], []
+    seen = {}
+
+    for number, line in enumerate(text.strip().splitlines(), start=1):
+        if not line.strip():
+            continue
+
+        if separator := SEPARATORS.search(line):
+            fields = next(csv.reader([line], delimiter=separator.group()))
+        elif match := PHONE_AT_END.match(line.strip()):
+            fields = [match["name"], match["phone"]]
+        else:
+            fields = [line]
+        fields = [field.strip() for field in fields if field.strip()]
+
+        if number == 1 and fields and fields[0].lower() in HEADER_NAMES:
+            continue
+        if len(fields) < 2:
+            errors.append(f"Zeile {number}: Name oder Handynummer fehlt.")
+            continue
+
+        # The phone number is the last field, the name may contain separators
+        name, phone_number = " ".join(fields[:-1]), normalize_phone_number(fields[-1])
+        if not phone_number:
+            errors.append(f"Zeile {number}: Ungültige Handynummer {fields[-1]}.")
+            continue
+        if phone_number in seen:
+            errors.append(f"Zeile {number}: Handynummer bereits in Zeile {seen[phone_number]}.")
+            continue
+
+        seen[phone_number] = number
+        rows.append(ImportRow(number, name, phone_number))
+
+    return rows, errors
+
+
+def similar_names(names: list[str], existing: list[str], threshold: float = SIMILARITY_THRESHOLD) -> dict[int, tuple[str, float]]:
+    """Finds for every new name the most similar existing name or earlier new name above the threshold.
+
+    All pairs are scored in one rapidfuzz cdist call. Returns index -> (similar name, score).
+    """
+    from rapidfuzz import fuzz, process, utils
+
+    if not names:
+        return {}
+
+    candidates = existing + names
+    scores = process.cdist(
+        names,
+        candidates,
+        scorer=fuzz.token_sort_ratio,
+        processor=utils.default_process,
+        score_cutoff=threshold,
+        dtype="uint8",
+        workers=-1,
+    )
+    # A new name is only compared with the new names before it
+    for i in range(len(names)):
+        scores[i, len(existing) + i :] = 0
+
+    matches = {}
+    for i in scores.any(axis=1).nonzero()[0]:
+        j = int(scores[i].argmax())
+        matches[int(i)] = (candidates[j], float(scores[i, j]))
+    return matches
@@ -0,0 +1,69 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request
+
+
+class RateLimiter:
+    """Token bucket rate limiter with one bucket per key.
+
+    Every key may do `rate` requests per second with bursts of up to `burst` requests.
+    Only the `max_keys` most recently used buckets are kept.
+    """
+
+    def __init__(self, rate: float, burst: float = None, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _take(self, key) -> float:
+        """Takes a token for the key and returns 0, or returns the seconds until a token is available."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+            return wait
+
+    def try_acquire(self, key) -> bool:
+        return self._take(key) == 0.0
+
+    def acquire(self, key):
+        while (wait := self._take(key)) > 0:
+            time.sleep(wait)
+
+
+def rate_limited(limiter: RateLimiter):
+    """Answers with 429 before the Flask view runs if the client exceeded the limit.
+
+    Clients are told apart by `request.remote_addr`, never by a header the client can
+    set. Behind reverse proxies the app has to be wrapped in werkzeug's ProxyFix with
+    the number of trusted proxies, then remote_addr is the address the proxies saw.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            client = request.remote_addr
+            if not limiter.try_acquire(client):
+                logging.warning("Rate limit für %s auf %s überschritten.", client, request.path)
+                return "Too Many Requests", 429, {"Retry-After": str(max(1, round(1 / limiter.rate)))}
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
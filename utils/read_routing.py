@@ -0,0 +1,49 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Phone number of the user whose message is being handled, None for jobs and scripts
+current_user: ContextVar[str] = ContextVar("current_user", default=None)
+
+
+@contextmanager
+def acting_user(phone_number: str):
+    """Marks the reads and writes inside the block as done on behalf of the user."""
+    token = current_user.set(phone_number)
+    try:
+        yield
+    finally:
+        current_user.reset(token)
+
+
+class ReadYourWrites:
+    """Remembers when each user last committed a write.
+
+    A replica may lag behind the primary, so for `window` seconds after a write the
+    reads of the same user are sent to the primary. Writes outside of a user context
+    are tracked under None, so jobs and scripts read their own writes as well.
+    """
+
+    def __init__(self, window: float = 10.0, clock=time.monotonic, max_size: int = 10000):
+        self.window = window
+        self.clock = clock
+        self.max_size = max_size
+        self.last_writes = {}
+        self.lock = threading.Lock()
+
+    def wrote(self, user: str = None):
+        now = self.clock()
+        with self.lock:
+            self.last_writes.pop(user, None)
+            self.last_writes[user] = now
+            # Oldest writes first, entries outside of the window are no longer needed
+            while len(self.last_writes) > self.max_size or (
+                self.last_writes and now - next(iter(self.last_writes.values())) >= self.window
+            ):
+                del self.last_writes[next(iter(self.last_writes))]
+
+    def needs_primary(self, user: str = None) -> bool:
+        with self.lock:
+            written_at = self.last_writes.get(user)
+        return written_at is not None and self.clock() - written_at < self.window
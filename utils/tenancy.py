@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import environ
+from typing import NamedTuple
+
+# Club of single-club deployments and of all data from before clubs existed
+DEFAULT_CLUB = "default"
+
+
+class Tenant(NamedTuple):
+    id: str
+    name: str
+    caption: str
+    admins: frozenset
+
+
+def default_tenant() -> Tenant:
+    """The club administered by ADMIN_PHONE_NUMBER, used when no club is registered for a WhatsApp number."""
+    admin = environ.get("ADMIN_PHONE_NUMBER")
+    return Tenant(DEFAULT_CLUB, "BV-Q-Club", "BV-Q-Club Rating Tabelle", frozenset([admin] if admin else []))
+
+
+# Club whose WhatsApp number received the message being handled
+current_tenant: ContextVar[Tenant] = ContextVar("current_tenant", default=None)
+
+
+def tenant() -> Tenant:
+    return current_tenant.get() or default_tenant()
+
+
+def club_id() -> str:
+    current = current_tenant.get()
+    return current.id if current else DEFAULT_CLUB
+
+
+def is_admin(phone_number: str) -> bool:
+    return phone_number in tenant().admins
+
+
+@contextmanager
+def club_context(club: Tenant):
+    """Every query and insert of a RatingSystem inside the block only sees the club."""
+    token = current_tenant.set(club)
+    try:
+        yield
+    finally:
+        current_tenant.reset(token)
@@ -0,0 +1,177 @@
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class UserStateStore(ABC):
+    """Stores the conversation state (see `utils.enums.UserState`) of every phone number.
+
+    States expire after `ttl` seconds without a change, at most `max_size` conversations
+    are kept. All operations are atomic.
+    """
+
+    def __init__(self, ttl: float = 60 * 60, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+
+    @abstractmethod
+    def get(self, phone_number: str) -> str | None:
+        pass
+
+    @abstractmethod
+    def set(self, phone_number: str, state: str):
+        pass
+
+    @abstractmethod
+    def pop(self, phone_number: str) -> str | None:
+        """Removes the state of the phone number and returns it."""
+
+    @abstractmethod
+    def transition(self, phone_number: str, expected: str | None, state: str | None) -> bool:
+        """Changes the state to `state` if it currently is `expected`, None meaning no state."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+
+class InMemoryUserStateStore(UserStateStore):
+    """User states of a single server process."""
+
+    def __init__(self, ttl: float = 60 * 60, max_size: int = 10000):
+        super().__init__(ttl, max_size)
+        self.states = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _current(self, phone_number: str, now: float) -> str | None:
+        entry = self.states.get(phone_number)
+        if entry is None:
+            return None
+        state, expires_at = entry
+        if expires_at <= now:
+            del self.states[phone_number]
+            return None
+        return state
+
+    def _store(self, phone_number: str, state: str | None, now: float):
+        self.states.pop(phone_number, None)
+        if state is None:
+            return
+        self.states[phone_number] = (state, now + self.ttl)
+
+        # Evict expired and, if still too many, least recently changed conversations
+        while self.states:
+            oldest, (_, expires_at) = next(iter(self.states.items()))
+            if expires_at > now and len(self.states) <= self.max_size:
+                break
+            del self.states[oldest]
+
+    def get(self, phone_number: str) -> str | None:
+        with self.lock:
+            return self._current(phone_number, time.time())
+
+    def set(self, phone_number: str, state: str):
+        with self.lock:
+            self._store(phone_number, state, time.time())
+
+    def pop(self, phone_number: str) -> str | None:
+        with self.lock:
+            state = self._current(phone_number, time.time())
+            self.states.pop(phone_number, None)
+            return state
+
+    def transition(self, phone_number: str, expected: str | None, state: str | None) -> bool:
+        with self.lock:
+            now = time.time()
+            if self._current(phone_number, now) != expected:
+                return False
+            self._store(phone_number, state, now)
+            return True
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.states)
+
+
+class SQLiteUserStateStore(UserStateStore):
+    """User states in a SQLite file, shared by all server processes using the same file."""
+
+    def __init__(self, path: str, ttl: float = 60 * 60, max_size: int = 10000):
+        super().__init__(ttl, max_size)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS user_states (phone_number TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS user_states_expires_at ON user_states (expires_at)")
+
+    def _atomic(self, operation):
+        with self.lock:
+            # BEGIN IMMEDIATE takes the write lock, so no other process can interleave
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                result = operation(time.time())
+                self.db.execute("COMMIT")
+                return result
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def _current(self, phone_number: str, now: float) -> str | None:
+        row = self.db.execute(
+            "SELECT state FROM user_states WHERE phone_number = ? AND expires_at > ?", (phone_number, now)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _store(self, phone_number: str, state: str | None, now: float):
+        if state is None:
+            self.db.execute("DELETE FROM user_states WHERE phone_number = ?", (phone_number,))
+            return
+        self.db.execute(
+            "INSERT INTO user_states (phone_number, state, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (phone_number) DO UPDATE SET state = excluded.state, expires_at = excluded.expires_at",
+            (phone_number, state, now + self.ttl),
+        )
+        self.db.execute("DELETE FROM user_states WHERE expires_at <= ?", (now,))
+        self.db.execute(
+            "DELETE FROM user_states WHERE phone_number IN "
+            "(SELECT phone_number FROM user_states ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        )
+
+    def get(self, phone_number: str) -> str | None:
+        with self.lock:
+            return self._current(phone_number, time.time())
+
+    def set(self, phone_number: str, state: str):
+        self._atomic(lambda now: self._store(phone_number, state, now))
+
+    def pop(self, phone_number: str) -> str | None:
+        def operation(now):
+            state = self._current(phone_number, now)
+            self._store(phone_number, None, now)
+            return state
+
+        return self._atomic(operation)
+
+    def transition(self, phone_number: str, expected: str | None, state: str | None) -> bool:
+        def operation(now):
+            if self._current(phone_number, now) != expected:
+                return False
+            self._store(phone_number, state, now)
+            return True
+
+        return self._atomic(operation)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT count(*) FROM user_states WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+
+
+def create_user_state_store(path: str = None, ttl: float = 60 * 60, max_size: int = 10000) -> UserStateStore:
+    if path:
+        return SQLiteUserStateStore(path, ttl=ttl, max_size=max_size)
+    return InMemoryUserStateStore(ttl=ttl, max_size=max_size)